@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+from statistics import NormalDist
+
+import numpy as np
+
+from engine import DEFAULT_BLOCK_SIZE, simulate_ensemble
+from profiling import NULL_PROFILER
+
+DEFAULT_RUIN_WIDTH = 0.02
+DEFAULT_MEDIAN_WIDTH = 0.2
+DEFAULT_LOG_GROWTH_WIDTH = 0.2
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_PATHS = 100
+DEFAULT_MAX_PATHS = 100000
+# A batch never grows the ensemble by more than this factor, since the first estimates are noisy
+MAX_GROWTH = 4
+
+
+@dataclass
+class Estimate:
+    """
+    A metric of the ensemble and its confidence interval.
+    """
+    value: float
+    lower: float
+    upper: float
+
+    @property
+    def width(self):
+        if self.lower == self.upper:
+            return 0.0
+        return float(self.upper - self.lower)
+
+
+@dataclass
+class AdaptiveResult:
+    """
+    Outcome of `simulate_adaptive`. `estimates` maps "ruin_probability", "median_final_bankroll" and
+    "log_growth" to their `Estimate`; the arrays have one entry per simulated path.
+    """
+    number_of_paths: int
+    batches: int
+    converged: bool
+    estimates: dict
+    final_bankroll: np.ndarray
+    max_drawdown: np.ndarray
+    ruined: np.ndarray
+
+    @property
+    def ruin_probability(self):
+        return self.estimates["ruin_probability"].value
+
+    @property
+    def median_final_bankroll(self):
+        return self.estimates["median_final_bankroll"].value
+
+
+def z_score(confidence):
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def ruin_interval(ruined, confidence=DEFAULT_CONFIDENCE):
+    """
+    Wilson score interval of the probability of ruin, which stays meaningful when no path (or every
+    path) was ruined.
+    """
+    n = len(ruined)
+    p = float(np.count_nonzero(ruined)) / n
+    z = z_score(confidence)
+    centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half_width = z / (1 + z * z / n) * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return Estimate(p, max(0.0, centre - half_width), min(1.0, centre + half_width))
+
+
+def median_interval(values, confidence=DEFAULT_CONFIDENCE):
+    """
+    Distribution-free interval of the median: the order statistics whose ranks are the binomial
+    confidence bounds of n / 2. It makes no assumption about the (very skewed) final bankrolls.
+    """
+    n = len(values)
+    ordered = np.sort(values)
+    spread = z_score(confidence) * np.sqrt(n) / 2
+    lower = int(max(0, np.floor(n / 2 - spread) - 1))
+    upper = int(min(n - 1, np.ceil(n / 2 + spread)))
+    return Estimate(float(np.median(ordered)), float(ordered[lower]), float(ordered[upper]))
+
+
+def log_growth_interval(final_bankroll, bankroll, confidence=DEFAULT_CONFIDENCE):
+    """
+    Normal interval of the expected log growth of the bankroll over the whole run, log(final / initial).
+    A ruined path has a log growth of minus infinity, so once a ruin is observed the expected log
+    growth is known to be minus infinity.
+    """
+    if np.any(final_bankroll <= 0):
+        return Estimate(-np.inf, -np.inf, -np.inf)
+    log_growth = np.log(final_bankroll / bankroll)
+    mean = float(log_growth.mean())
+    half_width = z_score(confidence) * float(log_growth.std(ddof=1)) / np.sqrt(len(log_growth))
+    return Estimate(mean, mean - half_width, mean + half_width)
+
+
+def interval_ratios(estimates, ruin_width, median_width, log_growth_width):
+    """
+    Return how many times wider than its target every interval is. The width of the median is
+    relative to the median; a target of None is not checked.
+    """
+    ratios = []
+    if ruin_width is not None:
+        ratios.append(estimates["ruin_probability"].width / ruin_width)
+    if median_width is not None:
+        median = estimates["median_final_bankroll"]
+        width = median.width / abs(median.value) if median.width else 0.0
+        ratios.append(width / median_width)
+    if log_growth_width is not None:
+        ratios.append(estimates["log_growth"].width / log_growth_width)
+    return ratios
+
+
+def simulate_adaptive(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                      seed=None, ruin_width=DEFAULT_RUIN_WIDTH, median_width=DEFAULT_MEDIAN_WIDTH,
+                      log_growth_width=DEFAULT_LOG_GROWTH_WIDTH, confidence=DEFAULT_CONFIDENCE,
+                      min_paths=DEFAULT_MIN_PATHS, max_paths=DEFAULT_MAX_PATHS, block_size=DEFAULT_BLOCK_SIZE,
+                      should_stop=None, staking="kelly", profiler=NULL_PROFILER, cache=None):
+    """
+    Run `simulate_ensemble` in growing batches until the confidence intervals of the probability of
+    ruin, the median final bankroll and the expected log growth are narrower than their targets.
+
+    After every batch the paths needed to reach the targets are projected from the current widths
+    (which shrink with the square root of the number of paths), and the next batch aims for them,
+    growing the ensemble at least by `min_paths` and at most `MAX_GROWTH` times. Every batch draws
+    from its own stream spawned from `seed`, so a seeded run is reproducible. Stopping on the
+    observed widths slightly lowers the true coverage of the intervals; the few, growing batches
+    keep the effect small.
+
+    :param ruin_width: Target width of the interval of the probability of ruin (e.g. 0.02 for ±1%).
+    :param median_width: Target width of the interval of the median final bankroll, relative to the median.
+    :param log_growth_width: Target width of the interval of the expected log(final / initial bankroll).
+    :param confidence: Confidence level of the intervals.
+    :param min_paths: Number of paths of the first batch.
+    :param max_paths: Number of paths after which the run stops even if the targets are not met.
+    :param should_stop: Optional callable checked before every block; when it returns True the
+                        simulation stops and None is returned.
+    :param cache: Optional `cache.ResultCache` the batches of seeded runs are looked up in.
+    :return: An `AdaptiveResult`. See `simulate_ensemble` for the other parameters.
+    """
+    if min_paths < 2 or max_paths < min_paths:
+        raise ValueError("The minimum number of paths must be at least 2 and at most the maximum.")
+    if not 0 < confidence < 1:
+        raise ValueError("The confidence level must be between 0 and 1.")
+    if any(width is not None and width <= 0 for width in (ruin_width, median_width, log_growth_width)):
+        raise ValueError("The target widths of the confidence intervals must be positive.")
+
+    if isinstance(seed, np.random.SeedSequence):
+        # Spawn from a copy, so that running the same cell twice draws the same batches
+        root = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    else:
+        root = np.random.SeedSequence(seed)
+    run = simulate_ensemble if cache is None or seed is None else cache.simulate_ensemble
+
+    final_bankroll, max_drawdown, ruined = [], [], []
+    total = 0
+    batch_paths = min_paths
+    while True:
+        batch_seed, = root.spawn(1)
+        ensemble = run(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                       batch_paths, seed=batch_seed, percentiles=(), block_size=block_size,
+                       should_stop=should_stop, staking=staking, profiler=profiler)
+        if ensemble is None:
+            return None
+        final_bankroll.append(ensemble.final_bankroll)
+        max_drawdown.append(ensemble.max_drawdown)
+        ruined.append(ensemble.ruined)
+        total += batch_paths
+
+        with profiler.stage("statistics"):
+            paths_final = np.concatenate(final_bankroll)
+            paths_ruined = np.concatenate(ruined)
+            with np.errstate(over="ignore", invalid="ignore"):
+                estimates = {
+                    "ruin_probability": ruin_interval(paths_ruined, confidence),
+                    "median_final_bankroll": median_interval(paths_final, confidence),
+                    "log_growth": log_growth_interval(paths_final, bankroll, confidence),
+                }
+            # An undefined width (e.g. of bankrolls that overflowed) never meets its target
+            ratios = np.nan_to_num(interval_ratios(estimates, ruin_width, median_width, log_growth_width), nan=np.inf)
+        converged = bool(np.all(ratios <= 1))
+        if converged or total >= max_paths:
+            break
+
+        needed = total * ratios.max() ** 2 * 1.1
+        target = min(needed, total * MAX_GROWTH)
+        batch_paths = int(min(max_paths - total, max(min_paths, np.ceil(target) - total)))
+
+    return AdaptiveResult(
+        number_of_paths=total,
+        batches=len(final_bankroll),
+        converged=converged,
+        estimates=estimates,
+        final_bankroll=paths_final,
+        max_drawdown=np.concatenate(max_drawdown),
+        ruined=paths_ruined,
+    )
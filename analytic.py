@@ -0,0 +1,779 @@
+import argparse
+import sys
+import time
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+
+from engine import STAKING_MODES, generate_odds_matrix, pick, place_bets, value_bet_matrix
+
+DEFAULT_MARKETS = 1 << 16
+DEFAULT_STEPS = 256
+DEFAULT_DRAWDOWNS = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+# Lattice points per standard deviation of the distribution they discretise
+RESOLUTION = 16
+# Standard deviations of a sum of bets on either side of its mean covered by the FFT window
+WINDOW = 12
+# Truncation and number of points of the integral of the mean overshoot (see `overshoot`)
+OVERSHOOT_LIMIT = 25.0
+OVERSHOOT_POINTS = 5000
+# Start (in standard deviations above $1) and number of bets of the walk of `undershoot`
+UNDERSHOOT_START = 4.0
+UNDERSHOOT_BETS = 300
+# Maximum number of grid rows of the peaks of a drawdown level beyond $1 (see `drawdown_probabilities`)
+PEAK_ROWS = 64
+# Maximum standard deviation of the log growth over the first super-steps of `ruin_probability`;
+# the barrier correction of longer ones overstates the ruin of the paths near $1
+RUIN_SPREAD = 0.25
+# Mass whose Lundberg bound of ever falling to $1 is below this leaves the grid of `ruin_probability`
+NEGLIGIBLE = 1e-10
+
+
+@dataclass
+class Lattice:
+    """
+    A discrete distribution on the points `(start + i) * step`, `i = 0 .. len(pmf) - 1`, of a log
+    growth that is -inf (the whole bankroll is lost) with probability `loss` and otherwise
+    distributed as `pmf`, which sums to 1. `mean` and `std` are those of `pmf`.
+    """
+    step: float
+    start: int
+    pmf: np.ndarray
+    loss: float = 0.0
+
+    @property
+    def values(self):
+        return (self.start + np.arange(len(self.pmf))) * self.step
+
+    def mean(self):
+        return float(self.pmf @ self.values)
+
+    def std(self):
+        return float(np.sqrt(max(0.0, self.pmf @ self.values ** 2 - self.mean() ** 2)))
+
+    def quantile(self, q):
+        if q <= self.loss:
+            return -np.inf
+        return float(np.interp((q - self.loss) / (1 - self.loss), np.cumsum(self.pmf), self.values))
+
+
+def to_lattice(values, weights, step):
+    """
+    Discretise weighted atoms onto a lattice, splitting every atom between its two neighbouring
+    points so that the mean is kept exactly. The variance grows by at most `step ** 2 / 4`.
+    """
+    position = np.asarray(values, dtype=float) / step
+    lower = np.floor(position)
+    upper_share = position - lower
+    start = int(lower.min())
+    index = (lower - start).astype(np.int64)
+    size = int(index.max()) + 2
+
+    pmf = np.bincount(index, weights * (1 - upper_share), minlength=size)
+    pmf += np.bincount(index + 1, weights * upper_share, minlength=size)
+    return Lattice(step, start, pmf / pmf.sum())
+
+
+def power(lattice, n):
+    """
+    Distribution of the sum of `n` independent draws from `lattice`, from the `n`-th power of its
+    discrete Fourier transform. The transform only covers `WINDOW` standard deviations of the sum
+    on either side of its mean, and the sum is read back modulo the window around the mean, so
+    the cost does not grow with the support of the sum (only with `sqrt(n)`). The sum is -inf when
+    any of the draws is.
+    """
+    if n == 0:
+        return Lattice(lattice.step, 0, np.ones(1))
+    spread = np.sqrt(n) * lattice.std() / lattice.step
+    support = n * (len(lattice.pmf) - 1) + 1
+    size = 1 << int(np.ceil(np.log2(max(len(lattice.pmf), min(support, 2 * WINDOW * spread + 1)))))
+
+    wrapped = np.zeros(size)
+    np.add.at(wrapped, (lattice.start + np.arange(len(lattice.pmf))) % size, lattice.pmf)
+    total = np.fft.irfft(np.fft.rfft(wrapped) ** n, size)
+
+    if support <= size:
+        first = n * lattice.start
+    else:
+        first = int(round(n * lattice.mean() / lattice.step)) - size // 2
+    pmf = np.maximum(total[(first + np.arange(size)) % size], 0.0)
+    return Lattice(lattice.step, first, pmf / pmf.sum(), 1 - (1 - lattice.loss) ** n)
+
+
+def quasi_uniforms(dimensions, count):
+    """
+    The first `count` points of the R_d low-discrepancy sequence of Roberts (2018), of shape
+    (dimensions, count). Integrals over the unit cube converge much faster than with random points.
+    """
+    phi = 2.0
+    for _ in range(100):
+        phi = (1 + phi) ** (1 / (dimensions + 1))
+    alpha = phi ** -np.arange(1, dimensions + 1)
+    return (0.5 + np.outer(alpha, np.arange(1, count + 1))) % 1
+
+
+def market_outcomes(number_of_variants, kelly_fraction, inflated_probability, staking="kelly",
+                    markets=DEFAULT_MARKETS):
+    """
+    Every outcome of one market of `engine.simulate_blocks` with its probability.
+
+    The odds of a market are a function of `number_of_variants` uniform numbers; the expectation
+    over them is a quasi-Monte Carlo integral over `markets` points. For every point, the inflated
+    variant and the winner are summed over exactly, with their true probabilities, so no outcome
+    is sampled. A market without a value bet multiplies the bankroll by 1.
+
+    :param markets: Number of integration points of the odds.
+    :return: A tuple (growth, all_in_growth, weights) of the bankroll multiplier of every outcome
+             for the regular stake and for a stake of the whole bankroll (see `engine.Bets`), and
+             the probabilities of the outcomes.
+    """
+    if staking not in STAKING_MODES:
+        raise ValueError(f"Unknown staking mode: {staking}")
+    uniforms = quasi_uniforms(number_of_variants, markets)
+    odds = generate_odds_matrix(None, markets, number_of_variants, uniforms)
+
+    growth, all_in_growth, weights = [], [], []
+    for column in range(number_of_variants):
+        probabilities = value_bet_matrix(None, odds, inflated_probability, np.full(markets, column))
+        # Winners are drawn with the normalised probabilities (see `sampler.determine_winners`)
+        chances = probabilities / probabilities.sum(axis=1)[:, None]
+        if staking == "kelly":
+            choice = place_bets(odds, probabilities, np.zeros(markets, dtype=int), kelly_fraction).choice
+            won = place_bets(odds, probabilities, choice, kelly_fraction)
+            lost = place_bets(odds, probabilities, (choice + 1) % number_of_variants, kelly_fraction)
+            chance = pick(chances, choice)
+            growth += [won.growth, lost.growth]
+            all_in_growth += [won.all_in_growth, lost.all_in_growth]
+            weights += [chance, 1 - chance]
+        else:
+            for winner in range(number_of_variants):
+                bets = place_bets(odds, probabilities, np.full(markets, winner), kelly_fraction, staking)
+                growth.append(bets.growth)
+                all_in_growth.append(bets.all_in_growth)
+                weights.append(chances[:, winner])
+
+    weights = np.concatenate(weights)
+    return np.concatenate(growth), np.concatenate(all_in_growth), weights / weights.sum()
+
+
+def growth_distribution(growth, weights):
+    """
+    Distribution of the log of the bankroll multipliers `growth` of probabilities `weights`. A
+    multiplier of at most 0 (a stake of the whole bankroll or more, lost) ruins the bankroll at
+    once and goes to the `loss` of the lattice.
+
+    :return: A `Lattice` with `RESOLUTION` points per standard deviation of the other outcomes.
+    """
+    survived = growth > 0
+    loss = float(weights[~survived].sum())
+    if not survived.any():
+        return Lattice(1.0, 0, np.ones(1), 1.0)
+    log_growth = np.log(growth[survived])
+    kept = weights[survived] / weights[survived].sum()
+    mean = kept @ log_growth
+    std = np.sqrt(max(kept @ (log_growth - mean) ** 2, 1e-30))
+    return replace(to_lattice(log_growth, kept, std / RESOLUTION), loss=loss)
+
+
+def bet_distribution(number_of_variants, kelly_fraction, inflated_probability, staking="kelly",
+                     markets=DEFAULT_MARKETS):
+    """
+    Distribution of the log growth of the bankroll over one market of `engine.simulate_blocks`,
+    from the outcomes of `market_outcomes`. A market without a value bet has a log growth of 0.
+
+    :return: A `Lattice` with `RESOLUTION` points per standard deviation.
+    """
+    growth, _, weights = market_outcomes(number_of_variants, kelly_fraction, inflated_probability, staking, markets)
+    return growth_distribution(growth, weights)
+
+
+@dataclass
+class AllIn:
+    """
+    The bet of a bankroll of at most $1, which stakes all of it: the bankroll is lost with
+    probability `loss` and otherwise grows by the log growth distributed as `win` (`win.pmf` sums
+    to 1; markets without a value bet have a log growth of 0).
+    """
+    loss: float
+    win: Lattice
+
+
+def all_in_distribution(all_in_growth, weights, step):
+    """
+    The `AllIn` bet of the outcomes of `market_outcomes`, on a lattice of `step`.
+    """
+    survived = all_in_growth > 0
+    loss = float(weights[~survived].sum())
+    if not survived.any():
+        return AllIn(1.0, Lattice(step, 0, np.ones(1)))
+    return AllIn(loss, to_lattice(np.log(all_in_growth[survived]), weights[survived], step))
+
+
+def step_kernel(bet, bets, step):
+    """
+    Distribution of the log growth over `bets` consecutive markets on a lattice of `step`.
+    """
+    total = power(bet, bets)
+    if step == bet.step:
+        return total
+    return replace(to_lattice(total.values, total.pmf, step), loss=total.loss)
+
+
+def super_steps(bet, number_of_bets, steps):
+    """
+    Split `number_of_bets` into at most `steps` super-steps of `bets` markets each plus a shorter
+    last one, and choose the lattice step of their kernels.
+
+    :return: A tuple (bets per super-step, number of full super-steps, bets of the last one, step).
+    """
+    bets = int(np.ceil(number_of_bets / steps))
+    step = max(bet.step, bet.std() * np.sqrt(bets) / RESOLUTION)
+    return bets, number_of_bets // bets, number_of_bets % bets, step
+
+
+def convolve_steps(state, kernels, absorb):
+    """
+    Advance the rows of `state` by the super-step kernels with FFT convolutions.
+
+    :param state: Mass on the grid of every row, shape (rows, G).
+    :param kernels: List of (kernel `Lattice`, count) pairs applied in order.
+    :param absorb: Callable `absorb(moved, cells, lost)` that removes the mass that left the grid,
+                   given the convolved rows, the grid cell of every column and the mass of every
+                   row that lost the whole bankroll (see `Lattice.loss`); returns the new state.
+    :return: The final state.
+    """
+    size = state.shape[1]
+    for kernel, count in kernels:
+        length = size + len(kernel.pmf) - 1
+        transform_size = 1 << int(np.ceil(np.log2(length)))
+        kernel_transform = np.fft.rfft((1 - kernel.loss) * kernel.pmf, transform_size)
+        cells = kernel.start + np.arange(length)
+        for _ in range(count):
+            moved = np.fft.irfft(np.fft.rfft(state, transform_size, axis=1) * kernel_transform, transform_size,
+                                 axis=1)[:, :length]
+            state = absorb(np.maximum(moved, 0.0), cells, kernel.loss * state.sum(axis=1))
+            if state.sum() < 1e-15:
+                return state
+    return state
+
+
+def overshoot(bet, bets):
+    """
+    Mean overshoot constant `rho` of Siegmund (1979) of the sum of `bets` bets: a walk with these
+    steps that starts far from a barrier crosses it about as often as a continuous one would cross
+    a barrier `rho` further away. From the characteristic function `phi` of the centred sum, of
+    standard deviation `s`, `rho = -1 / pi * integral of log|2 (1 - phi(l)) / (s l) ** 2| / l ** 2`
+    over `l > 0`.
+    """
+    spread = bet.std() * np.sqrt(bets)
+    t = np.linspace(0.0, OVERSHOOT_LIMIT, OVERSHOOT_POINTS + 1)
+    phi = np.exp(1j * np.outer(t[1:] / spread, bet.values - bet.mean())) @ bet.pmf
+    integrand = np.log(np.abs(2 * (1 - phi ** bets)) / t[1:] ** 2) / t[1:] ** 2
+    # The integrand has a finite limit at 0, and beyond the truncation phi ** bets is negligible
+    integral = np.trapezoid(np.concatenate(([integrand[0]], integrand)), t)
+    tail = (np.log(2) - 2 * np.log(OVERSHOOT_LIMIT) - 2) / OVERSHOOT_LIMIT
+    return float(-spread / np.pi * (integral + tail))
+
+
+def barrier_offset(bet, bets):
+    """
+    How much closer a barrier checked only after every `bets` bets has to be moved to be crossed
+    as often as one checked after every bet: the difference of the `overshoot` of `bets` bets and
+    of one bet. For normal bets it is the continuity correction `0.5826 * std * (sqrt(bets) - 1)`
+    of Broadie, Glasserman and Kou (1997).
+    """
+    if bets <= 1:
+        return 0.0
+    return overshoot(bet, bets) - overshoot(bet, 1)
+
+
+def undershoot(bet):
+    """
+    Distribution of the log bankroll relative to $1 right after the bet that first brings it to
+    $1 or below, from a walk that starts `UNDERSHOOT_START` standard deviations above $1 and is
+    followed for `UNDERSHOOT_BETS` bets, long enough to forget where it started.
+
+    :return: A `Lattice` of values of at most 0 on the step of `bet`.
+    """
+    first = max(1, int(round(UNDERSHOOT_START * bet.std() / bet.step)))
+    size = 2 * first + len(bet.pmf)
+    state = np.zeros(size)
+    state[first] = 1.0
+    # Index k is a log bankroll of -k * step
+    below = np.zeros(max(0, -bet.start) + 1)
+    for _ in range(UNDERSHOOT_BETS):
+        moved = np.convolve(state, bet.pmf)
+        cells = bet.start + np.arange(len(moved))
+        crossed = cells <= 0
+        np.add.at(below, -cells[crossed], moved[crossed])
+        kept = ~crossed & (cells < size)
+        state = np.zeros(size)
+        state[cells[kept]] = moved[kept]
+    if below.sum() == 0:
+        below[0] = 1.0
+    return Lattice(bet.step, 1 - len(below), below[::-1] / below.sum())
+
+
+def all_in_episodes(start, all_in, tolerance=1e-14, max_bets=10000):
+    """
+    Follow the bets of a bankroll of at most $1, which stake all of it (see `AllIn`), from every
+    point of `start` until the bankroll is lost or above $1 again. Bankrolls still at most $1
+    after `max_bets` bets count as lost.
+
+    :param start: A `Lattice` of log bankrolls relative to $1 of at most 0, on the step of `all_in.win`.
+    :return: A tuple (lost, landing) of the probability of losing the bankroll from every point of
+             `start`, and of the probabilities of getting back above $1 at a log bankroll of
+             `(k + 1) * step`, in column k of the row of every point.
+    """
+    win = all_in.win
+    kernel = (1 - all_in.loss) * win.pmf
+    state = np.eye(len(start.pmf))
+    first = start.start
+    lost = np.zeros(len(start.pmf))
+    landing = np.zeros((len(start.pmf), max(1, win.start + len(win.pmf) - 1)))
+
+    for _ in range(max_bets):
+        if state.sum() < tolerance:
+            break
+        lost += all_in.loss * state.sum(axis=1)
+        length = state.shape[1] + len(kernel) - 1
+        transform_size = 1 << int(np.ceil(np.log2(length)))
+        moved = np.fft.irfft(np.fft.rfft(state, transform_size, axis=1) * np.fft.rfft(kernel, transform_size),
+                             transform_size, axis=1)[:, :length]
+        moved = np.maximum(moved, 0.0)
+        cells = first + win.start + np.arange(length)
+        above = cells > 0
+        landing[:, cells[above] - 1] += moved[:, above]
+        # The cells are increasing: keep those of at most $1, without the negligible deepest ones
+        state = moved[:, ~above]
+        skip = int(np.searchsorted(np.cumsum(state.sum(axis=0)), tolerance * 1e-4))
+        state = state[:, skip:]
+        first = int(cells[0]) + skip
+    return lost + state.sum(axis=1), landing
+
+
+def ruin_probability(bet, number_of_bets, log_distance, steps=DEFAULT_STEPS, all_in=None):
+    """
+    Probability that the bankroll, `log_distance` above $1 in log, is lost within `number_of_bets`
+    markets, from a dynamic programme over super-steps on a log-wealth grid.
+
+    Without `all_in`, the bankroll counts as lost once it falls to $1. With it, a bankroll of at
+    most $1 stakes all of it, as in the simulation: the mass that falls to $1 is lost with the
+    probability of `all_in_episodes` from its `undershoot`, and otherwise put back on the grid
+    where it gets above $1 again (the few all-in bets do not count towards the horizon).
+
+    With one market per super-step the barrier is checked after every bet, as in the simulation.
+    A barrier checked every m bets is crossed less often, by about as much as moving it closer by
+    `barrier_offset`. The correction only holds for super-steps that move the bankroll little
+    compared to its distance from the barrier, so the first `steps` super-steps have a log growth
+    of at most `RUIN_SPREAD` standard deviation (and cover at most `number_of_bets / steps`
+    bets), and every following `steps` super-steps are twice as long, on a coarser grid, as the
+    mass that is still near $1 thins out. Mass far enough above the barrier that it cannot come
+    back within the horizon, or whose Lundberg bound (see `adjustment_coefficient`) of ever coming
+    back is negligible, leaves the grid, and the programme stops once the bound of all the mass
+    left is negligible.
+    """
+    if log_distance <= 0 and all_in is None:
+        return 1.0
+    if number_of_bets == 0:
+        return 0.0
+    std, mean = bet.std(), bet.mean()
+    coefficient = adjustment_coefficient(bet)
+    top = log_distance + WINDOW * std * np.sqrt(number_of_bets) + max(0.0, -mean * number_of_bets)
+    if coefficient > 0:
+        top = max(min(top, -np.log(NEGLIGIBLE) / coefficient), log_distance)
+
+    bets = max(1, min(int(np.ceil(number_of_bets / steps)), int((RUIN_SPREAD / std) ** 2)))
+    # Cell i of every grid is the log distance base + i * step above $1, base being the barrier
+    # of the first super-steps
+    base = barrier_offset(bet, bets)
+    if all_in is not None:
+        start = undershoot(bet)
+        lost_from, landing_from = all_in_episodes(start, all_in)
+        landing = start.pmf @ landing_from
+        survived = 1 - start.pmf @ lost_from
+        heights = bet.step * np.arange(1, len(landing) + 1)
+
+    ruined = [0.0]
+    state, step, done = None, None, 0
+    while done < number_of_bets:
+        count = min(steps, (number_of_bets - done) // bets)
+        if count == 0:
+            bets, count = number_of_bets - done, 1
+        previous, step = step, max(bet.step, std * np.sqrt(bets) / RESOLUTION)
+        size = int(np.ceil((top - base) / step)) + 2
+        # Cells up to `limit` are past the barrier of super-steps of `bets` bets
+        limit = (barrier_offset(bet, bets) - base) / step
+
+        # The mass reaching the barrier is lost with probability `lost` and put back at
+        # `back_cells` with probabilities `back` otherwise
+        lost, back_cells, back = 1.0, np.zeros(0, dtype=int), np.zeros(0)
+        if all_in is not None and landing.sum() > 0:
+            lattice = to_lattice(heights - base, landing, step)
+            cells = lattice.start + np.arange(len(lattice.pmf))
+            # Landing at or below the barrier crosses it again at once
+            again = survived * lattice.pmf[cells <= limit].sum()
+            lost = (1 - survived) / (1 - again)
+            back_cells = cells[cells > limit]
+            back = survived * lattice.pmf[cells > limit] / (1 - again)
+            size = max(size, int(back_cells.max(initial=0)) + 1)
+
+        def reinject(new_state, hit, lost=lost, back_cells=back_cells, back=back):
+            ruined[0] += hit * lost
+            new_state[0, back_cells] += hit * back
+
+        if state is None:
+            position = np.array([(log_distance - base) / step])
+            mass = np.ones(1)
+        else:
+            position = np.arange(state.shape[1]) * previous / step
+            mass = state[0]
+        lower = np.floor(position).astype(int)
+        share = position - lower
+        spread = np.bincount(np.minimum(lower, size), mass * (1 - share), minlength=size + 2)
+        spread += np.bincount(np.minimum(lower + 1, size + 1), mass * share, minlength=size + 2)
+        state = spread[None, :size].copy()
+        crossed = np.arange(size) <= limit
+        hit = state[0, crossed].sum()
+        state[0, crossed] = 0.0
+        if hit > 0:
+            reinject(state, hit)
+
+        # Upper bound of the probability of ever falling to $1 from every cell
+        bound = np.exp(-coefficient * (base + step * np.arange(size)))
+
+        def absorb(moved, cells, lost, size=size, limit=limit, bound=bound, reinject=reinject):
+            ruined[0] += lost.sum()
+            new_state = np.zeros((1, size))
+            kept = (cells > limit) & (cells < size)
+            new_state[:, cells[kept]] = moved[:, kept]
+            reinject(new_state, moved[:, cells <= limit].sum())
+            if new_state[0] @ bound < NEGLIGIBLE:
+                new_state[:] = 0.0
+            return new_state
+
+        state = convolve_steps(state, [(step_kernel(bet, bets, step), count)], absorb)
+        if not state.any():
+            break
+        done += count * bets
+        bets *= 2
+    return min(1.0, ruined[0])
+
+
+def drawdown_probabilities(bet, number_of_bets, drawdowns=DEFAULT_DRAWDOWNS, steps=DEFAULT_STEPS,
+                           log_distance=None, all_in=None):
+    """
+    Probability that the maximum drawdown of the bankroll within `number_of_bets` markets reaches
+    each of `drawdowns` (fractions of the running peak).
+
+    The log drawdown `D` below the running peak is a random walk reflected at 0 (`D' = max(0, D - X)`),
+    advanced on a grid that absorbs the mass reaching the level. Longer super-steps miss part of
+    every peak and trough, so the levels are moved closer by twice `barrier_offset`; a level
+    between two grid points absorbs part of the mass of the point below it.
+
+    With `log_distance`, the bankroll starts that far above $1 in log and falls to $1 at a log
+    drawdown of `log_distance` plus the rise of the peak. A level beyond it is advanced with a
+    grid row for every peak (at most `PEAK_ROWS` of them) until the peak is high enough. There,
+    the mass reaching $1 counts as reaching the level when its `undershoot` goes past the level or
+    the bankroll is lost (a drawdown of 100%), and is otherwise put back where the all-in bets get
+    it above $1 again, as in `ruin_probability`.
+
+    :return: A dictionary from every drawdown fraction to its probability.
+    """
+    if number_of_bets == 0:
+        return {drawdown: 0.0 for drawdown in drawdowns}
+    bets, count, rest, step = super_steps(bet, number_of_bets, steps)
+    offset = barrier_offset(bet, bets)
+
+    def reflected(lattice):
+        return Lattice(lattice.step, -(lattice.start + len(lattice.pmf) - 1), lattice.pmf[::-1].copy(), lattice.loss)
+
+    # Below the peak: cells are log drawdowns, so the kernel is the one of -X. The grid measures
+    # them from the checked peak, `offset` below the true one, but the start is a true peak: the
+    # walk starts as if its peak were `offset` lower
+    kernel = reflected(step_kernel(bet, bets, step))
+    kernels = [(replace(to_lattice(kernel.values - offset, kernel.pmf, step), loss=kernel.loss), 1),
+               (kernel, count - 1), (reflected(step_kernel(bet, rest, step)), int(rest > 0))]
+
+    if log_distance is not None:
+        start = undershoot(bet)
+        if all_in is None:
+            lost_from, landing_from = np.ones(len(start.pmf)), np.zeros((len(start.pmf), 1))
+        else:
+            lost_from, landing_from = all_in_episodes(start, all_in)
+        # The landings above $1 as log drawdowns from a peak of the start, on the grid: cell
+        # `first + j` in column j
+        position = (log_distance - offset - bet.step * np.arange(1, landing_from.shape[1] + 1)) / step
+        lower = np.floor(position).astype(int)
+        first = int(lower.min())
+        split = np.zeros((len(position), int(lower.max()) - first + 2))
+        split[np.arange(len(position)), lower - first] = 1 - (position - lower)
+        split[np.arange(len(position)), lower - first + 1] = position - lower
+        landing_cells = landing_from @ split
+
+    probabilities = {}
+    for drawdown in drawdowns:
+        level = -np.log1p(-drawdown)
+        limit = (level - 2 * offset) / step
+        if limit <= 0:
+            probabilities[drawdown] = 1.0
+            continue
+        size = int(limit) + 1
+        # Rows of the peaks at which $1 comes before the level, `spacing` cells apart; the last
+        # one takes the higher peaks
+        bottom = np.inf if log_distance is None else (log_distance - 2 * offset) / step
+        rows, spacing = 1, 1
+        if bottom <= limit:
+            spacing = max(1, int(np.ceil((limit - bottom) / PEAK_ROWS)))
+            rows = int((limit - bottom) / spacing) + 2
+        edges = np.append(bottom + spacing * np.arange(rows - 1), limit)
+        # Share of every cell past the level, or past $1 in the rows of the lower peaks
+        beyond = np.clip(np.arange(size)[None, :] - edges[:, None] + 1, 0, 1)
+
+        def raise_peaks(row, rise, rows=rows, spacing=spacing):
+            # The two rows around the peak `rise` cells above the one of `row`, and the share of the upper one
+            position = row + rise / spacing
+            lower = np.floor(position).astype(int)
+            return np.minimum(lower, rows - 1), np.minimum(lower + 1, rows - 1), position - lower
+
+        if rows > 1:
+            # The log distance of the level below $1 at the peak of every row
+            depth = level - log_distance - step * spacing * np.arange(rows - 1)
+            shallow = start.pmf * (-start.values[None, :] < depth[:, None])
+            reached_hit = 1 - shallow @ (1 - lost_from)
+            peak = np.arange(rows - 1)[:, None]
+            cell = spacing * peak + first + np.arange(landing_cells.shape[1])
+            mass = shallow @ landing_cells
+            # Landing above the peak raises it
+            lower, upper, share = raise_peaks(peak, np.maximum(-cell, 0))
+            cell = np.maximum(cell, 0)
+            # Landing at or past $1 again reaches it again at once
+            kept = [weight * (1 - np.where(cell < size, beyond[row, np.minimum(cell, size - 1)], 1.0))
+                    for row, weight in ((lower, 1 - share), (upper, share))]
+            total = reached_hit + (mass * (kept[0] + kept[1])).sum(axis=1)
+            total[total <= 0] = 1.0
+            reached_hit /= total
+            cell = np.minimum(cell, size - 1)
+            target = np.concatenate([(lower * size + cell).ravel(), (upper * size + cell).ravel()])
+            source = np.tile(np.broadcast_to(peak, mass.shape).ravel(), 2)
+            mass = np.concatenate([(mass * weight / total[:, None]).ravel() for weight in kept])
+
+        state = np.zeros((rows, size))
+        state[0, 0] = 1.0
+        reached = [0.0]
+
+        def absorb(moved, cells, lost):
+            # Losing the whole bankroll is a drawdown of 100%
+            reached[0] += lost.sum()
+            new_state = np.zeros_like(state)
+            up = moved[:, cells <= 0][:, ::-1]
+            # Column j of `up` raised the peak by j cells
+            lower, upper, share = raise_peaks(np.arange(rows)[:, None], np.arange(up.shape[1]))
+            new_state[:, 0] = (np.bincount(lower.ravel(), (up * (1 - share)).ravel(), minlength=rows)
+                               + np.bincount(upper.ravel(), (up * share).ravel(), minlength=rows))
+            kept = (cells > 0) & (cells < size)
+            new_state[:, cells[kept]] = moved[:, kept]
+            absorbed = moved[:, cells >= size].sum(axis=1) + (new_state * beyond).sum(axis=1)
+            new_state *= 1 - beyond
+            reached[0] += absorbed[-1]
+            if rows > 1:
+                reached[0] += absorbed[:-1] @ reached_hit
+                new_state += np.bincount(target, absorbed[source] * mass, minlength=rows * size).reshape(rows, size)
+            return new_state
+
+        convolve_steps(state, kernels, absorb)
+        probabilities[drawdown] = float(min(1.0, reached[0]))
+    return probabilities
+
+
+def adjustment_coefficient(bet):
+    """
+    Lundberg's adjustment coefficient `R > 0` of the log growth `X` of one market, the root of
+    `E[exp(-R X)] = 1`. The probability of ever losing a fraction `1 - x` of the bankroll is at
+    most `x ** R`. Returns 0 when the growth is not positive on average or one market can lose the
+    whole bankroll.
+    """
+    values, pmf = bet.values, bet.pmf
+    if bet.mean() <= 0 or bet.loss > 0:
+        return 0.0
+
+    def excess(r):
+        exponent = -r * values
+        return np.log(pmf @ np.exp(exponent - exponent.max())) + exponent.max()
+
+    low, high = 0.0, 1.0
+    while excess(high) < 0:
+        low, high = high, high * 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        low, high = (middle, high) if excess(middle) < 0 else (low, middle)
+    return high
+
+
+@dataclass
+class AnalyticResult:
+    """
+    Outcome of `bankroll_distribution`. `log_growth` is the distribution of log(final / initial
+    bankroll) of the walk without the all-in bets below $1; it differs from the simulation only in
+    the lowest `ruin_probability` of its mass, where the simulated bankroll is 0, and in the few
+    paths that won their way back from $1.
+    """
+    bankroll: float
+    number_of_bets: int
+    log_growth: Lattice
+    ruin_probability: float
+    drawdown_probability: dict = field(default_factory=dict)
+    adjustment_coefficient: float = 0.0
+    seconds: float = 0.0
+
+    def final_bankroll_percentile(self, percentile):
+        with np.errstate(over="ignore"):
+            return float(self.bankroll * np.exp(self.log_growth.quantile(percentile / 100)))
+
+    @property
+    def median_final_bankroll(self):
+        return self.final_bankroll_percentile(50)
+
+    @property
+    def lundberg_bound(self):
+        """
+        Upper bound of the probability of ever falling to $1, over an unlimited number of bets.
+        """
+        return float(min(1.0, self.bankroll ** -self.adjustment_coefficient))
+
+
+def bankroll_distribution(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                          staking="kelly", drawdowns=DEFAULT_DRAWDOWNS, steps=DEFAULT_STEPS, markets=DEFAULT_MARKETS):
+    """
+    Compute the distribution of the final bankroll, the probability of ruin and the distribution of
+    the maximum drawdown of `engine.simulate` directly, without simulating any path.
+
+    Markets are independent, so the log bankroll after n bets is a sum of n independent copies of
+    the log growth of one market (`bet_distribution`), whose distribution is its n-th convolution
+    power (`power`). Ruin and drawdowns depend on the whole path and are computed by dynamic
+    programming over at most `steps` super-steps (`ruin_probability`, `drawdown_probabilities`).
+    A bankroll of at most $1 stakes all of it on the next value bet (`all_in_distribution`), so
+    a path is only ruined when it loses one of these bets; the others win their way back.
+
+    :param drawdowns: Drawdown fractions whose probability is computed.
+    :param steps: Number of dynamic programming steps for drawdowns, and for ruin before its
+                  steps get longer; with at least `number_of_bets` steps, barriers are checked
+                  after every bet as in the simulation.
+    :param markets: Number of integration points of `market_outcomes`.
+    :return: An `AnalyticResult`. See `engine.simulate_blocks` for the other parameters.
+    """
+    started = time.perf_counter()
+    growth, all_in_growth, weights = market_outcomes(number_of_variants, kelly_fraction, inflated_probability,
+                                                     staking, markets)
+    bet = growth_distribution(growth, weights)
+    all_in = all_in_distribution(all_in_growth, weights, bet.step)
+    log_distance = np.log(bankroll)
+    return AnalyticResult(
+        bankroll=bankroll,
+        number_of_bets=number_of_bets,
+        log_growth=power(bet, number_of_bets),
+        ruin_probability=ruin_probability(bet, number_of_bets, log_distance, steps, all_in),
+        drawdown_probability=drawdown_probabilities(bet, number_of_bets, drawdowns, steps, log_distance, all_in),
+        adjustment_coefficient=adjustment_coefficient(bet),
+        seconds=time.perf_counter() - started,
+    )
+
+
+def cross_check(result, ensemble):
+    """
+    Compare an `AnalyticResult` with a simulated `engine.EnsembleResult` of the same parameters.
+
+    :return: A list of (metric, analytic value, simulated value, standard error of the simulated
+             value) rows.
+    """
+    paths = len(ensemble.final_bankroll)
+    rows = []
+    ruin = ensemble.ruin_probability
+    rows.append(("ruin probability", result.ruin_probability, ruin, np.sqrt(max(ruin * (1 - ruin), 1 / paths) / paths)))
+
+    ordered = np.sort(ensemble.final_bankroll)
+    for percentile in (5, 50, 95):
+        q = percentile / 100
+        if q <= 2 * max(ruin, result.ruin_probability):
+            # The lowest percentiles are distorted by the ruined paths, see `AnalyticResult`
+            continue
+        # Standard error of a sample quantile from the spread of the neighbouring order statistics
+        spread = np.sqrt(q * (1 - q) / paths)
+        low, high = (int(np.clip(np.floor((q + s * spread) * paths), 0, paths - 1)) for s in (-1, 1))
+        rows.append((f"P{percentile} final bankroll", result.final_bankroll_percentile(percentile),
+                     float(np.percentile(ordered, percentile)), float(ordered[high] - ordered[low]) / 2))
+
+    for drawdown, probability in result.drawdown_probability.items():
+        simulated = float(np.mean(ensemble.max_drawdown >= drawdown))
+        error = np.sqrt(max(simulated * (1 - simulated), 1 / paths) / paths)
+        rows.append((f"P(max drawdown >= {drawdown * 100:g}%)", probability, simulated, error))
+    return rows
+
+
+def format_result(result):
+    lines = [f"Computed in {result.seconds * 1000:.1f} ms without simulating any path"]
+    for percentile in (5, 25, 50, 75, 95):
+        lines.append(f"P{percentile} final bankroll: ${result.final_bankroll_percentile(percentile):,.2f}")
+    growth = result.log_growth
+    lines.append(f"Log growth: mean {growth.mean():.6g}, standard deviation {growth.std():.6g}")
+    lines.append(f"Ruin probability: {result.ruin_probability * 100:.4f}% "
+                 f"(at most {result.lundberg_bound * 100:.4f}% over any number of bets)")
+    for drawdown, probability in result.drawdown_probability.items():
+        lines.append(f"P(max drawdown >= {drawdown * 100:g}%): {probability * 100:.2f}%")
+    return "\n".join(lines)
+
+
+def format_check(rows):
+    header = f"{'Metric':<28} {'Analytic':>14} {'Simulated':>14} {'Std. error':>12} {'z':>6}"
+    lines = [header, "-" * len(header)]
+    for metric, analytic, simulated, error in rows:
+        z = (analytic - simulated) / error if error > 0 else 0.0
+        lines.append(f"{metric:<28} {analytic:>14.6g} {simulated:>14.6g} {error:>12.3g} {z:>6.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m analytic",
+        description="Compute the distribution of the final bankroll, ruin and drawdowns without simulating."
+    )
+    parser.add_argument("--bankroll", type=float, default=1000, help="Starting bankroll.")
+    parser.add_argument("--variants", type=int, default=3, help="Number of play variants per market.")
+    parser.add_argument("--kelly", type=float, default=50, help="Percentage of Kelly to bet (10 - 100).")
+    parser.add_argument("--bets", type=int, default=1000, help="Number of bets.")
+    parser.add_argument("--inflated", type=int, default=5, help="Inflated probability of the value bet (1 - 100).")
+    parser.add_argument("--staking", choices=STAKING_MODES, default="kelly", help="Staking of every market.")
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS,
+                        help="Dynamic programming steps for ruin and drawdowns.")
+    parser.add_argument("--check", type=int, default=None, metavar="PATHS",
+                        help="Also simulate PATHS paths with engine.simulate_ensemble and compare.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the cross-check simulation.")
+    args = parser.parse_args(argv)
+
+    if args.bankroll <= 0 or args.bets < 0 or args.variants < 2:
+        parser.error("Bankroll must be positive, bets not negative and variants at least 2.")
+    if args.steps < 1:
+        parser.error("Steps must be at least 1.")
+    if not 10 <= args.kelly <= 100:
+        parser.error("Kelly percentage must be between 10 and 100.")
+    if not 1 <= args.inflated <= 100:
+        parser.error("Inflated probability must be between 1 and 100.")
+
+    result = bankroll_distribution(args.bankroll, args.variants, args.kelly / 100, args.bets, args.inflated,
+                                   args.staking, steps=args.steps)
+    print(format_result(result))
+
+    if args.check:
+        from engine import simulate_ensemble
+
+        started = time.perf_counter()
+        ensemble = simulate_ensemble(args.bankroll, args.variants, args.kelly / 100, args.bets, args.inflated,
+                                     args.check, seed=args.seed, percentiles=(), staking=args.staking)
+        print()
+        print(f"Simulated {args.check} paths in {time.perf_counter() - started:.2f} s")
+        print(format_check(cross_check(result, ensemble)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,515 @@
+import argparse
+import io
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from engine import (
+    DEFAULT_BLOCK_SIZE, STAKING_MODES, SimulationResult, generate_odds_matrix, log_stats_block, place_bets,
+    settle_block, value_bet_matrix
+)
+from profiling import NULL_PROFILER
+from sampler import determine_winners
+from stats import RunningStats
+
+# Fixed size of the header of the binary market files written by `MarketWriter`, so that the number
+# of markets can be rewritten in place while the file grows
+NPY_HEADER_SIZE = 256
+
+
+def market_dtype(number_of_variants):
+    """
+    Record type of the binary market files: the odds and model probabilities of every variant and
+    the index of the variant that actually won.
+    """
+    return np.dtype([
+        ("odds", "<f8", (number_of_variants,)),
+        ("probability", "<f8", (number_of_variants,)),
+        ("winner", "<i4"),
+    ])
+
+
+def csv_columns(number_of_variants):
+    return ([f"odds_{i}" for i in range(number_of_variants)] + [f"probability_{i}" for i in range(number_of_variants)]
+            + ["winner"])
+
+
+class MarketChunk(NamedTuple):
+    """
+    A block of consecutive recorded markets. `start` and `end` are the byte offsets of the block in
+    its file; reading can be resumed from `end`.
+    """
+    index: int
+    odds: np.ndarray
+    probabilities: np.ndarray
+    winner: np.ndarray
+    start: int
+    end: int
+
+
+class MarketWriter:
+    """
+    Write recorded markets to a CSV file (for a path ending in .csv) or to a binary `.npy` file of
+    `market_dtype` records, a block at a time.
+
+    CSV files have the header `odds_0,...,odds_{K-1},probability_0,...,probability_{K-1},winner`,
+    with the winner given as a 0-based variant index. Floats are written with 17 significant
+    digits, so reading them back gives exactly the same values. The header of a binary file is
+    updated after every block, so an interrupted export stays readable.
+
+    Usage:
+        with MarketWriter("markets.npy", 3) as writer:
+            writer.append(odds, probabilities, winner)
+    """
+
+    def __init__(self, path, number_of_variants):
+        self.path = path
+        self.number_of_variants = number_of_variants
+        self.csv = path.lower().endswith(".csv")
+        self.count = 0
+        self.file = open(path, "wb")
+        if self.csv:
+            self.file.write((",".join(csv_columns(number_of_variants)) + "\n").encode())
+        else:
+            self.dtype = market_dtype(number_of_variants)
+            self.file.write(npy_header(self.dtype, 0))
+
+    def append(self, odds, probabilities, winner):
+        odds = np.asarray(odds, dtype=float).reshape(-1, self.number_of_variants)
+        probabilities = np.asarray(probabilities, dtype=float).reshape(-1, self.number_of_variants)
+        if self.csv:
+            rows = np.column_stack((odds, probabilities, winner))
+            np.savetxt(self.file, rows, fmt=["%.17g"] * (2 * self.number_of_variants) + ["%d"], delimiter=",")
+        else:
+            records = np.empty(len(odds), dtype=self.dtype)
+            records["odds"] = odds
+            records["probability"] = probabilities
+            records["winner"] = winner
+            records.tofile(self.file)
+        self.count += len(odds)
+        if not self.csv:
+            self.file.seek(0)
+            self.file.write(npy_header(self.dtype, self.count))
+            self.file.seek(0, os.SEEK_END)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def npy_header(dtype, length):
+    """
+    Build a version 1.0 `.npy` header of exactly `NPY_HEADER_SIZE` bytes for `length` records.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), length)
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    if len(header) != NPY_HEADER_SIZE - 10:
+        raise ValueError(f"Too many variants for a {NPY_HEADER_SIZE} byte header")
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def read_markets(path, offset=0, first_market=0, block_size=DEFAULT_BLOCK_SIZE, workers=1):
+    """
+    Stream the recorded markets of a CSV or binary `.npy` file (see `MarketWriter`) in blocks of
+    `block_size` markets. Only one block (or one per worker) is held in memory at a time.
+
+    Binary files are memory-mapped and every block is a single copy out of the page cache. CSV
+    blocks are cut at line boundaries with a vectorized newline search and parsed by NumPy's C
+    parser; with `workers > 1` the blocks are parsed in that many processes, in order.
+
+    :param path: The market file.
+    :param offset: Byte offset to start reading from, e.g. the `end` of the last processed chunk.
+                   It must be the start of a line (CSV) or of a record (binary).
+    :param first_market: Index of the market at `offset`, used to number the chunks.
+    :param block_size: Number of markets per chunk.
+    :param workers: Number of processes parsing CSV blocks.
+    :return: A generator of `MarketChunk` objects.
+    """
+    if path.lower().endswith(".csv"):
+        return read_csv_markets(path, offset, first_market, block_size, workers)
+    return read_npy_markets(path, offset, first_market, block_size)
+
+
+def read_npy_markets(path, offset=0, first_market=0, block_size=DEFAULT_BLOCK_SIZE):
+    records = np.load(path, mmap_mode="r")
+    if records.dtype.names is None or not {"odds", "probability", "winner"} <= set(records.dtype.names):
+        raise ValueError(f"{path} does not hold market records (odds, probability, winner)")
+    header_size = records.offset
+    itemsize = records.dtype.itemsize
+
+    offset = max(offset, header_size)
+    if (offset - header_size) % itemsize:
+        raise ValueError(f"Offset {offset} is not at the start of a record of {path}")
+
+    index = first_market
+    for start in range((offset - header_size) // itemsize, len(records), block_size):
+        block = records[start:start + block_size]
+        # One copy into the variant-major layout used by the engine
+        yield MarketChunk(
+            index=index,
+            odds=np.asfortranarray(block["odds"]),
+            probabilities=np.asfortranarray(block["probability"]),
+            winner=np.array(block["winner"], dtype=np.intp),
+            start=header_size + start * itemsize,
+            end=header_size + (start + len(block)) * itemsize,
+        )
+        index += len(block)
+
+
+def read_csv_header(path):
+    """
+    Read the column names of a market CSV file.
+
+    :return: A tuple (number of variants, column positions of the odds, probabilities and winner,
+             number of columns, byte offset of the first row).
+    """
+    with open(path, "rb") as file:
+        line = file.readline()
+    names = [name.strip() for name in line.decode().split(",")]
+    number_of_variants = sum(name.startswith("odds_") for name in names)
+    try:
+        positions = [names.index(name) for name in csv_columns(number_of_variants)]
+    except ValueError:
+        raise ValueError(
+            f"{path} must have the columns odds_0..odds_{{K-1}}, probability_0..probability_{{K-1}} and winner"
+        ) from None
+    return number_of_variants, positions, len(names), len(line)
+
+
+def csv_blocks(data, start, block_size):
+    """
+    Yield the (start, end, rows) byte ranges of consecutive blocks of `block_size` lines of a
+    memory-mapped file, found with a vectorized search for the newlines.
+    """
+    size = len(data)
+    line_length = 64
+    while start < size:
+        window = max(block_size * line_length * 5 // 4, 1 << 16)
+        while True:
+            end = min(start + window, size)
+            newlines = np.flatnonzero(np.frombuffer(data, np.uint8, end - start, start) == 10)
+            if len(newlines) >= block_size or end == size:
+                break
+            window *= 2
+
+        if len(newlines) >= block_size:
+            stop = start + newlines[block_size - 1] + 1
+            rows = block_size
+        else:
+            stop = size
+            rows = len(newlines) + (newlines[-1] + 1 < size - start if len(newlines) else 1)
+        line_length = max((stop - start) // max(rows, 1), 1)
+        yield start, stop, rows
+        start = stop
+
+
+def parse_csv_block(path, start, end, rows, positions, number_of_columns):
+    """
+    Parse the lines between bytes `start` and `end` of a market CSV file into (odds, probabilities, winner).
+    """
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end]
+    try:
+        # Blank lines are skipped; they are only expected at the end of the file
+        table = np.loadtxt(io.BytesIO(text), delimiter=",", comments=None, ndmin=2)
+    except ValueError:
+        table = None
+    blank = text.count(b"\n") - rows
+    if (table is None or table.shape[1] != number_of_columns
+            or len(table) != rows and not (blank > 0 and len(table) == rows - blank)):
+        raise ValueError(f"Malformed rows in {path} between bytes {start} and {end}")
+
+    number_of_variants = (len(positions) - 1) // 2
+    odds = np.asfortranarray(table[:, positions[:number_of_variants]])
+    probabilities = np.asfortranarray(table[:, positions[number_of_variants:-1]])
+    return odds, probabilities, table[:, positions[-1]].astype(np.intp)
+
+
+def read_csv_markets(path, offset=0, first_market=0, block_size=DEFAULT_BLOCK_SIZE, workers=1):
+    number_of_variants, positions, number_of_columns, data_start = read_csv_header(path)
+    offset = max(offset, data_start)
+    if os.path.getsize(path) <= offset:
+        return
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if offset > data_start and data[offset - 1] != ord("\n"):
+            raise ValueError(f"Offset {offset} is not at the start of a line of {path}")
+
+        blocks = csv_blocks(data, offset, block_size)
+        index = first_market
+        if workers <= 1:
+            for start, end, rows in blocks:
+                odds, probabilities, winner = parse_csv_block(path, start, end, rows, positions, number_of_columns)
+                yield MarketChunk(index, odds, probabilities, winner, start, end)
+                index += len(winner)
+            return
+
+        # Keep a bounded number of blocks in flight, so memory does not grow with the file
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = []
+            for block in blocks:
+                pending.append((block, executor.submit(parse_csv_block, path, *block, positions, number_of_columns)))
+                if len(pending) > workers:
+                    (start, end, _), future = pending.pop(0)
+                    odds, probabilities, winner = future.result()
+                    yield MarketChunk(index, odds, probabilities, winner, start, end)
+                    index += len(winner)
+            for (start, end, _), future in pending:
+                odds, probabilities, winner = future.result()
+                yield MarketChunk(index, odds, probabilities, winner, start, end)
+                index += len(winner)
+
+
+def backtest_blocks(path, bankroll, kelly_fraction, staking="kelly", offset=0, first_market=0,
+                    block_size=DEFAULT_BLOCK_SIZE, workers=1, record_bets=False, profiler=NULL_PROFILER):
+    """
+    Run the betting of `engine.simulate_blocks` on recorded markets instead of generated ones: the
+    stakes come from the recorded odds and model probabilities, and the bets are settled with the
+    recorded winners.
+
+    Every block gets the byte `position` to resume from and the index of the `next_market` after it.
+    See `read_markets` for the reading parameters and `engine.simulate_blocks` for the others.
+
+    :return: A generator of `engine.SimulationBlock` objects.
+    """
+    if staking not in STAKING_MODES:
+        raise ValueError(f"Unknown staking mode: {staking}")
+
+    markets = read_markets(path, offset, first_market, block_size, workers)
+    while True:
+        with profiler.stage("reading"):
+            chunk = next(markets, None)
+        if chunk is None:
+            return
+        check_chunk(path, chunk)
+
+        with profiler.stage("staking"):
+            bets = place_bets(chunk.odds, chunk.probabilities, chunk.winner, kelly_fraction, staking)
+        block = settle_block(bankroll, chunk.index, bets, record_bets, profiler)
+        block.position = chunk.end
+        block.next_market = chunk.index + len(chunk.winner)
+        yield block
+
+        if block.ruined:
+            return
+        if len(block.bankroll):
+            bankroll = block.bankroll[-1]
+
+
+def check_chunk(path, chunk):
+    invalid = np.flatnonzero((chunk.winner < 0) | (chunk.winner >= chunk.odds.shape[1]))
+    if len(invalid):
+        raise ValueError(f"Market {chunk.index + invalid[0]} of {path} has an invalid winner: {chunk.winner[invalid[0]]}")
+
+
+def backtest(path, bankroll, kelly_fraction, staking="kelly", offset=0, first_market=0,
+             block_size=DEFAULT_BLOCK_SIZE, workers=1, record_bets=False, profiler=NULL_PROFILER):
+    """
+    Run a complete backtest and collect it into an `engine.SimulationResult`, like `engine.simulate`.
+    See `backtest_blocks` for the parameters.
+    """
+    blocks = list(backtest_blocks(path, bankroll, kelly_fraction, staking, offset, first_market, block_size,
+                                  workers, record_bets, profiler))
+
+    return SimulationResult(
+        bankroll_history=np.concatenate([[float(bankroll)]] + [block.bankroll for block in blocks]),
+        results_history=np.concatenate([np.empty(0, np.int8)] + [block.wins for block in blocks]),
+        ruined=any(block.ruined for block in blocks),
+        blocks=blocks if record_bets else [],
+    )
+
+
+class BacktestProgress(NamedTuple):
+    """
+    State of a backtest after a block, as yielded by `backtest_progress`. The backtest can be
+    resumed from `position` with `next_market` as the first market and `bankroll` as the bankroll.
+    """
+    stats: RunningStats
+    bankroll: float
+    position: int
+    next_market: int
+
+
+def backtest_progress(path, bankroll, kelly_fraction, staking="kelly", offset=0, first_market=0,
+                      block_size=DEFAULT_BLOCK_SIZE, workers=1, profiler=NULL_PROFILER, checkpoint=None):
+    """
+    Run a backtest in constant memory, like `engine.simulate_stats`, and yield a `BacktestProgress`
+    after every block. The same `stats` object is updated throughout. See `backtest_blocks` for the
+    parameters.
+
+    :param checkpoint: Optional `checkpoint.Checkpoint`, as in `engine.simulate_stats`. The backtest
+                       continues from the position, bankroll and statistics of its snapshot if
+                       there is one, and saves them between blocks whenever it is due.
+    """
+    if staking not in STAKING_MODES:
+        raise ValueError(f"Unknown staking mode: {staking}")
+
+    stats = RunningStats()
+    log_bankroll = np.log(bankroll)
+    if checkpoint is not None:
+        saved = checkpoint.load(None)
+        if saved is not None:
+            arrays, stats = saved
+            offset, first_market = int(arrays["position"]), int(arrays["next_market"])
+            log_bankroll = float(arrays["log_bankroll"])
+    markets = read_markets(path, offset, first_market, block_size, workers)
+    while True:
+        with profiler.stage("reading"):
+            chunk = next(markets, None)
+        if chunk is None:
+            return
+        check_chunk(path, chunk)
+
+        with profiler.stage("staking"):
+            bets = place_bets(chunk.odds, chunk.probabilities, chunk.winner, kelly_fraction, staking)
+        log_bankroll, ruined = log_stats_block(stats, log_bankroll, bets, profiler)
+        with np.errstate(over="ignore"):
+            bankroll = 0.0 if ruined else float(np.exp(log_bankroll))  # inf beyond the range of a float
+        next_market = chunk.index + len(chunk.winner)
+        if not ruined and checkpoint is not None and checkpoint.due():
+            checkpoint.save(None, {"position": chunk.end, "next_market": next_market, "log_bankroll": log_bankroll},
+                            stats)
+        yield BacktestProgress(stats, bankroll, chunk.end, next_market)
+        if ruined:
+            return
+
+
+def backtest_stats(path, bankroll, kelly_fraction, staking="kelly", offset=0, first_market=0,
+                   block_size=DEFAULT_BLOCK_SIZE, workers=1, profiler=NULL_PROFILER, checkpoint=None):
+    """
+    Run a complete backtest in constant memory and return its final `BacktestProgress`.
+    """
+    progress = BacktestProgress(RunningStats(), float(bankroll), offset, first_market)
+    for progress in backtest_progress(path, bankroll, kelly_fraction, staking, offset, first_market, block_size,
+                                      workers, profiler, checkpoint):
+        pass
+    return progress
+
+
+def export_synthetic(path, number_of_variants, number_of_bets, inflated_probability, seed=None,
+                     block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Write the markets and winners that `engine.simulate` draws for `seed` to a market file. A backtest
+    of the file with the same bankroll, Kelly fraction and block size gives the same results as the
+    synthetic run.
+    """
+    rng = np.random.default_rng(seed)
+    with MarketWriter(path, number_of_variants) as writer:
+        for offset in range(0, number_of_bets, block_size):
+            size = min(block_size, number_of_bets - offset)
+            odds = generate_odds_matrix(rng, size, number_of_variants)
+            probabilities = value_bet_matrix(rng, odds, inflated_probability)
+            writer.append(odds, probabilities, determine_winners(rng, probabilities))
+
+
+def convert(source, destination, block_size=DEFAULT_BLOCK_SIZE, workers=1):
+    """
+    Convert a market file between the CSV and binary formats, e.g. to backtest a large CSV file
+    repeatedly at the speed of the disk.
+    """
+    writer = None
+    try:
+        for chunk in read_markets(source, block_size=block_size, workers=workers):
+            if writer is None:
+                writer = MarketWriter(destination, chunk.odds.shape[1])
+            writer.append(chunk.odds, chunk.probabilities, chunk.winner)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def main(argv=None):
+    from cli import print_summary
+
+    parser = argparse.ArgumentParser(prog="python -m backtest",
+                                     description="Run the Kelly staking on recorded markets and winners.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Backtest a CSV or .npy market file.")
+    run_parser.add_argument("path", help="Market file (see backtest.MarketWriter for the formats).")
+    run_parser.add_argument("--bankroll", type=float, default=1000, help="Starting bankroll.")
+    run_parser.add_argument("--kelly", type=float, default=50, help="Percentage of Kelly to bet (10 - 100).")
+    run_parser.add_argument("--staking", choices=STAKING_MODES, default="kelly", help="Staking of every market.")
+    run_parser.add_argument("--offset", type=int, default=0, help="Byte offset to resume from.")
+    run_parser.add_argument("--first-market", type=int, default=0, help="Index of the market at --offset.")
+    run_parser.add_argument("--workers", type=int, default=1, help="Processes parsing CSV files.")
+    run_parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="Markets per block.")
+    run_parser.add_argument("--checkpoint", default=None, metavar="FILE",
+                            help="Save the position, bankroll and statistics to FILE every --checkpoint-interval "
+                                 "seconds and resume from it.")
+    run_parser.add_argument("--checkpoint-interval", type=float, default=60, metavar="SECONDS",
+                            help="Seconds between two checkpoints.")
+
+    export_parser = commands.add_parser("export", help="Write the markets of a synthetic run to a market file.")
+    export_parser.add_argument("path", help="Output file (.csv or .npy).")
+    export_parser.add_argument("--variants", type=int, default=3, help="Number of play variants per market.")
+    export_parser.add_argument("--bets", type=int, default=1000, help="Number of markets.")
+    export_parser.add_argument("--inflated", type=int, default=5, help="Inflated probability (1 - 100).")
+    export_parser.add_argument("--seed", type=int, default=None, help="Seed of the synthetic run.")
+
+    convert_parser = commands.add_parser("convert", help="Convert a market file between CSV and .npy.")
+    convert_parser.add_argument("source")
+    convert_parser.add_argument("destination")
+    convert_parser.add_argument("--workers", type=int, default=1, help="Processes parsing CSV files.")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_synthetic(args.path, args.variants, args.bets, args.inflated, args.seed)
+        print(f"{args.bets} markets written to {args.path}")
+        return 0
+    if args.command == "convert":
+        convert(args.source, args.destination, workers=args.workers)
+        print(f"{args.source} converted to {args.destination}")
+        return 0
+
+    if args.bankroll <= 0:
+        parser.error("Bankroll must be a positive value.")
+    if not 10 <= args.kelly <= 100:
+        parser.error("Kelly percentage must be between 10 and 100.")
+    if args.block_size <= 0:
+        parser.error("The block size must be positive.")
+
+    checkpoint = None
+    if args.checkpoint is not None:
+        from checkpoint import Checkpoint, run_key
+
+        names = ("bankroll", "kelly", "staking", "offset", "first_market", "block_size")
+        key = run_key("backtest", path=os.path.abspath(args.path), **{name: getattr(args, name) for name in names})
+        checkpoint = Checkpoint(args.checkpoint, key, args.checkpoint_interval)
+
+    progress = BacktestProgress(RunningStats(), args.bankroll, args.offset, args.first_market)
+    try:
+        for progress in backtest_progress(args.path, args.bankroll, args.kelly / 100, args.staking, args.offset,
+                                          args.first_market, args.block_size, args.workers, checkpoint=checkpoint):
+            pass
+    except KeyboardInterrupt:
+        if checkpoint is not None:
+            print(f"Interrupted. Run the same command again to resume from {checkpoint.path}.")
+            return 1
+        print(f"Interrupted. Resume with: --bankroll {progress.bankroll!r} --offset {progress.position} "
+              f"--first-market {progress.next_market} (the statistics start again; run with --checkpoint "
+              f"to keep them)")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    print_summary(args.bankroll, progress.bankroll, progress.stats)
+    print(f"Markets read: {progress.next_market - args.first_market} "
+          f"(next market {progress.next_market} at byte {progress.position})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from engine import (
+    DEFAULT_BLOCK_SIZE, determine_winners, generate_odds_matrix, kelly_matrix, simulate, simulate_ensemble,
+    simulate_stats, simultaneous_kelly, value_bet_matrix
+)
+from functions_library import (
+    determine_winner, generate_market, generate_odds, kelly_criterion, update_bankroll, value_bet_generator
+)
+from sweep import parse_range
+
+HISTORY_FILE = "benchmark_history.json"
+BASELINE_FILE = "benchmark_baseline.json"
+DEFAULT_THRESHOLD = 0.10
+
+PRESETS = {
+    "quick": {"bets": [1000, 10000], "variants": [3, 10], "paths": [1, 100]},
+    "full": {
+        "bets": [1000, 10000, 100000, 1000000, 10000000],
+        "variants": [3, 10, 100, 1000, 10000],
+        "paths": [1, 10, 100, 1000, 10000],
+    },
+}
+
+# Cases above these amounts of work are skipped, so that the full grid finishes in reasonable time
+SCALAR_WORK_LIMIT = 10 ** 6
+VECTOR_WORK_LIMIT = 10 ** 9
+
+
+def scalar_markets(bets, variants, rng):
+    return [value_bet_generator(generate_market(variants, rng), 5, rng) for _ in range(bets)]
+
+
+def setup_generate_odds(bets, variants, paths):
+    return lambda: [generate_odds(variants) for _ in range(bets)]
+
+
+def setup_value_bet_generator(bets, variants, paths):
+    odds = [generate_odds(variants) for _ in range(bets)]
+    return lambda: [value_bet_generator(market, 5) for market in odds]
+
+
+def setup_kelly_criterion(bets, variants, paths):
+    odds = [generate_odds(variants) for _ in range(bets)]
+    probabilities = [value_bet_generator(market, 5) for market in odds]
+    return lambda: [kelly_criterion(market, market_probabilities) for market, market_probabilities in zip(odds, probabilities)]
+
+
+def setup_determine_winner(bets, variants, paths):
+    odds = [generate_odds(variants) for _ in range(bets)]
+    probabilities = [list(value_bet_generator(market, 5).values()) for market in odds]
+    names = list(odds[0])
+    return lambda: [determine_winner(names, weights) for weights in probabilities]
+
+
+def setup_update_bankroll(bets, variants, paths):
+    def run():
+        bankroll = 1000.0
+        for bet in range(bets):
+            bankroll = update_bankroll(bankroll, bankroll * 0.01, 2.5, bet % 3 == 0)
+    return run
+
+
+def setup_scalar_loop(bets, variants, paths):
+    """
+    The per-bet loop of the original `Window.get_betting_data`, built from `functions_library`.
+    """
+    rng = np.random.default_rng(0)
+
+    def run():
+        bankroll = 1000.0
+        for _ in range(bets):
+            market = value_bet_generator(generate_market(variants, rng), 5, rng)
+            kelly = kelly_criterion(market)
+            if kelly is None:
+                continue
+            percentage, variant, odd = kelly
+            bankroll = update_bankroll(bankroll, bankroll * percentage * 0.5, odd,
+                                       determine_winner(market, rng=rng) == variant)
+    return run
+
+
+def in_blocks(bets, function):
+    """
+    Call `function(size)` for consecutive blocks of at most `DEFAULT_BLOCK_SIZE` markets, as the engine does.
+    """
+    def run():
+        for offset in range(0, bets, DEFAULT_BLOCK_SIZE):
+            function(min(DEFAULT_BLOCK_SIZE, bets - offset))
+    return run
+
+
+def setup_generate_odds_matrix(bets, variants, paths):
+    rng = np.random.default_rng(0)
+    return in_blocks(bets, lambda size: generate_odds_matrix(rng, size, variants))
+
+
+def setup_kelly_matrix(bets, variants, paths):
+    rng = np.random.default_rng(0)
+    odds = generate_odds_matrix(rng, min(bets, DEFAULT_BLOCK_SIZE), variants)
+    probabilities = value_bet_matrix(rng, odds, 5)
+    return in_blocks(bets, lambda size: kelly_matrix(odds[:size], probabilities[:size]))
+
+
+def setup_simultaneous_kelly(bets, variants, paths):
+    rng = np.random.default_rng(0)
+    odds = generate_odds_matrix(rng, min(bets, DEFAULT_BLOCK_SIZE), variants)
+    probabilities = value_bet_matrix(rng, odds, 5)
+    probabilities /= probabilities.sum(axis=1)[:, None]
+    return in_blocks(bets, lambda size: simultaneous_kelly(odds[:size], probabilities[:size]))
+
+
+def setup_determine_winners(bets, variants, paths):
+    rng = np.random.default_rng(0)
+    odds = generate_odds_matrix(rng, min(bets, DEFAULT_BLOCK_SIZE), variants)
+    probabilities = value_bet_matrix(rng, odds, 5)
+    return in_blocks(bets, lambda size: determine_winners(rng, probabilities[:size]))
+
+
+def setup_simulate(bets, variants, paths):
+    return lambda: simulate(1000, variants, 0.5, bets, 5, seed=0)
+
+
+def setup_simulate_stats(bets, variants, paths):
+    return lambda: simulate_stats(1000, variants, 0.5, bets, 5, seed=0)
+
+
+def setup_ensemble(bets, variants, paths):
+    return lambda: simulate_ensemble(1000, variants, 0.5, bets, 5, paths, seed=0)
+
+
+# name: (setup function, scale axes it depends on, work limit). Throughput is measured in bets (markets)
+# per second, counting every path of an ensemble.
+BENCHMARKS = {
+    "generate_odds": (setup_generate_odds, ("bets", "variants"), SCALAR_WORK_LIMIT),
+    "value_bet_generator": (setup_value_bet_generator, ("bets", "variants"), SCALAR_WORK_LIMIT),
+    "kelly_criterion": (setup_kelly_criterion, ("bets", "variants"), SCALAR_WORK_LIMIT),
+    "determine_winner": (setup_determine_winner, ("bets", "variants"), SCALAR_WORK_LIMIT),
+    "update_bankroll": (setup_update_bankroll, ("bets",), SCALAR_WORK_LIMIT),
+    "scalar_loop": (setup_scalar_loop, ("bets", "variants"), SCALAR_WORK_LIMIT),
+    "generate_odds_matrix": (setup_generate_odds_matrix, ("bets", "variants"), VECTOR_WORK_LIMIT),
+    "kelly_matrix": (setup_kelly_matrix, ("bets", "variants"), VECTOR_WORK_LIMIT),
+    "simultaneous_kelly": (setup_simultaneous_kelly, ("bets", "variants"), VECTOR_WORK_LIMIT),
+    "determine_winners": (setup_determine_winners, ("bets", "variants"), VECTOR_WORK_LIMIT),
+    "simulate": (setup_simulate, ("bets", "variants"), VECTOR_WORK_LIMIT),
+    "simulate_stats": (setup_simulate_stats, ("bets", "variants"), VECTOR_WORK_LIMIT),
+    "ensemble": (setup_ensemble, ("bets", "variants", "paths"), VECTOR_WORK_LIMIT),
+}
+
+
+def benchmark_cases(names, bets, variants, paths):
+    """
+    List the (benchmark, bets, variants, paths) cases of a scale grid. Axes a benchmark does not
+    depend on are fixed to their first value, and cases above the work limit of the benchmark are
+    left out.
+    """
+    scales = {"bets": bets, "variants": variants, "paths": paths}
+    cases = []
+    for name in names:
+        _, axes, limit = BENCHMARKS[name]
+        grid = [scales[axis] if axis in axes else scales[axis][:1] for axis in ("bets", "variants", "paths")]
+        for case_bets, case_variants, case_paths in itertools.product(*grid):
+            work = case_bets * (case_variants if "variants" in axes else 1) * (case_paths if "paths" in axes else 1)
+            if work <= limit:
+                cases.append((name, case_bets, case_variants, case_paths))
+    return cases
+
+
+def measure(name, bets, variants, paths, repeat=3, memory=True):
+    """
+    Run one benchmark case.
+
+    The time is the best of `repeat` runs. The peak memory is measured in a separate run with
+    `tracemalloc` (which also tracks NumPy buffers), so that tracing does not slow down the timed runs.
+
+    :return: A result dictionary for the history file.
+    """
+    setup = BENCHMARKS[name][0]
+    run = setup(bets, variants, paths)
+
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    peak_memory = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    units = bets * (paths if name == "ensemble" else 1)
+    return {
+        "benchmark": name,
+        "bets": bets,
+        "variants": variants,
+        "paths": paths,
+        "seconds": seconds,
+        "throughput": units / seconds if seconds > 0 else float("inf"),
+        "peak_memory": peak_memory,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(cases, repeat=3, memory=True, progress=None):
+    """
+    Measure every case and return a run record with the machine it ran on.
+    """
+    results = []
+    for case in cases:
+        results.append(measure(*case, repeat=repeat, memory=memory))
+        if progress is not None:
+            progress(results[-1])
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+
+def read_history(path):
+    """
+    Read a history file (a list of runs). A file holding a single run, like a baseline, is read
+    as a history of one run.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        history = json.load(file)
+    return history if isinstance(history, list) else [history]
+
+
+def append_history(run, path):
+    history = read_history(path)
+    history.append(run)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(history, file, indent=1)
+    os.replace(temporary, path)
+
+
+def compare_runs(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the cases two runs have in common.
+
+    :param threshold: Relative change that counts as a regression: a throughput lower than
+                      `1 - threshold` times the baseline, or a peak memory higher than
+                      `1 + threshold` times the baseline.
+    :return: A list of comparison dictionaries, one per common case, with a `regression` flag.
+    """
+    def key(result):
+        return result["benchmark"], result["bets"], result["variants"], result["paths"]
+
+    reference = {key(result): result for result in baseline["results"]}
+    comparisons = []
+    for result in current["results"]:
+        before = reference.get(key(result))
+        if before is None:
+            continue
+        speed = result["throughput"] / before["throughput"]
+        memory = None
+        if result["peak_memory"] is not None and before["peak_memory"]:
+            memory = result["peak_memory"] / before["peak_memory"]
+        comparisons.append({
+            "case": key(result),
+            "speed": speed,
+            "memory": memory,
+            "regression": speed < 1 - threshold or (memory is not None and memory > 1 + threshold),
+        })
+    return comparisons
+
+
+def format_case(case):
+    name, bets, variants, paths = case
+    return f"{name:<22} bets={bets:<9} variants={variants:<6} paths={paths:<6}"
+
+
+def print_result(result):
+    memory = "-" if result["peak_memory"] is None else f"{result['peak_memory'] / 2 ** 20:9.1f} MiB"
+    case = (result["benchmark"], result["bets"], result["variants"], result["paths"])
+    print(f"{format_case(case)} {result['throughput']:14,.0f} bets/s {memory}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths and track regressions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and append the results to the history.")
+    run_parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="Scale grid to run.")
+    run_parser.add_argument("--bets", default=None, help="Numbers of bets, e.g. 1000,1e6 (overrides the preset).")
+    run_parser.add_argument("--variants", default=None, help="Numbers of variants, e.g. 3,10.")
+    run_parser.add_argument("--paths", default=None, help="Numbers of ensemble paths, e.g. 1,100.")
+    run_parser.add_argument("--only", default=None, help="Comma separated benchmark names (default: all).")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the best one is kept.")
+    run_parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory measurement.")
+    run_parser.add_argument("--history", default=HISTORY_FILE, help="JSON history file.")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Also store this run as the baseline.")
+    run_parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file.")
+
+    baseline_parser = commands.add_parser("baseline", help="Store the latest run of the history as the baseline.")
+    baseline_parser.add_argument("--history", default=HISTORY_FILE, help="JSON history file.")
+    baseline_parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file.")
+
+    compare_parser = commands.add_parser("compare", help="Compare the latest run with the baseline.")
+    compare_parser.add_argument("--history", default=HISTORY_FILE, help="JSON history file.")
+    compare_parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file.")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Relative slowdown or memory growth flagged as a regression (default 0.10).")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        names = list(BENCHMARKS) if args.only is None else [name.strip() for name in args.only.split(",")]
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            parser.error(f"Unknown benchmarks: {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+
+        preset = PRESETS[args.preset]
+        try:
+            scales = {
+                axis: preset[axis] if getattr(args, axis) is None else parse_range(getattr(args, axis), lambda value: int(float(value)))
+                for axis in ("bets", "variants", "paths")
+            }
+        except ValueError as e:
+            parser.error(str(e))
+
+        # update_bankroll and the scalar loop log every bet; keep that cost but not the output
+        logging.disable(logging.CRITICAL)
+        run = run_benchmarks(benchmark_cases(names, **scales), args.repeat, not args.no_memory, print_result)
+        append_history(run, args.history)
+        if args.save_baseline:
+            with open(args.baseline, "w") as file:
+                json.dump(run, file, indent=1)
+        print(f"{len(run['results'])} results appended to {args.history}")
+        return 0
+
+    history = read_history(args.history)
+    if not history:
+        print(f"No benchmark runs in {args.history}")
+        return 1
+
+    if args.command == "baseline":
+        with open(args.baseline, "w") as file:
+            json.dump(history[-1], file, indent=1)
+        print(f"Run of {history[-1]['timestamp']} stored as the baseline in {args.baseline}")
+        return 0
+
+    baseline = read_history(args.baseline)
+    if not baseline:
+        print(f"No baseline in {args.baseline}; create one with the baseline command")
+        return 1
+
+    comparisons = compare_runs(baseline[-1], history[-1], args.threshold)
+    for comparison in comparisons:
+        memory = "    -" if comparison["memory"] is None else f"{comparison['memory']:5.2f}x"
+        flag = "  REGRESSION" if comparison["regression"] else ""
+        print(f"{format_case(comparison['case'])} speed {comparison['speed']:5.2f}x memory {memory}{flag}")
+
+    regressions = sum(comparison["regression"] for comparison in comparisons)
+    print(f"{len(comparisons)} cases compared, {regressions} regressions (threshold {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+from engine import (
+    BAND_PERCENTILES, DEFAULT_BLOCK_SIZE, ENGINE_VERSION, EnsembleResult, SimulationResult, simulate,
+    simulate_ensemble, simulate_stats
+)
+from history import History
+from stats import RunningStats
+
+DEFAULT_CACHE_DIRECTORY = "simulation_cache"
+DEFAULT_MAX_BYTES = 1 << 30
+# Temporary files older than this are left over from an interrupted write
+STALE_SECONDS = 3600
+# Part of the key of cached results: bump it whenever the arrays of an entry change, so that
+# entries of the old layout are missed and recomputed instead of read
+CACHE_FORMAT = 2
+
+
+def canonical(value):
+    """
+    Convert a parameter to a JSON-serializable value that is the same for equal parameters: integral
+    floats become integers (so a bankroll of 1000 and 1000.0 give the same key) and seed sequences
+    are described by their entropy and spawn key.
+    """
+    if isinstance(value, np.random.SeedSequence):
+        return {"entropy": canonical(value.entropy), "spawn_key": list(value.spawn_key), "pool_size": value.pool_size}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def cache_key(kind, **parameters):
+    """
+    Return the key of a cached result: the SHA-256 of the kind of result, the engine version, the
+    cache format and the canonical parameters, including the seed.
+    """
+    description = {"kind": kind, "engine_version": ENGINE_VERSION, "cache_format": CACHE_FORMAT}
+    description.update({name: canonical(value) for name, value in parameters.items()})
+    text = json.dumps(description, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of simulation results.
+
+    Every entry is an uncompressed `.npz` file named after its `cache_key`. Entries are written to a
+    temporary file and renamed into place, so a reader never sees a partial entry and concurrent
+    writers (e.g. sweep workers) are safe. Reading an entry marks it as recently used; when the
+    cache grows beyond `max_bytes` the least recently used entries are deleted.
+
+    Only seeded runs are cached: the `simulate`, `simulate_stats` and `simulate_ensemble` methods
+    run the engine directly when `seed` is None.
+
+    :param directory: Directory of the cache entries.
+    :param max_bytes: Maximum total size of the entries.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def load(self, key):
+        """
+        Return the arrays stored under `key`, or None if there is no such entry.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            # A damaged entry is a miss; it is rewritten by the next run
+            self.remove(path)
+            return None
+        return arrays
+
+    def store(self, key, arrays):
+        """
+        Store a dictionary of arrays under `key` atomically, then evict old entries if the cache is too large.
+        Entries larger than the whole cache are not stored.
+        """
+        if sum(np.asarray(array).nbytes for array in arrays.values()) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.savez(file, **arrays)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            self.remove(temporary)
+            raise
+        self.evict()
+
+    def entries(self):
+        """
+        Return the (last use, size, path) of every entry, least recently used first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                status = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(".npz"):
+                entries.append((status.st_mtime, status.st_size, entry.path))
+            elif entry.name.endswith(".tmp") and now - status.st_mtime > STALE_SECONDS:
+                self.remove(entry.path)
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.remove(path)
+
+    def __len__(self):
+        return len(self.entries())
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def simulate(self, bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                 seed=None, block_size=DEFAULT_BLOCK_SIZE, staking="kelly", **options):
+        """
+        `engine.simulate` returning the cached histories of a seeded run when available. Other
+        keyword arguments (e.g. `profiler`) are passed on to the engine; runs recording their bets
+        are not cached.
+        """
+        if seed is None or options.get("record_bets"):
+            return simulate(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                            block_size=block_size, staking=staking, **options)
+
+        key = simulation_key(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                             seed, staking, block_size)
+        arrays = self.load(key)
+        if arrays is not None:
+            return result_from_arrays(arrays)[0]
+
+        result = simulate(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability, seed,
+                          block_size, staking=staking, **options)
+        self.store(key, result_arrays(result))
+        return result
+
+    def simulate_stats(self, bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                       seed=None, block_size=DEFAULT_BLOCK_SIZE, staking="kelly", **options):
+        """
+        `engine.simulate_stats` returning the cached statistics of a seeded run when available.
+        """
+        if seed is None:
+            return simulate_stats(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                                  block_size=block_size, staking=staking, **options)
+
+        key = cache_key("stats", bankroll=bankroll, number_of_variants=number_of_variants,
+                        kelly_fraction=kelly_fraction, number_of_bets=number_of_bets,
+                        inflated_probability=inflated_probability, seed=seed, staking=staking, block_size=block_size)
+        arrays = self.load(key)
+        if arrays is not None:
+            return stats_from_arrays(arrays)
+
+        stats = simulate_stats(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                               seed, block_size, staking=staking, **options)
+        self.store(key, stats_arrays(stats))
+        return stats
+
+    def simulate_ensemble(self, bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                          number_of_paths, seed=None, percentiles=BAND_PERCENTILES, block_size=DEFAULT_BLOCK_SIZE,
+                          staking="kelly", **options):
+        """
+        `engine.simulate_ensemble` returning the cached bands of a seeded run when available. A
+        cancelled run (None) is not stored.
+        """
+        parameters = (bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                      number_of_paths)
+        if seed is None:
+            return simulate_ensemble(*parameters, percentiles=percentiles, block_size=block_size, staking=staking,
+                                     **options)
+
+        key = cache_key("ensemble", bankroll=bankroll, number_of_variants=number_of_variants,
+                        kelly_fraction=kelly_fraction, number_of_bets=number_of_bets,
+                        inflated_probability=inflated_probability, number_of_paths=number_of_paths, seed=seed,
+                        percentiles=percentiles, staking=staking, block_size=block_size)
+        arrays = self.load(key)
+        if arrays is not None:
+            return EnsembleResult(percentiles=tuple(arrays["percentiles"].tolist()), bands=arrays["bands"],
+                                  final_bankroll=arrays["final_bankroll"], max_drawdown=arrays["max_drawdown"],
+                                  ruined=arrays["ruined"])
+
+        ensemble = simulate_ensemble(*parameters, seed=seed, percentiles=percentiles, block_size=block_size,
+                                     staking=staking, **options)
+        if ensemble is not None:
+            self.store(key, {
+                "percentiles": np.asarray(ensemble.percentiles), "bands": ensemble.bands,
+                "final_bankroll": ensemble.final_bankroll, "max_drawdown": ensemble.max_drawdown,
+                "ruined": ensemble.ruined,
+            })
+        return ensemble
+
+
+def simulation_key(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability, seed,
+                   staking="kelly", block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Key of the histories of a single run, shared by `ResultCache.simulate` and the interface.
+    """
+    return cache_key("simulation", bankroll=bankroll, number_of_variants=number_of_variants,
+                     kelly_fraction=kelly_fraction, number_of_bets=number_of_bets,
+                     inflated_probability=inflated_probability, seed=seed, staking=staking, block_size=block_size)
+
+
+def stats_arrays(stats, prefix=""):
+    return {prefix + name: np.asarray(value) for name, value in vars(stats).items()}
+
+
+def stats_from_arrays(arrays, prefix=""):
+    stats = RunningStats()
+    for name in vars(stats):
+        setattr(stats, name, arrays[prefix + name].item())
+    return stats
+
+
+def result_arrays(result, stats=None):
+    """
+    Arrays of a cached single run: its `SimulationResult` histories and their `RunningStats`.
+    """
+    if stats is None:
+        # Histories that overflowed to infinity give NaN statistics, as in the results window
+        with np.errstate(invalid="ignore", over="ignore"):
+            stats = RunningStats.from_history(result.bankroll_history, result.results_history, result.ruined)
+    return history_arrays(result.bankroll_history, np.packbits(result.results_history),
+                          len(result.results_history), result.ruined, stats)
+
+
+def history_arrays(bankroll_history, packed_results, number_of_results, ruined, stats):
+    """
+    Arrays of a cached single run given its bankroll history and its bit-packed results (see
+    `history.History`). The arrays are stored as they are, without a copy.
+    """
+    return {
+        "bankroll_history": bankroll_history,
+        "packed_results": packed_results,
+        "number_of_results": np.asarray(number_of_results),
+        "ruined": np.asarray(ruined),
+        **stats_arrays(stats, "stats_"),
+    }
+
+
+def history_from_arrays(arrays):
+    """
+    :return: A tuple (`history.History`, ruined, `RunningStats`) of a cached single run, wrapping
+             the loaded arrays without a copy.
+    """
+    history = History.from_arrays(arrays["bankroll_history"], arrays["packed_results"],
+                                  int(arrays["number_of_results"]))
+    return history, bool(arrays["ruined"]), stats_from_arrays(arrays, "stats_")
+
+
+def result_from_arrays(arrays):
+    """
+    :return: A tuple (`SimulationResult`, `RunningStats`) of a cached single run.
+    """
+    history, ruined, stats = history_from_arrays(arrays)
+    result = SimulationResult(
+        bankroll_history=history.bankroll,
+        results_history=history.results(),
+        ruined=ruined,
+    )
+    return result, stats
@@ -0,0 +1,593 @@
+import argparse
+import csv
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cache import cache_key, stats_arrays, stats_from_arrays
+from engine import DEFAULT_BLOCK_SIZE, ENGINE_VERSION, STAKING_MODES, EnsembleResult, simulate_ensemble
+
+# Seconds between two snapshots of a run; writing one takes a fraction of a second
+DEFAULT_INTERVAL = 60.0
+# Locks of a shard not refreshed for this long belong to a worker that died
+STALE_SECONDS = 600.0
+JOB_FILE = "job.json"
+
+
+def save_npz_atomic(path, arrays):
+    """
+    Write a dictionary of arrays to `path` through a temporary file that is flushed to disk and
+    renamed into place, so `path` always holds either the previous or the new complete file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            np.savez(file, **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        remove(temporary)
+        raise
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Checkpoint:
+    """
+    Periodic snapshot of a running simulation in one `.npz` file, for `engine.simulate_stats` and
+    `engine.simulate_ensemble`.
+
+    A snapshot holds the state of the random generator, the arrays of the run (bankrolls, peaks,
+    drawdowns, bands, ...) and its `stats.RunningStats`, all taken between two blocks, so a run
+    resumed from it draws exactly the numbers the interrupted run would have drawn next. Snapshots
+    are written atomically (see `save_npz_atomic`) at most every `interval` seconds.
+
+    :param path: File of the snapshot.
+    :param key: Identifies the run, e.g. a `cache.cache_key` of its parameters. Loading the
+                snapshot of another run raises a ValueError rather than mixing two runs.
+    :param interval: Minimum number of seconds between two snapshots.
+    :param on_save: Optional callable run after every snapshot.
+    """
+
+    def __init__(self, path, key, interval=DEFAULT_INTERVAL, on_save=None):
+        self.path = path
+        self.key = key
+        self.interval = interval
+        self.on_save = on_save
+        self.saves = 0
+        self.last_save = time.monotonic()
+
+    def due(self):
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, rng, arrays, stats=None):
+        """
+        Save the state of `rng` (None for a run without one, e.g. a backtest), a dictionary of
+        arrays and optional running statistics.
+        """
+        state = {"key": np.array(self.key)}
+        if rng is not None:
+            state["rng"] = np.array(json.dumps(rng.bit_generator.state))
+        state.update(arrays)
+        if stats is not None:
+            state.update(stats_arrays(stats, "stats_"))
+        save_npz_atomic(self.path, state)
+        self.saves += 1
+        self.last_save = time.monotonic()
+        if self.on_save is not None:
+            self.on_save()
+
+    def load(self, rng):
+        """
+        Restore the state of `rng` (if not None) from the snapshot.
+
+        :return: A tuple (dictionary of arrays, `RunningStats` or None), or None without a snapshot.
+        """
+        try:
+            with np.load(self.path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            # Snapshots are replaced atomically, so this is not one; start again
+            return None
+
+        if str(arrays.pop("key")) != self.key:
+            raise ValueError(f"{self.path} is the checkpoint of another run")
+        if rng is not None:
+            state = json.loads(str(arrays.pop("rng")))
+            if state["bit_generator"] != type(rng.bit_generator).__name__:
+                raise ValueError(f"{self.path} was saved by a {state['bit_generator']} generator")
+            rng.bit_generator.state = state
+
+        stats = stats_from_arrays(arrays, "stats_") if "stats_count" in arrays else None
+        return {name: value for name, value in arrays.items() if not name.startswith("stats_")}, stats
+
+    def remove(self):
+        remove(self.path)
+
+
+def run_key(kind, **parameters):
+    """
+    Key of the `Checkpoint` of a run, from the same description as its `cache.cache_key`.
+    """
+    return cache_key(f"checkpoint-{kind}", **parameters)
+
+
+def shard_sizes(number_of_paths, shards):
+    """
+    Split `number_of_paths` into `shards` consecutive path ranges of (almost) equal size.
+    """
+    return [len(part) for part in np.array_split(np.arange(number_of_paths), shards)]
+
+
+class ShardedJob:
+    """
+    A job split into shards that any number of worker processes, on this machine or on others
+    sharing the directory, run independently and that are merged at the end.
+
+    The directory is the only coordinator. `job.json` describes the job; a worker takes a shard
+    by creating its `.lock` file with `O_EXCL`, so no two workers can hold it, keeps the lock
+    fresh from a background thread (see `keep_alive`), and publishes the shard by renaming its
+    `.npz` result into place. A shard whose lock has not been refreshed for `stale_seconds` is
+    taken over by the next worker, which resumes it from its last checkpoint. Every shard has its own seed spawned from
+    the seed of the job, so the merged result does not depend on which worker ran which shard.
+
+    Open an existing job with `ShardedJob(directory)`, or create one with `ShardedJob.create`.
+    """
+
+    def __init__(self, directory, stale_seconds=STALE_SECONDS):
+        self.directory = directory
+        self.stale_seconds = stale_seconds
+        with open(os.path.join(directory, JOB_FILE)) as file:
+            self.description = json.load(file)
+
+    @classmethod
+    def create(cls, directory, kind, shards, seed=None, stale_seconds=STALE_SECONDS, **parameters):
+        """
+        Create the job in `directory`, or open it if the same job is already there.
+
+        :param kind: "ensemble" (shards are ranges of paths) or "sweep" (shards are grid cells).
+        :param shards: Number of shards.
+        :param seed: Root seed of the job; without one, a job created here draws a random seed
+                     and a job already in `directory` keeps its own.
+        :param parameters: JSON-serializable parameters of the job (see `ensemble_job` and `sweep_job`).
+        :raise ValueError: If `directory` holds a different job.
+        """
+        description = {"kind": kind, "engine_version": ENGINE_VERSION, "shards": shards, "seed": seed,
+                       "parameters": parameters}
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, JOB_FILE)
+        if not os.path.exists(path):
+            descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(dict(description, entropy=np.random.SeedSequence(seed).entropy), file, indent=2)
+            try:
+                # Unlike a rename, a link fails if another process created the job first
+                os.link(temporary, path)
+            except FileExistsError:
+                pass
+            finally:
+                remove(temporary)
+
+        job = cls(directory, stale_seconds)
+        existing = {name: value for name, value in job.description.items() if name != "entropy"}
+        if seed is None:
+            existing["seed"] = None
+        if existing != json.loads(json.dumps(description)):
+            raise ValueError(f"{directory} holds another job")
+        return job
+
+    @property
+    def kind(self):
+        return self.description["kind"]
+
+    @property
+    def shards(self):
+        return self.description["shards"]
+
+    @property
+    def parameters(self):
+        return self.description["parameters"]
+
+    def shard_seed(self, index):
+        return np.random.SeedSequence(self.description["entropy"]).spawn(self.shards)[index]
+
+    def shard_path(self, index, suffix):
+        return os.path.join(self.directory, f"shard-{index:05d}{suffix}")
+
+    def is_done(self, index):
+        return os.path.exists(self.shard_path(index, ".npz"))
+
+    def pending(self):
+        return [index for index in range(self.shards) if not self.is_done(index)]
+
+    def lock(self, index):
+        """
+        Try to take shard `index`, taking over a stale lock.
+
+        To take over, a worker first hard links the stale lock to a name made of its inode and
+        modification time. The link fails for every other worker taking over the same lock, and
+        the linked file shows whether the lock was replaced or refreshed since it was found stale,
+        so a lock that another worker has just recreated is never removed.
+
+        :return: True if this process now holds the shard.
+        """
+        path = self.shard_path(index, ".lock")
+        for _ in range(2):
+            try:
+                descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    found = os.stat(path)
+                    if time.time() - found.st_mtime <= self.stale_seconds:
+                        return False
+                    identity = (found.st_ino, found.st_mtime_ns)
+                    stale = f"{path}.{found.st_ino}-{found.st_mtime_ns}.stale"
+                    os.link(path, stale)
+                    try:
+                        linked = os.stat(stale)
+                        if (linked.st_ino, linked.st_mtime_ns) != identity:
+                            return False
+                        current = os.stat(path)
+                        if (current.st_ino, current.st_mtime_ns) == identity:
+                            os.remove(path)
+                    finally:
+                        remove(stale)
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    # Including FileExistsError: another worker is taking the lock over
+                    return False
+                continue
+            with os.fdopen(descriptor, "w") as file:
+                json.dump({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}, file)
+            return True
+        return False
+
+    def claim(self):
+        """
+        Take the first shard that is neither done nor held by a live worker.
+
+        :return: Its index, or None when there is none left.
+        """
+        for index in self.pending():
+            if self.lock(index):
+                if not self.is_done(index):
+                    return index
+                self.release(index)
+        return None
+
+    def heartbeat(self, index):
+        try:
+            os.utime(self.shard_path(index, ".lock"))
+        except FileNotFoundError:
+            pass
+
+    def keep_alive(self, index):
+        """
+        Refresh the lock of shard `index` from a background thread four times per `stale_seconds`,
+        whatever the checkpoint interval and also while an adaptive cell, which has no checkpoint,
+        runs its batches.
+
+        :return: A callable that stops the thread.
+        """
+        stopping = threading.Event()
+
+        def run():
+            while not stopping.wait(self.stale_seconds / 4):
+                self.heartbeat(index)
+
+        thread = threading.Thread(target=run, name=f"Heartbeat-{index}", daemon=True)
+        thread.start()
+
+        def stop():
+            stopping.set()
+            thread.join()
+
+        return stop
+
+    def release(self, index):
+        remove(self.shard_path(index, ".lock"))
+
+    def checkpoint(self, index, interval=DEFAULT_INTERVAL):
+        """
+        The `Checkpoint` of shard `index`, which also refreshes its lock.
+        """
+        key = cache_key("shard", job=self.description, index=index)
+        return Checkpoint(self.shard_path(index, ".checkpoint.npz"), key, interval,
+                          on_save=lambda: self.heartbeat(index))
+
+    def complete(self, index, arrays):
+        """
+        Publish the result of shard `index` and drop its checkpoint and lock.
+        """
+        save_npz_atomic(self.shard_path(index, ".npz"), arrays)
+        remove(self.shard_path(index, ".checkpoint.npz"))
+        self.release(index)
+
+    def results(self):
+        """
+        :return: The arrays of every shard, in shard order.
+        :raise ValueError: If a shard is not done yet.
+        """
+        pending = self.pending()
+        if pending:
+            raise ValueError(f"{len(pending)} of {self.shards} shards are not done yet")
+        results = []
+        for index in range(self.shards):
+            with np.load(self.shard_path(index, ".npz")) as data:
+                results.append({name: data[name] for name in data.files})
+        return results
+
+    def status(self):
+        """
+        :return: A dictionary with the number of "done", "running" (locked) and "waiting" shards.
+        """
+        done = self.shards - len(self.pending())
+        running = sum(os.path.exists(self.shard_path(index, ".lock")) for index in self.pending())
+        return {"done": done, "running": running, "waiting": self.shards - done - running}
+
+
+def ensemble_job(directory, bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                 number_of_paths, shards, seed=None, block_size=DEFAULT_BLOCK_SIZE, staking="kelly"):
+    """
+    Create or open a `ShardedJob` running `engine.simulate_ensemble` over `shards` ranges of paths.
+    Percentile bands cannot be merged across shards and are not recorded.
+    """
+    return ShardedJob.create(directory, "ensemble", shards, seed, bankroll=bankroll,
+                             number_of_variants=number_of_variants, kelly_fraction=kelly_fraction,
+                             number_of_bets=number_of_bets, inflated_probability=inflated_probability,
+                             number_of_paths=number_of_paths, block_size=block_size, staking=staking)
+
+
+def sweep_job(directory, kelly_fractions, inflated_probabilities, variants, bankroll, number_of_bets,
+              number_of_paths, seed=None, targets=None):
+    """
+    Create or open a `ShardedJob` running a `sweep.run_sweep` grid with one shard per cell. Cells
+    get the seeds of `sweep.sweep_grid`, so the merged rows are those of `run_sweep` with the same seed.
+    """
+    shards = len(kelly_fractions) * len(inflated_probabilities) * len(variants)
+    return ShardedJob.create(directory, "sweep", shards, seed, kelly_fractions=kelly_fractions,
+                             inflated_probabilities=inflated_probabilities, variants=variants, bankroll=bankroll,
+                             number_of_bets=number_of_bets, number_of_paths=number_of_paths, targets=targets)
+
+
+def run_shard(job, index, interval=DEFAULT_INTERVAL, should_stop=None):
+    """
+    Run shard `index` of a job held by this process, resuming from its checkpoint, and publish it.
+
+    :return: True if the shard is done, False if `should_stop` interrupted it.
+    """
+    from sweep import COLUMNS, run_cell, sweep_grid
+
+    parameters = job.parameters
+    checkpoint = job.checkpoint(index, interval)
+    if job.kind == "ensemble":
+        ensemble = simulate_ensemble(
+            parameters["bankroll"], parameters["number_of_variants"], parameters["kelly_fraction"],
+            parameters["number_of_bets"], parameters["inflated_probability"],
+            shard_sizes(parameters["number_of_paths"], job.shards)[index], seed=job.shard_seed(index),
+            percentiles=(), block_size=parameters["block_size"], should_stop=should_stop,
+            staking=parameters["staking"], checkpoint=checkpoint
+        )
+        if ensemble is None:
+            return False
+        arrays = {"final_bankroll": ensemble.final_bankroll, "max_drawdown": ensemble.max_drawdown,
+                  "ruined": ensemble.ruined}
+    elif job.kind == "sweep":
+        cell = sweep_grid(parameters["kelly_fractions"], parameters["inflated_probabilities"],
+                          parameters["variants"], job.description["entropy"])[index]
+        row = run_cell(cell, parameters["bankroll"], parameters["number_of_bets"], parameters["number_of_paths"],
+                       targets=parameters["targets"], checkpoint=checkpoint)
+        arrays = {name: np.asarray(row[name]) for name in COLUMNS}
+    else:
+        raise ValueError(f"Unknown job kind: {job.kind}")
+
+    job.complete(index, arrays)
+    return True
+
+
+def work(directory, interval=DEFAULT_INTERVAL, should_stop=None, stale_seconds=STALE_SECONDS):
+    """
+    Run shards of the job in `directory` until none is left. An interrupted shard keeps its
+    checkpoint and is released, so the next worker resumes it.
+
+    :return: The number of shards this worker completed.
+    """
+    job = ShardedJob(directory, stale_seconds)
+    completed = 0
+    while (index := job.claim()) is not None:
+        stop_heartbeat = job.keep_alive(index)
+        try:
+            if not run_shard(job, index, interval, should_stop):
+                job.release(index)
+                break
+        except BaseException:
+            job.release(index)
+            raise
+        finally:
+            stop_heartbeat()
+        completed += 1
+    return completed
+
+
+def run_workers(directory, workers=1, interval=DEFAULT_INTERVAL):
+    """
+    Run `workers` local worker processes on the job in `directory` (in this process for one).
+
+    :return: The number of shards they completed.
+    """
+    if workers <= 1:
+        return work(directory, interval)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(work, [directory] * workers, [interval] * workers))
+
+
+def merge_ensemble(job):
+    """
+    Concatenate the paths of every shard of an ensemble job into one `engine.EnsembleResult`
+    (without percentile bands).
+    """
+    results = job.results()
+    return EnsembleResult(
+        percentiles=(),
+        bands=np.empty((0, job.parameters["number_of_bets"] + 1)),
+        final_bankroll=np.concatenate([result["final_bankroll"] for result in results]),
+        max_drawdown=np.concatenate([result["max_drawdown"] for result in results]),
+        ruined=np.concatenate([result["ruined"] for result in results]),
+    )
+
+
+def merge_sweep(job):
+    """
+    :return: The rows of every cell of a sweep job, in the format of `sweep.run_sweep`.
+    """
+    return [{name: value.item() for name, value in result.items()} for result in job.results()]
+
+
+def merge(directory, output=None, npz_output=None):
+    """
+    Merge a finished job. Ensembles are written to the `.npz` file `output`; sweeps are written to
+    the CSV file `output` and optionally to `npz_output`, as by `sweep.run_sweep`.
+
+    :return: The merged `EnsembleResult` or list of sweep rows.
+    """
+    from sweep import COLUMNS, save_npz
+
+    job = ShardedJob(directory)
+    if job.kind == "ensemble":
+        ensemble = merge_ensemble(job)
+        if output:
+            save_npz_atomic(output, {"final_bankroll": ensemble.final_bankroll,
+                                     "max_drawdown": ensemble.max_drawdown, "ruined": ensemble.ruined})
+        return ensemble
+
+    rows = merge_sweep(job)
+    if output:
+        with open(output, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    if npz_output:
+        save_npz(rows, npz_output)
+    return rows
+
+
+def print_ensemble(ensemble):
+    print(f"Paths: {len(ensemble.final_bankroll)}")
+    print(f"Ruin probability: {ensemble.ruin_probability * 100:.2f}%")
+    for percentile, value in zip((5, 25, 50, 75, 95), np.percentile(ensemble.final_bankroll, [5, 25, 50, 75, 95])):
+        print(f"P{percentile} final bankroll: ${value:.2f}")
+    print(f"Median max drawdown: {np.median(ensemble.max_drawdown) * 100:.2f}%")
+
+
+def main(argv=None):
+    from sweep import add_target_arguments, adaptive_targets, check_target_arguments, parse_range
+
+    parser = argparse.ArgumentParser(
+        prog="python -m checkpoint",
+        description="Run ensembles and sweeps as resumable shards that any number of workers share through a directory."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_work_arguments(command):
+        command.add_argument("job", help="Job directory, shared by all workers.")
+        command.add_argument("--workers", type=int, default=1, help="Number of local worker processes.")
+        command.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                             help="Seconds between two checkpoints of a shard.")
+
+    ensemble_parser = commands.add_parser("ensemble", help="Create or join a sharded ensemble and work on it.")
+    add_work_arguments(ensemble_parser)
+    ensemble_parser.add_argument("--bankroll", type=float, default=1000, help="Starting bankroll.")
+    ensemble_parser.add_argument("--variants", type=int, default=3, help="Number of play variants per market.")
+    ensemble_parser.add_argument("--kelly", type=float, default=50, help="Percentage of Kelly to bet (10 - 100).")
+    ensemble_parser.add_argument("--bets", type=int, default=1000, help="Number of bets per path.")
+    ensemble_parser.add_argument("--inflated", type=int, default=5, help="Inflated probability of the value bet.")
+    ensemble_parser.add_argument("--staking", choices=STAKING_MODES, default="kelly", help="Staking of every market.")
+    ensemble_parser.add_argument("--paths", type=int, default=10000, help="Total number of paths.")
+    ensemble_parser.add_argument("--shards", type=int, default=16, help="Number of shards of the paths.")
+    ensemble_parser.add_argument("--seed", type=int, default=None, help="Root seed of the job.")
+    ensemble_parser.add_argument("--output", default=None, help="NPZ file of the merged paths.")
+
+    sweep_parser = commands.add_parser("sweep", help="Create or join a sweep with one shard per cell and work on it.")
+    add_work_arguments(sweep_parser)
+    sweep_parser.add_argument("--bankroll", type=float, default=1000, help="Starting bankroll of every path.")
+    sweep_parser.add_argument("--bets", type=int, default=1000, help="Number of bets per path.")
+    sweep_parser.add_argument("--paths", type=int, default=1000, help="Number of paths per grid cell.")
+    sweep_parser.add_argument("--kelly", default="10:100:10", help="Kelly percentages, e.g. 10:100:10 or 25,50.")
+    sweep_parser.add_argument("--inflated", default="1:10:1", help="Inflated probabilities, e.g. 1:10:1 or 5,10.")
+    sweep_parser.add_argument("--variants", default="3", help="Numbers of variants, e.g. 3,5,10.")
+    sweep_parser.add_argument("--seed", type=int, default=None, help="Root seed of the sweep.")
+    sweep_parser.add_argument("--output", default="sweep.csv", help="CSV file of the merged rows.")
+    sweep_parser.add_argument("--npz", default=None, help="Optional NPZ copy of the merged rows.")
+    add_target_arguments(sweep_parser)
+
+    work_parser = commands.add_parser("work", help="Work on an existing job, e.g. from another machine.")
+    add_work_arguments(work_parser)
+
+    status_parser = commands.add_parser("status", help="Show the progress of a job.")
+    status_parser.add_argument("job", help="Job directory.")
+
+    merge_parser = commands.add_parser("merge", help="Merge a finished job.")
+    merge_parser.add_argument("job", help="Job directory.")
+    merge_parser.add_argument("--output", default=None, help="NPZ file (ensembles) or CSV file (sweeps).")
+    merge_parser.add_argument("--npz", default=None, help="Optional NPZ copy of the rows of a sweep.")
+    args = parser.parse_args(argv)
+    if args.command == "sweep":
+        check_target_arguments(parser, args)
+
+    try:
+        if args.command == "ensemble":
+            ensemble_job(args.job, args.bankroll, args.variants, args.kelly / 100, args.bets, args.inflated,
+                         args.paths, args.shards, args.seed, staking=args.staking)
+        elif args.command == "sweep":
+            sweep_job(args.job, [value / 100 for value in parse_range(args.kelly)],
+                      parse_range(args.inflated, int), parse_range(args.variants, int), args.bankroll, args.bets,
+                      args.paths, args.seed, adaptive_targets(args))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.command in ("ensemble", "sweep", "work"):
+        try:
+            completed = run_workers(args.job, args.workers, args.interval)
+        except KeyboardInterrupt:
+            print(f"Interrupted. Run python -m checkpoint work {args.job} to resume from the last checkpoints.")
+            return 1
+        print(f"{completed} shards completed by this run")
+
+    job = ShardedJob(args.job)
+    status = job.status()
+    if status["done"] < job.shards:
+        print(f"{status['done']} of {job.shards} shards done, {status['running']} running")
+        return 0 if args.command != "merge" else 1
+
+    output = getattr(args, "output", None)
+    result = merge(args.job, output, getattr(args, "npz", None))
+    if job.kind == "ensemble":
+        print_ensemble(result)
+    else:
+        print(f"{len(result)} cells merged")
+    if output:
+        print(f"Merged results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,341 @@
+import argparse
+import sys
+
+# NumPy, the engine, Matplotlib and Qt are imported inside the commands that need them, so that
+# `python -m cli --help` and importing this module stay fast.
+
+
+def add_market_arguments(parser):
+    parser.add_argument("--bankroll", type=float, default=1000, help="Starting bankroll.")
+    parser.add_argument("--variants", type=int, default=3, help="Number of play variants per market.")
+    parser.add_argument("--kelly", type=float, default=50, help="Percentage of Kelly to bet (10 - 100).")
+    parser.add_argument("--bets", type=int, default=1000, help="Number of bets to simulate.")
+    parser.add_argument("--inflated", type=int, default=5, help="Inflated probability of the value bet (1 - 100).")
+    parser.add_argument("--staking", choices=("kelly", "simultaneous"), default="kelly",
+                        help="Bet on the first value bet, or on every value outcome (simultaneous Kelly).")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for a reproducible run.")
+    parser.add_argument("--plot", action="store_true", help="Show the results in a Matplotlib window.")
+    parser.add_argument("--cache-dir", default="simulation_cache", help="Cache of the results of seeded runs.")
+    parser.add_argument("--no-cache", action="store_true", help="Always recompute seeded runs.")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="Write a JSON report of the time spent per stage to FILE ('-' prints a summary instead).")
+    parser.add_argument("--profile-memory", action="store_true", help="Also trace the memory allocated per stage.")
+    parser.add_argument("--profile-sample", type=float, default=None, metavar="SECONDS",
+                        help="Also sample the stack every SECONDS to find the hottest functions.")
+    parser.add_argument("--checkpoint", default=None, metavar="FILE",
+                        help="Save the run to FILE every --checkpoint-interval seconds and resume from it.")
+    parser.add_argument("--checkpoint-interval", type=float, default=60, metavar="SECONDS",
+                        help="Seconds between two checkpoints.")
+
+
+def check_market_arguments(parser, args):
+    if args.bankroll <= 0:
+        parser.error("Bankroll must be a positive value.")
+    if args.variants < 1 or args.bets < 0:
+        parser.error("The number of variants and bets must be positive.")
+    if not 10 <= args.kelly <= 100:
+        parser.error("Kelly percentage must be between 10 and 100.")
+    if not 1 <= args.inflated <= 100:
+        parser.error("Inflated probability must be between 1 and 100.")
+
+
+def make_cache(args):
+    """
+    Return the `cache.ResultCache` of seeded runs, or None with --no-cache.
+    """
+    from cache import ResultCache
+
+    return None if args.no_cache else ResultCache(args.cache_dir)
+
+
+def make_profiler(args):
+    """
+    Return a started `profiling.Profiler` if --profile was given, otherwise the disabled profiler.
+    """
+    from profiling import NULL_PROFILER, Profiler, StackSampler
+
+    if args.profile is None:
+        return NULL_PROFILER
+    hooks = [StackSampler(args.profile_sample)] if args.profile_sample else []
+    return Profiler(memory=args.profile_memory, hooks=hooks).start()
+
+
+def make_checkpoint(args):
+    """
+    Return the `checkpoint.Checkpoint` of the run described by the arguments, or None without --checkpoint.
+    """
+    if args.checkpoint is None:
+        return None
+    from checkpoint import Checkpoint, run_key
+
+    names = ("bankroll", "variants", "kelly", "bets", "inflated", "staking", "seed", "paths")
+    key = run_key(args.command, **{name: getattr(args, name) for name in names if hasattr(args, name)})
+    return Checkpoint(args.checkpoint, key, args.checkpoint_interval)
+
+
+def run_checkpointed(checkpoint, run, *args, **kwargs):
+    """
+    Call `run`, passing the checkpoint on if there is one, and delete the checkpoint once it finishes.
+    """
+    if checkpoint is None:
+        return run(*args, **kwargs)
+    try:
+        result = run(*args, checkpoint=checkpoint, **kwargs)
+    except KeyboardInterrupt:
+        print(f"Interrupted. Run the same command again to resume from {checkpoint.path}.")
+        raise SystemExit(1)
+    checkpoint.remove()
+    return result
+
+
+def run_simulate(args):
+    """
+    Run a single simulation. Without --plot, --ledger or --log nothing but the running statistics
+    is kept, so the number of bets is only limited by time; seeded runs of this kind are looked up
+    in the cache first.
+    """
+    import logging
+    import numpy as np
+    from engine import configure_logging, log_block, simulate_blocks, simulate_stats
+    from profiling import write_profile
+    from stats import RunningStats
+
+    parameters = (args.bankroll, args.variants, args.kelly / 100, args.bets, args.inflated)
+    if args.log:
+        configure_logging(args.log)
+        logging.info("Simulation started.")
+    profiler = make_profiler(args)
+
+    cache = make_cache(args)
+    if not (args.plot or args.ledger or args.log):
+        run = simulate_stats if cache is None else cache.simulate_stats
+        stats = run_checkpointed(make_checkpoint(args), run, *parameters, seed=args.seed, staking=args.staking,
+                                 profiler=profiler)
+        final_bankroll = 0.0 if stats.ruined else args.bankroll * np.exp(stats.log_change)
+        print_summary(args.bankroll, final_bankroll, stats)
+        write_profile(profiler, args.profile)
+        return 0
+
+    from ledger import TradeLedger
+    from history import History
+
+    stats = RunningStats()
+    history = None
+    if args.plot:
+        history = History(args.bets, args.bankroll, dtype=np.float32 if args.float32 else np.float64,
+                          retention=args.history, points=args.history_points)
+    final_bankroll = float(args.bankroll)
+    ledger = TradeLedger(args.ledger) if args.ledger else None
+    try:
+        for block in simulate_blocks(*parameters, seed=args.seed, record_bets=bool(args.ledger or args.log),
+                                     staking=args.staking, profiler=profiler):
+            with profiler.stage("statistics"):
+                stats.update(block.start, block.bankroll, block.wins, block.ruined)
+            if ledger is not None:
+                with profiler.stage("ledger"):
+                    ledger.append_block(block)
+            if args.log:
+                with profiler.stage("logging"):
+                    log_block(block, args.kelly / 100, args.log_every)
+            if history is not None:
+                history.append(block.bankroll, block.wins)
+            if len(block.bankroll):
+                final_bankroll = float(block.bankroll[-1])
+            if block.ruined:
+                final_bankroll = 0.0
+    finally:
+        if ledger is not None:
+            ledger.close()
+
+    if args.log:
+        logging.info(f"Simulation ended. Final bankroll: ${round(final_bankroll, 2)}")
+    print_summary(args.bankroll, final_bankroll, stats)
+    if args.plot:
+        with profiler.stage("plotting"):
+            plot_history(history, stats, show=not profiler.enabled)
+    write_profile(profiler, args.profile)
+    if args.plot and profiler.enabled:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return 0
+
+
+def print_summary(initial_bankroll, final_bankroll, stats):
+    print(f"Initial bankroll: ${initial_bankroll:.2f}")
+    print(f"Final bankroll: ${final_bankroll:.2f}")
+    print(f"Bets placed: {stats.count} (wins: {stats.wins}, losses: {stats.losses})")
+    print(f"Win rate: {stats.win_rate * 100:.2f}%")
+    print(f"Max drawdown: {stats.max_drawdown * 100:.2f}%")
+    print(f"Longest losing streak: {stats.longest_losing_streak}")
+    print(f"Log growth per bet: {stats.log_growth_mean:.6g} (variance {stats.log_growth_variance:.6g})")
+    if stats.ruined:
+        print("You run out of money")
+
+
+def plot_history(history, stats, show=True):
+    import matplotlib.pyplot as plt
+    from decimate import minmax_decimate
+
+    index, bankroll = minmax_decimate(history.bankroll, len(history.bankroll) / 2000)
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.plot(history.bet_number(index), bankroll, color="blue", label="Bankroll")
+    ax.set_title(f"Bankroll Evolution Over Time (max drawdown {stats.max_drawdown * 100:.2f}%)")
+    ax.set_xlabel("Number of Bets")
+    ax.set_ylabel("Bankroll ($)")
+    ax.grid(True)
+    ax.legend()
+    if show:
+        plt.show()
+
+
+def run_ensemble(args):
+    """
+    Run a Monte Carlo ensemble and print the distribution of the final bankroll. Seeded ensembles
+    are looked up in the cache first.
+    """
+    import numpy as np
+    from engine import simulate_ensemble
+    from profiling import write_profile
+
+    profiler = make_profiler(args)
+    cache = make_cache(args)
+    run = simulate_ensemble if cache is None else cache.simulate_ensemble
+    ensemble = run_checkpointed(make_checkpoint(args), run, args.bankroll, args.variants, args.kelly / 100, args.bets,
+                                args.inflated, args.paths, seed=args.seed, staking=args.staking, profiler=profiler)
+
+    print(f"Paths: {len(ensemble.final_bankroll)}")
+    print(f"Ruin probability: {ensemble.ruin_probability * 100:.2f}%")
+    for percentile, value in zip(ensemble.percentiles, ensemble.bands[:, -1]):
+        print(f"P{percentile} final bankroll: ${value:.2f}")
+    print(f"Median max drawdown: {np.median(ensemble.max_drawdown) * 100:.2f}%")
+    write_profile(profiler, args.profile)
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(8, 4))
+        steps = np.arange(ensemble.bands.shape[1])
+        for band in ensemble.bands:
+            ax.plot(steps, band, color="blue", alpha=0.6)
+        ax.set_yscale("symlog")
+        ax.set_title("Bankroll Percentiles Over Time")
+        ax.set_xlabel("Number of Bets")
+        ax.set_ylabel("Bankroll ($)")
+        ax.grid(True)
+        plt.show()
+    return 0
+
+
+def run_adaptive(args):
+    """
+    Run a Monte Carlo ensemble until its confidence intervals are narrow enough and print the
+    estimates with the number of paths they needed.
+    """
+    import numpy as np
+    from adaptive import simulate_adaptive
+    from profiling import write_profile
+
+    profiler = make_profiler(args)
+    result = simulate_adaptive(
+        args.bankroll, args.variants, args.kelly / 100, args.bets, args.inflated, seed=args.seed,
+        ruin_width=args.ruin_width, median_width=args.median_width, log_growth_width=args.log_growth_width,
+        confidence=args.confidence, min_paths=min(100, args.paths), max_paths=args.paths, staking=args.staking,
+        profiler=profiler, cache=make_cache(args)
+    )
+
+    status = "targets met" if result.converged else "maximum reached, targets not met"
+    print(f"Paths: {result.number_of_paths} in {result.batches} batches ({status})")
+    confidence = f"{args.confidence * 100:g}%"
+    ruin = result.estimates["ruin_probability"]
+    print(f"Ruin probability: {ruin.value * 100:.2f}% ({confidence} CI {ruin.lower * 100:.2f}% - {ruin.upper * 100:.2f}%)")
+    median = result.estimates["median_final_bankroll"]
+    print(f"Median final bankroll: ${median.value:.2f} ({confidence} CI ${median.lower:.2f} - ${median.upper:.2f})")
+    growth = result.estimates["log_growth"]
+    print(f"Expected log growth: {growth.value:.6g} ({confidence} CI {growth.lower:.6g} - {growth.upper:.6g})")
+    print(f"Median max drawdown: {np.median(result.max_drawdown) * 100:.2f}%")
+    write_profile(profiler, args.profile)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m cli", description="Run betting simulations without the graphical interface."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    simulate_parser = commands.add_parser("simulate", help="Run a single simulation.")
+    add_market_arguments(simulate_parser)
+    simulate_parser.add_argument("--ledger", default=None, help="Directory of a binary trade ledger to write.")
+    simulate_parser.add_argument("--log", default=None, help="Text log file of the bets (e.g. betting_log.txt).")
+    simulate_parser.add_argument("--log-every", type=int, default=1, help="Only log one bet in this many.")
+    simulate_parser.add_argument("--history", choices=("full", "stride", "ring"), default="full",
+                                 help="Bankrolls kept for --plot: every one, every n-th one or the latest ones.")
+    simulate_parser.add_argument("--history-points", type=int, default=1000000,
+                                 help="Number of bankrolls kept by --history stride and ring.")
+    simulate_parser.add_argument("--float32", action="store_true",
+                                 help="Keep the plotted bankrolls in single precision, in half the memory.")
+
+    ensemble_parser = commands.add_parser("ensemble", help="Run many independent paths at once.")
+    add_market_arguments(ensemble_parser)
+    ensemble_parser.add_argument("--paths", type=int, default=1000,
+                                 help="Number of paths (the maximum with --adaptive).")
+
+    commands.add_parser("sweep", help="Run a parameter sweep (see python -m cli sweep --help).", add_help=False)
+    commands.add_parser("backtest", help="Run the staking on recorded markets (see python -m cli backtest --help).",
+                        add_help=False)
+    commands.add_parser("compare", help="Compare staking strategies on shared markets "
+                                        "(see python -m cli compare --help).", add_help=False)
+    commands.add_parser("analytic", help="Compute the bankroll distribution without simulating "
+                                         "(see python -m cli analytic --help).", add_help=False)
+    commands.add_parser("job", help="Run sharded, resumable ensembles and sweeps "
+                                    "(see python -m cli job --help).", add_help=False)
+    commands.add_parser("logs", help="Index and analyze betting logs (see python -m cli logs --help).",
+                        add_help=False)
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["ensemble"]:
+        # The --adaptive targets of the sweeps; imported here only, since sweep imports NumPy
+        from sweep import add_target_arguments, check_target_arguments
+        add_target_arguments(ensemble_parser)
+    if argv[:1] == ["sweep"]:
+        from sweep import main as sweep_main
+        return sweep_main(argv[1:])
+    if argv[:1] == ["backtest"]:
+        from backtest import main as backtest_main
+        return backtest_main(argv[1:])
+    if argv[:1] == ["compare"]:
+        from strategies import main as strategies_main
+        return strategies_main(argv[1:])
+    if argv[:1] == ["analytic"]:
+        from analytic import main as analytic_main
+        return analytic_main(argv[1:])
+    if argv[:1] == ["job"]:
+        from checkpoint import main as checkpoint_main
+        return checkpoint_main(argv[1:])
+    if argv[:1] == ["logs"]:
+        from logscan import main as logscan_main
+        return logscan_main(argv[1:])
+
+    args = parser.parse_args(argv)
+    check_market_arguments(parser, args)
+    if args.checkpoint and (getattr(args, "adaptive", False)
+                            or args.command == "simulate" and (args.plot or args.ledger or args.log)):
+        parser.error("--checkpoint cannot be combined with --adaptive, or with --plot, --ledger or --log of a simulation.")
+    if args.command == "simulate":
+        if args.history_points < 2:
+            parser.error("At least 2 history points must be kept.")
+        return run_simulate(args)
+    if args.paths < 1:
+        parser.error("The number of paths must be positive.")
+    check_target_arguments(parser, args)
+    if args.adaptive:
+        if args.plot:
+            parser.error("--plot draws percentile bands, which need a fixed number of paths.")
+        if args.paths < 2:
+            parser.error("With --adaptive the number of paths must be at least 2.")
+        return run_adaptive(args)
+    return run_ensemble(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
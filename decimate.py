@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def minmax_decimate(values, bucket_size, start=0, stop=None):
+    """
+    Reduce a series to the points needed to draw it at a given resolution: the minimum and the
+    maximum of every bucket of `bucket_size` consecutive values, in their original order, plus the
+    first and last value. Unlike taking every n-th value, no peak or trough is ever lost, so the
+    drawn line looks the same as the full series at one bucket per pixel.
+
+    :param values: The full series.
+    :param bucket_size: Number of consecutive values reduced to two points.
+    :param start: First index to include.
+    :param stop: Index after the last one to include (defaults to the end of the series).
+    :return: A tuple (index, values) of the kept points.
+    """
+    stop = len(values) if stop is None else min(stop, len(values))
+    start = max(0, min(start, stop))
+    count = stop - start
+    bucket_size = max(1, int(bucket_size))
+
+    if count <= 2 * bucket_size or bucket_size <= 2:
+        index = np.arange(start, stop)
+        return index, values[start:stop]
+
+    buckets = count // bucket_size
+    body = values[start:start + buckets * bucket_size].reshape(buckets, bucket_size)
+    low = body.argmin(axis=1)
+    high = body.argmax(axis=1)
+
+    offsets = np.arange(start, start + buckets * bucket_size, bucket_size)
+    index = np.empty((buckets, 2), dtype=np.intp)
+    np.add(offsets, np.minimum(low, high), out=index[:, 0])
+    np.add(offsets, np.maximum(low, high), out=index[:, 1])
+
+    index = index.ravel()
+    tail_start = start + buckets * bucket_size
+    if tail_start < stop:
+        tail = values[tail_start:stop]
+        index = np.concatenate((index, tail_start + np.sort([tail.argmin(), tail.argmax()])))
+    index = np.concatenate(([start], index, [stop - 1]))
+
+    return index, values[index]
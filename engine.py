@@ -0,0 +1,737 @@
+import logging
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+import numpy as np
+
+from market import variant_name
+from profiling import NULL_PROFILER
+from sampler import cumsum_variants, determine_winners
+from stats import RunningStats
+
+LOG_FILE = "betting_log.txt"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+DEFAULT_BLOCK_SIZE = 65536
+BOOKMAKER_MARGIN = 1.05
+STAKING_MODES = ("kelly", "simultaneous")
+# Part of the key of cached results (see cache.py): bump it whenever a seeded run gives different results
+ENGINE_VERSION = 1
+
+
+def configure_logging(filename=LOG_FILE):
+    """
+    Write the log of the simulations to `filename`, replacing its previous content. Only the entry
+    points (`interface.main`, `main.py` and `cli.py`) call this, so importing the library never
+    touches the log file.
+    """
+    logging.basicConfig(
+        filename=filename,
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        filemode="w"
+    )
+
+
+def first_true(mask):
+    """
+    Return the column index of the first True value of every row of a boolean matrix (0 for rows
+    without one). Equivalent to `mask.argmax(axis=1)` but runs as a single reduction, which is much
+    faster on the variant-major matrices used by the engine.
+    """
+    number_of_variants = mask.shape[1]
+    priority = np.arange(number_of_variants, 0, -1, dtype=np.int32)
+    first = number_of_variants - np.max(mask * priority, axis=1)
+
+    return np.where(first == number_of_variants, 0, first)
+
+
+def pick(matrix, columns):
+    """
+    Return `matrix[row, columns[row]]` for every row, indexing the flat variant-major buffer directly.
+    """
+    number_of_bets = matrix.shape[0]
+    index = columns * number_of_bets + np.arange(number_of_bets)
+    if matrix.flags.f_contiguous:
+        return matrix.ravel(order="F")[index]
+    return matrix.T[columns, np.arange(number_of_bets)]
+
+
+def generate_odds_matrix(rng, number_of_bets, number_of_variants, uniforms=None):
+    """
+    Generate the odds of `number_of_bets` markets at once, following the same model as
+    `functions_library.generate_odds`: a third of the variants are favourites, a third are
+    medium and the rest are outsiders, normalised with a 5% bookmaker margin.
+
+    :param rng: A `numpy.random.Generator`.
+    :param number_of_bets: Number of markets (rows) to generate.
+    :param number_of_variants: Number of variants (columns) in every market.
+    :param uniforms: Optional array of shape (number_of_variants, number_of_bets) of numbers in
+                     [0, 1) to use instead of drawing them from `rng` (see `analytic`).
+    :return: A float array of shape (number_of_bets, number_of_variants) with odds rounded to 2 decimals.
+    """
+    num_large_odds = number_of_variants // 3
+    num_medium_odds = number_of_variants // 3
+    num_small_odds = number_of_variants - num_large_odds - num_medium_odds
+
+    counts = [num_large_odds, num_medium_odds, num_small_odds]
+    low = np.repeat([0.5, 0.3, 0.1], counts)
+    width = np.repeat([0.1, 0.2, 0.2], counts)
+
+    # Variant-major (Fortran) layout keeps the per-market reductions over variants contiguous
+    if uniforms is None:
+        uniforms = rng.random((number_of_variants, number_of_bets))
+    else:
+        uniforms = np.array(uniforms, dtype=float)
+    probabilities = uniforms.T
+    probabilities *= width
+    probabilities += low
+    probabilities *= (BOOKMAKER_MARGIN / probabilities.sum(axis=1))[:, None]
+
+    odds = np.divide(1, probabilities, out=probabilities)
+    return np.round(odds, 2, out=odds)
+
+
+def value_bet_matrix(rng, odds, inflated_probability, columns=None):
+    """
+    Vectorized `functions_library.value_bet_generator`: convert every market's odds to implied
+    probabilities and inflate one randomly chosen variant per market.
+
+    :param rng: A `numpy.random.Generator`.
+    :param odds: Odds matrix of shape (N, K).
+    :param inflated_probability: Inflation in percentage points (1 - 100).
+    :param columns: Optional variant to inflate in every market, instead of drawing it from `rng`.
+    :return: A probability matrix of shape (N, K) rounded to 3 decimals.
+    """
+    number_of_bets, number_of_variants = odds.shape
+    probabilities = np.divide(1, odds, order="F")
+    np.round(probabilities, 3, out=probabilities)
+
+    if columns is None:
+        columns = rng.integers(number_of_variants, size=number_of_bets)
+    index = columns * number_of_bets + np.arange(number_of_bets)
+    flat = probabilities.ravel(order="F")
+    flat[index] = np.round(flat[index] + inflated_probability / 100, 3)
+
+    return probabilities
+
+
+def kelly_matrix(odds, probabilities):
+    """
+    Vectorized `functions_library.kelly_criterion`: pick the first variant of every market with a
+    positive Kelly percentage.
+
+    :param odds: Odds matrix of shape (N, K).
+    :param probabilities: Probability matrix of shape (N, K).
+    :return: A tuple (kelly, choice, has_bet) of arrays of length N. `kelly` and `choice` are only
+             meaningful where `has_bet` is True, i.e. where the market contains a value bet.
+    """
+    # Work on Kelly percentages scaled by 100: rounding to 2 decimals gives a positive value exactly
+    # when the scaled value exceeds 0.5, so only the chosen entries need to be rounded.
+    scaled = np.multiply(odds, probabilities, order="F")
+    scaled -= 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scaled /= odds - 1
+    scaled *= 100
+
+    choice = first_true(scaled > 0.5)
+    kelly = np.rint(pick(scaled, choice)) / 100
+
+    return kelly, choice, kelly > 0
+
+
+def simultaneous_kelly(odds, probabilities):
+    """
+    Growth-optimal stakes on every outcome of a block of mutually exclusive markets at once, with
+    the algorithm of Smoczynski and Tomkins (2010).
+
+    Outcomes are sorted by expected return `p * o` and added to the bet set while their expected
+    return exceeds the reserve rate `R = (1 - sum(p)) / (1 - sum(1 / o))` of the outcomes already
+    in it. Each outcome of the final set is staked `p - R / o`; the rest get nothing. Prefixes whose
+    `sum(1 / o)` reaches 1 are never added, which keeps the reserve rate positive.
+
+    :param odds: Odds matrix of shape (N, K).
+    :param probabilities: Probability matrix of shape (N, K). Every row must sum to at most 1; any
+                          remainder is the probability of an outcome that cannot be bet on.
+    :return: A stake matrix of shape (N, K) with the fraction of the bankroll to bet on every
+             outcome. A row of zeros means that the market has no value bet.
+    """
+    number_of_bets, number_of_variants = odds.shape
+    expected = np.multiply(odds, probabilities, order="F")
+    order = np.argsort(-expected, axis=1, kind="stable")
+
+    expected = np.take_along_axis(expected, order, axis=1)
+    probabilities = np.take_along_axis(probabilities, order, axis=1)
+    inverse_odds = 1 / np.take_along_axis(odds, order, axis=1)
+
+    # reserve[:, k] is the reserve rate R after betting on the first k sorted outcomes
+    reserve = np.ones((number_of_bets, number_of_variants + 1), order="F")
+    cumulative_inverse_odds = cumsum_variants(inverse_odds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        reserve[:, 1:] = (1 - cumsum_variants(probabilities)) / (1 - cumulative_inverse_odds)
+
+    include = (expected > reserve[:, :-1]) & (cumulative_inverse_odds < 1)
+    include = np.logical_and.accumulate(include, axis=1)
+    rate = pick(reserve, np.count_nonzero(include, axis=1))
+
+    sorted_stakes = probabilities - rate[:, None] * inverse_odds
+    sorted_stakes[~include] = 0
+    np.maximum(sorted_stakes, 0, out=sorted_stakes)
+
+    stakes = np.empty((number_of_bets, number_of_variants), order="F")
+    np.put_along_axis(stakes, order, sorted_stakes, axis=1)
+    return stakes
+
+
+def compound_bankroll(bankroll, growth, all_in_growth):
+    """
+    Apply a sequence of bet outcomes to a bankroll.
+
+    Every bet multiplies the bankroll by `growth[i]`, except when the bankroll before the bet is
+    at most $1, in which case the whole bankroll is staked (as in `Window.get_betting_data`) and
+    it is multiplied by `all_in_growth[i]`. The regular stretches are computed with `cumprod`
+    and only the all-in bets are handled one at a time.
+
+    :param bankroll: Bankroll before the first bet.
+    :param growth: Bankroll multiplier of every bet for a fractional stake.
+    :param all_in_growth: Bankroll multiplier of every bet when the whole bankroll is staked.
+    :return: A tuple (history, ruined). `history` holds the bankroll after every bet; when the
+             bankroll runs out it stops before the losing bet and `ruined` is True.
+    """
+    history = np.empty(len(growth))
+    start = 0
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        while start < len(growth):
+            path = bankroll * np.cumprod(growth[start:])
+            before = np.concatenate(([bankroll], path[:-1]))
+            events = np.flatnonzero((before <= 1) | (path <= 0))
+
+            if len(events) == 0:
+                history[start:] = path
+                return history, False
+
+            event = events[0]
+            history[start:start + event] = path[:event]
+
+            if before[event] <= 1:
+                bankroll = before[event] * all_in_growth[start + event]
+            else:
+                bankroll = path[event]
+            if bankroll <= 0:
+                return history[:start + event], True
+
+            history[start + event] = bankroll
+            start += event + 1
+
+    return history, False
+
+
+@dataclass
+class Bets:
+    """
+    The bet placed on every market of a block. Markets without a value bet have `has_bet` False,
+    a zero stake and growth multipliers of 1.
+    """
+    has_bet: np.ndarray
+    choice: np.ndarray
+    odds: np.ndarray
+    probability: np.ndarray
+    kelly: np.ndarray
+    stake_fraction: np.ndarray
+    winner: np.ndarray
+    wins: np.ndarray
+    growth: np.ndarray
+    all_in_growth: np.ndarray
+
+
+def draw_bets(rng, number_of_markets, number_of_variants, kelly_fraction, inflated_probability, staking="kelly",
+              profiler=NULL_PROFILER):
+    """
+    Generate a block of markets and place the bets of `Window.get_betting_data` on each one.
+
+    With `staking="kelly"` the first variant with a positive Kelly percentage is bet on, as in
+    `functions_library.kelly_criterion`. With `staking="simultaneous"` every outcome of the market
+    is staked according to `simultaneous_kelly`; `choice`, `odds` and `probability` then describe
+    the outcome with the largest stake, `kelly` is the total fraction staked at full Kelly and a bet
+    is won when one of the staked outcomes wins.
+
+    :param rng: A `numpy.random.Generator`.
+    :param number_of_markets: Number of markets to generate.
+    :param number_of_variants: Number of variants per market.
+    :param kelly_fraction: Fraction of the Kelly stake to bet (0.1 - 1).
+    :param inflated_probability: Inflation of the value bet in percentage points (1 - 100).
+    :param staking: "kelly" or "simultaneous".
+    :param profiler: A `profiling.Profiler` timing the "odds", "probabilities", "sampling" and
+                     "staking" stages.
+    :return: A `Bets` object with one entry per market.
+    """
+    if staking not in STAKING_MODES:
+        raise ValueError(f"Unknown staking mode: {staking}")
+
+    odds, probabilities, winner = draw_markets(rng, number_of_markets, number_of_variants, inflated_probability,
+                                               profiler)
+    with profiler.stage("staking"):
+        return place_bets(odds, probabilities, winner, kelly_fraction, staking)
+
+
+def draw_markets(rng, number_of_markets, number_of_variants, inflated_probability, profiler=NULL_PROFILER):
+    """
+    Generate a block of markets and their winners, without placing any bet. `draw_bets` and
+    `strategies.compare_strategies` draw their markets with it, so equal seeds give equal markets.
+
+    :return: A tuple (odds, probabilities, winner). See `draw_bets` for the parameters.
+    """
+    with profiler.stage("odds"):
+        odds = generate_odds_matrix(rng, number_of_markets, number_of_variants)
+    with profiler.stage("probabilities"):
+        probabilities = value_bet_matrix(rng, odds, inflated_probability)
+    with profiler.stage("sampling"):
+        winner = determine_winners(rng, probabilities)
+    return odds, probabilities, winner
+
+
+def place_bets(odds, probabilities, winner, kelly_fraction, staking="kelly"):
+    """
+    Place the bets of `draw_bets` on given markets with known winners, either generated by
+    `draw_bets` or recorded (see `backtest`).
+
+    :param odds: Odds matrix of shape (N, K).
+    :param probabilities: Probability matrix of shape (N, K) used for the stakes.
+    :param winner: Index of the winning variant of every market.
+    :return: A `Bets` object with one entry per market. See `draw_bets` for the other parameters.
+    """
+    if staking == "simultaneous":
+        # Winners are drawn from the normalised probabilities, so the stakes are optimised for those
+        stakes = simultaneous_kelly(odds, probabilities / probabilities.sum(axis=1)[:, None])
+        kelly = stakes.sum(axis=1)
+        has_bet = kelly > 0
+        choice = stakes.argmax(axis=1)
+        stake_fraction = kelly * kelly_fraction
+        payout = pick(stakes, winner) * kelly_fraction * pick(odds, winner)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            all_in_growth = np.where(has_bet, payout / stake_fraction, 1.0)
+
+        return Bets(
+            has_bet=has_bet,
+            choice=choice,
+            odds=pick(odds, choice),
+            probability=pick(probabilities, choice),
+            kelly=kelly,
+            stake_fraction=stake_fraction,
+            winner=winner,
+            wins=payout > 0,
+            growth=1 - stake_fraction + payout,
+            all_in_growth=all_in_growth,
+        )
+
+    kelly, choice, has_bet = kelly_matrix(odds, probabilities)
+
+    bet_odds = pick(odds, choice)
+    wins = has_bet & (choice == winner)
+    stake_fraction = np.where(has_bet, kelly * kelly_fraction, 0.0)
+
+    return Bets(
+        has_bet=has_bet,
+        choice=choice,
+        odds=bet_odds,
+        probability=pick(probabilities, choice),
+        kelly=kelly,
+        stake_fraction=stake_fraction,
+        winner=winner,
+        wins=wins,
+        growth=np.where(wins, 1 + stake_fraction * (bet_odds - 1), 1 - stake_fraction),
+        all_in_growth=np.where(has_bet, np.where(wins, bet_odds, 0.0), 1.0),
+    )
+
+
+@dataclass
+class SimulationBlock:
+    """
+    A contiguous run of placed bets. `bankroll`, `wins` and the bankroll at the `start` of the
+    block are always filled; the remaining columns are only recorded when the simulation is run
+    with `record_bets=True`.
+    """
+    bankroll: np.ndarray
+    wins: np.ndarray
+    ruined: bool = False
+    start: float = None
+    bet_index: np.ndarray = None
+    choice: np.ndarray = None
+    odds: np.ndarray = None
+    probability: np.ndarray = None
+    kelly: np.ndarray = None
+    stake: np.ndarray = None
+    winner: np.ndarray = None
+    # Set by `backtest.backtest_blocks`: byte offset to resume reading from and index of the next market
+    position: int = None
+    next_market: int = None
+
+
+@dataclass
+class SimulationResult:
+    """
+    Outcome of a full simulation run, in the shape used by `NewWindow`.
+    """
+    bankroll_history: np.ndarray
+    results_history: np.ndarray
+    ruined: bool = False
+    blocks: list = field(default_factory=list)
+
+
+def simulate_blocks(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                    seed=None, block_size=DEFAULT_BLOCK_SIZE, record_bets=False, staking="kelly",
+                    profiler=NULL_PROFILER):
+    """
+    Run the betting simulation of `Window.get_betting_data` in vectorized blocks of markets.
+
+    Markets, probabilities, Kelly stakes and winners are generated for a whole block at once and
+    the bankroll is compounded with `compound_bankroll`. Markets without a value bet are skipped.
+    The simulation stops early when the bankroll runs out.
+
+    :param bankroll: Starting bankroll.
+    :param number_of_variants: Number of variants per market.
+    :param kelly_fraction: Fraction of the Kelly stake to bet (0.1 - 1).
+    :param number_of_bets: Number of markets to simulate.
+    :param inflated_probability: Inflation of the value bet in percentage points (1 - 100).
+    :param seed: Seed or `numpy.random.Generator` for reproducible runs.
+    :param block_size: Number of markets generated per block.
+    :param record_bets: Also record the per-bet columns of `SimulationBlock`.
+    :param staking: "kelly" to bet on the first value bet of every market, or "simultaneous" to
+                    stake every outcome with `simultaneous_kelly` (see `draw_bets`).
+    :param profiler: A `profiling.Profiler` timing the stages of `draw_bets`, "bankroll" and
+                     "record", and counting the "blocks", "markets" and "bets".
+    :return: A generator of `SimulationBlock` objects.
+    """
+    rng = np.random.default_rng(seed)
+
+    for offset in range(0, number_of_bets, block_size):
+        size = min(block_size, number_of_bets - offset)
+
+        bets = draw_bets(rng, size, number_of_variants, kelly_fraction, inflated_probability, staking, profiler)
+        block = settle_block(bankroll, offset, bets, record_bets, profiler)
+        yield block
+
+        if block.ruined:
+            return
+        if len(block.bankroll):
+            bankroll = block.bankroll[-1]
+
+
+def settle_block(bankroll, offset, bets, record_bets=False, profiler=NULL_PROFILER):
+    """
+    Place the bets of a block of markets in order, starting from `bankroll`, and collect them into a
+    `SimulationBlock`. Markets without a value bet are skipped.
+
+    :param offset: Index of the first market of the block, used for `bet_index`.
+    :param bets: The `Bets` of the block, from `draw_bets` or `place_bets`.
+    :return: The `SimulationBlock`; the bets after a ruinous one are left out.
+    """
+    with profiler.stage("bankroll"):
+        rows = np.flatnonzero(bets.has_bet)
+        history, ruined = compound_bankroll(bankroll, bets.growth[rows], bets.all_in_growth[rows])
+        placed = len(history)
+
+        block = SimulationBlock(
+            bankroll=history, wins=bets.wins[rows[:placed]].astype(np.int8), ruined=ruined, start=bankroll
+        )
+    profiler.count("blocks")
+    profiler.count("markets", len(bets.has_bet))
+    profiler.count("bets", placed + ruined)
+    if record_bets:
+        with profiler.stage("record"):
+            rows = rows[:placed + ruined]
+            before = np.concatenate(([bankroll], history))[:len(rows)]
+            block.bet_index = rows + offset
+            block.choice = bets.choice[rows]
+            block.odds = bets.odds[rows]
+            block.probability = bets.probability[rows]
+            block.kelly = bets.kelly[rows]
+            block.stake = np.where(before > 1, before * bets.stake_fraction[rows], before)
+            block.winner = bets.winner[rows]
+    return block
+
+
+def simulate(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+             seed=None, block_size=DEFAULT_BLOCK_SIZE, record_bets=False, staking="kelly", profiler=NULL_PROFILER):
+    """
+    Run a complete simulation and collect its blocks into a `SimulationResult`.
+
+    See `simulate_blocks` for the parameters. `bankroll_history` starts with the initial
+    bankroll and `results_history` holds 1 for a won bet and 0 for a lost one.
+    """
+    blocks = list(simulate_blocks(bankroll, number_of_variants, kelly_fraction, number_of_bets,
+                                  inflated_probability, seed, block_size, record_bets, staking, profiler))
+
+    return SimulationResult(
+        bankroll_history=np.concatenate([[float(bankroll)]] + [block.bankroll for block in blocks]),
+        results_history=np.concatenate([np.empty(0, np.int8)] + [block.wins for block in blocks]),
+        ruined=any(block.ruined for block in blocks),
+        blocks=blocks if record_bets else [],
+    )
+
+
+class BetRecord(NamedTuple):
+    """
+    One placed bet, as yielded by `iter_bets`. `bankroll` is the bankroll after the bet.
+    """
+    bet_index: int
+    variant: int
+    odds: float
+    probability: float
+    kelly: float
+    stake: float
+    winner: int
+    won: bool
+    bankroll: float
+
+
+def iter_bets(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+              seed=None, block_size=DEFAULT_BLOCK_SIZE, staking="kelly"):
+    """
+    Lazily yield a `BetRecord` for every placed bet of a simulation. Only one block of markets is
+    held in memory at a time. See `simulate_blocks` for the parameters.
+    """
+    for block in simulate_blocks(bankroll, number_of_variants, kelly_fraction, number_of_bets,
+                                 inflated_probability, seed, block_size, record_bets=True, staking=staking):
+        after = np.concatenate((block.bankroll, [0.0]))
+        won = np.concatenate((block.wins, [0])).astype(bool)
+        columns = (block.bet_index, block.choice, block.odds, block.probability, block.kelly, block.stake,
+                   block.winner, won, after)
+        for values in zip(*(column[:len(block.bet_index)].tolist() for column in columns)):
+            yield BetRecord(*values)
+
+
+def simulate_stats(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                   seed=None, block_size=DEFAULT_BLOCK_SIZE, staking="kelly", profiler=NULL_PROFILER,
+                   checkpoint=None):
+    """
+    Run the simulation of `simulate_blocks` without keeping its history and return its
+    `stats.RunningStats`. Memory use does not depend on `number_of_bets`.
+
+    The bankroll is tracked in log space, so runs long enough for it to exceed the range of a float
+    (about $1e308) still give exact statistics. Blocks that may reach the $1 all-in regime are
+    compounded with `compound_bankroll` instead. See `simulate_blocks` for the parameters; the
+    profiler times the bankroll updates and statistics together as "statistics".
+
+    :param checkpoint: Optional `checkpoint.Checkpoint`. The run continues from its snapshot if
+                       there is one, and saves the random generator, the bankroll and the
+                       statistics into it between blocks whenever it is due. A resumed run gives
+                       exactly the statistics of an uninterrupted one.
+    """
+    rng = np.random.default_rng(seed)
+    stats = RunningStats()
+    log_bankroll = np.log(bankroll)
+    first = 0
+    if checkpoint is not None:
+        saved = checkpoint.load(rng)
+        if saved is not None:
+            arrays, stats = saved
+            first, log_bankroll = int(arrays["offset"]), float(arrays["log_bankroll"])
+
+    for offset in range(first, number_of_bets, block_size):
+        size = min(block_size, number_of_bets - offset)
+
+        bets = draw_bets(rng, size, number_of_variants, kelly_fraction, inflated_probability, staking, profiler)
+        log_bankroll, ruined = log_stats_block(stats, log_bankroll, bets, profiler)
+        if ruined:
+            break
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(rng, {"offset": offset + size, "log_bankroll": log_bankroll}, stats)
+    return stats
+
+
+def log_stats_block(stats, log_bankroll, bets, profiler=NULL_PROFILER):
+    """
+    Place the bets of a block of markets starting from the bankroll `exp(log_bankroll)` and add them
+    to `stats`, without keeping the bankroll history (see `simulate_stats`).
+
+    :return: A tuple (log bankroll after the block, ruined).
+    """
+    profiler.count("blocks")
+    profiler.count("markets", len(bets.has_bet))
+    with profiler.stage("statistics"):
+        rows = np.flatnonzero(bets.has_bet)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_growth = np.log(bets.growth[rows])
+        levels = log_bankroll + np.cumsum(log_growth)
+
+        # A last bet that loses the whole bankroll makes the last level -inf (or NaN), and any such
+        # bet makes the sum of the block non-finite, so such blocks take the exact path below
+        if log_bankroll > 0 and levels[:-1].min(initial=np.inf) > 0 and np.isfinite(levels[-1:]).all():
+            stats.update_log(log_growth, bets.wins[rows])
+            profiler.count("bets", len(rows))
+            return (levels[-1] if len(levels) else log_bankroll), False
+
+        history, ruined = compound_bankroll(np.exp(log_bankroll), bets.growth[rows], bets.all_in_growth[rows])
+        stats.update(np.exp(log_bankroll), history, bets.wins[rows[:len(history)]], ruined)
+    profiler.count("bets", len(history) + ruined)
+    if len(history) and not ruined:
+        log_bankroll = np.log(history[-1])
+    return log_bankroll, ruined
+
+
+def log_bets(result, kelly_fraction, sample_every=1):
+    """
+    Write the per-bet lines of a simulation recorded with `record_bets=True` to the log, in the
+    format used by `update_bankroll` and `Window.get_betting_data`.
+    """
+    for block in result.blocks:
+        log_block(block, kelly_fraction, sample_every)
+
+
+def log_block(block, kelly_fraction, sample_every=1):
+    """
+    Write the per-bet log lines of a single `SimulationBlock` recorded with `record_bets=True`.
+
+    :param sample_every: Only log the bets whose market number is a multiple of `sample_every`
+                         (the bet that runs out of money is always logged).
+    """
+    after = np.concatenate((block.bankroll, [0.0]))
+    before = np.concatenate(([block.start], block.bankroll))
+    sampled = np.flatnonzero(block.bet_index % sample_every == 0) if sample_every > 1 else range(len(block.bet_index))
+    if block.ruined and len(block.bet_index) - 1 not in sampled:
+        sampled = [*sampled, len(block.bet_index) - 1]
+
+    for j in sampled:
+        bet_size = round(float(block.stake[j]), 2)
+        odd = float(block.odds[j])
+        bankroll = float(after[j])
+        if j < len(block.wins) and block.wins[j]:
+            logging.info(f"Win! Gained: ${round(bankroll - float(before[j]), 2)}. New bankroll: ${round(bankroll, 2)}")
+        else:
+            logging.info(f"Lose. Lost: ${round(float(before[j]) - bankroll, 2)}. New bankroll: ${round(bankroll, 2)}")
+        if j == len(block.bankroll):
+            break
+        logging.info(
+            f"Bet #{block.bet_index[j] + 1}: Chose {variant_name(block.choice[j])} with odds {odd}. "
+            f"Bet size: ${bet_size}. Probability: {block.probability[j]}. "
+            f"Kelly: {block.kelly[j]}. Kelly Fraction: {kelly_fraction * 100}%. "
+            f"Winner: {variant_name(block.winner[j])}. Bankroll before: ${round(bankroll, 2)}"
+        )
+
+
+BAND_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@dataclass
+class EnsembleResult:
+    """
+    Outcome of `simulate_ensemble`. `bands` has one row per entry of `percentiles` and one column
+    per step (the first column is the starting bankroll). The remaining arrays have one entry per path.
+    """
+    percentiles: tuple
+    bands: np.ndarray
+    final_bankroll: np.ndarray
+    max_drawdown: np.ndarray
+    ruined: np.ndarray
+
+    @property
+    def ruin_probability(self):
+        return float(self.ruined.mean())
+
+    @property
+    def median_final_bankroll(self):
+        return float(np.median(self.final_bankroll))
+
+
+def simulate_ensemble(bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                      number_of_paths, seed=None, percentiles=BAND_PERCENTILES, block_size=DEFAULT_BLOCK_SIZE,
+                      should_stop=None, staking="kelly", profiler=NULL_PROFILER, checkpoint=None):
+    """
+    Simulate `number_of_paths` independent bankroll paths of the `simulate` model at once.
+
+    The paths are advanced together, a block of steps at a time: the markets of every path are
+    drawn in one `draw_bets` call and each step is a single multiplication over all paths. Paths
+    that reach the $1 all-in regime are recomputed with `compound_bankroll`. Only the percentile
+    bands are kept per step, so memory does not grow with `number_of_paths * number_of_bets`.
+    A market without a value bet leaves the bankroll of its path unchanged, and a ruined path
+    stays at $0.
+
+    :param number_of_paths: Number of independent paths to simulate.
+    :param percentiles: Percentiles of the bankroll to record at every step; with none the paths
+                        are not sorted, which saves most of the "statistics" time.
+    :param block_size: Approximate number of markets generated per block.
+    :param should_stop: Optional callable checked before every block; when it returns True the
+                        simulation stops and None is returned.
+    :param staking: "kelly" or "simultaneous" (see `draw_bets`).
+    :param profiler: A `profiling.Profiler` timing the stages of `draw_bets`, "bankroll" and
+                     "statistics" (drawdowns and percentile bands).
+    :param checkpoint: Optional `checkpoint.Checkpoint`, as in `simulate_stats`; it holds the
+                       bankroll, peak and drawdown of every path and the bands so far.
+    :return: An `EnsembleResult`. See `simulate_blocks` for the other parameters.
+    """
+    rng = np.random.default_rng(seed)
+    steps_per_block = max(1, block_size // number_of_paths)
+
+    # Linear interpolation between order statistics, as in np.percentile
+    positions = np.asarray(percentiles, dtype=float) / 100 * (number_of_paths - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.ceil(positions).astype(int)
+    weight = positions - lower
+
+    bands = np.empty((len(percentiles), number_of_bets + 1))
+    bands[:, 0] = bankroll
+    current = np.full(number_of_paths, float(bankroll))
+    peak = current.copy()
+    max_drawdown = np.zeros(number_of_paths)
+    ruined = np.zeros(number_of_paths, dtype=bool)
+    first = 0
+    if checkpoint is not None:
+        saved = checkpoint.load(rng)
+        if saved is not None:
+            arrays, _ = saved
+            first = int(arrays["offset"])
+            current, peak, max_drawdown, ruined, bands = (
+                arrays[name] for name in ("current", "peak", "max_drawdown", "ruined", "bands")
+            )
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        for start in range(first, number_of_bets, steps_per_block):
+            if should_stop is not None and should_stop():
+                return None
+            steps = min(steps_per_block, number_of_bets - start)
+            bets = draw_bets(rng, steps * number_of_paths, number_of_variants, kelly_fraction, inflated_probability,
+                             staking, profiler)
+            profiler.count("blocks")
+            profiler.count("markets", steps * number_of_paths)
+
+            with profiler.stage("bankroll"):
+                growth = bets.growth.reshape(steps, number_of_paths)
+                all_in_growth = bets.all_in_growth.reshape(steps, number_of_paths)
+
+                paths = np.empty((steps, number_of_paths))
+                previous = current
+                for step in range(steps):
+                    previous = np.multiply(previous, growth[step], out=paths[step])
+
+                critical = np.flatnonzero(~ruined & ((current <= 1) | (paths.min(axis=0) <= 1)))
+                for path in critical:
+                    history, path_ruined = compound_bankroll(current[path], growth[:, path], all_in_growth[:, path])
+                    paths[:len(history), path] = history
+                    if path_ruined:
+                        paths[len(history):, path] = 0.0
+                        ruined[path] = True
+
+            with profiler.stage("statistics"):
+                for step in range(steps):
+                    np.maximum(peak, paths[step], out=peak)
+                    np.maximum(max_drawdown, 1 - paths[step] / peak, out=max_drawdown)
+
+                if len(percentiles):
+                    ordered = np.sort(paths, axis=1)
+                    bands[:, start + 1:start + steps + 1] = (
+                        ordered[:, lower] * (1 - weight) + ordered[:, upper] * weight
+                    ).T
+                current = paths[-1].copy()
+
+            if checkpoint is not None and checkpoint.due():
+                checkpoint.save(rng, {"offset": start + steps, "current": current, "peak": peak,
+                                      "max_drawdown": max_drawdown, "ruined": ruined, "bands": bands})
+
+    return EnsembleResult(
+        percentiles=tuple(percentiles),
+        bands=bands,
+        final_bankroll=current,
+        max_drawdown=max_drawdown,
+        ruined=ruined,
+    )
@@ -1,112 +1,155 @@
-import random
 import logging
-import matplotlib.pyplot as plt
+import numpy as np
+from engine import generate_odds_matrix, simultaneous_kelly
+from market import Market
+from sampler import sample
 
-logging.basicConfig(
-    filename="betting_log.txt",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    filemode="w"  
-)
+# Generator of the functions below when they are not given one. It is a NumPy generator, so
+# `random.seed` does not affect it; use `seed` or pass a seeded `rng` for reproducible draws.
+_rng = np.random.default_rng()
 
-def kelly_criterion(odds_dict: dict, probabilities_dict: dict):
+
+def seed(value=None):
+    """
+    Reseed the generator that the functions of this module draw from when no `rng` is given, in
+    place of `random.seed`.
+
+    :param value: Seed, or None for fresh entropy.
+    """
+    global _rng
+    _rng = np.random.default_rng(value)
+
+
+def kelly_criterion(odds_dict, probabilities_dict: dict = None):
     """     
     Calculate the optimal bet size for each option using the Kelly Criterion.
 
     The Kelly Criterion is a formula used to determine the optimal bet size in scenarios with 
     known odds and probabilities. It is designed to maximize the growth of the bankroll by betting 
-    more on favorable odds (i.e., value bets) and less on others. This implementation iterates 
-    over each option in the odds and probability dictionaries, calculates the Kelly percentage 
-    for each, and identifies which options represent value bets (i.e., where the Kelly percentage 
-    is positive).
+    more on favorable odds (i.e., value bets) and less on others. This implementation computes 
+    the Kelly percentage of every option at once and identifies which options represent value 
+    bets (i.e., where the Kelly percentage is positive).
 
-    :param odds_dict: A dictionary where keys are option names (e.g., teams, horses, etc.) and 
-                      values are the odds assigned to each option by the bookmaker.
+    :param odds_dict: A `Market` with odds and probabilities, or a dictionary where keys are option 
+                      names (e.g., teams, horses, etc.) and values are the odds assigned to each 
+                      option by the bookmaker.
     :param probabilities_dict: A dictionary with matching keys to `odds_dict` where values represent 
                                the calculated probability of each option (e.g., from historical data 
-                               or other analysis).
+                               or other analysis). Not used when `odds_dict` is a `Market`.
     :return: The Kelly percentage (rounded to 2 decimals) for the first option found to have a 
-             positive expected value, along with the option's name and odds.
+             positive expected value, along with the option's name (its integer variant id for a 
+             `Market`) and odds.
 
     Note: Only the first positive Kelly percentage is returned. If no value bet exists, 
     the function will return None.
+
+    :raise ValueError: If the market has no probabilities.
     """
-    for key in odds_dict:
-        odd = odds_dict[key]
-        probability = probabilities_dict[key]
-        
-        adjusted_odd = odd - 1
-        losing_probability = 1 - probability
-        kelly = round((adjusted_odd * probability - losing_probability) / adjusted_odd,2)
-        
-        if kelly > 0:
-            return round(kelly,2), key, odd
+    if not isinstance(odds_dict, Market):
+        result = kelly_criterion(Market.from_dict(odds_dict, probabilities_dict))
+        if result is None:
+            return None
+        kelly, index, _ = result
+        key = list(odds_dict)[index]
+        return kelly, key, odds_dict[key]
+
+    market = odds_dict
+    if market.probabilities is None:
+        raise ValueError("The market has no probabilities (see value_bet_generator)")
+    adjusted_odds = market.odds - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kelly = np.round((adjusted_odds * market.probabilities - (1 - market.probabilities)) / adjusted_odds, 2)
+
+    positive = np.flatnonzero(kelly > 0)
+    if len(positive):
+        index = int(positive[0])
+        return round(float(kelly[index]), 2), index, float(market.odds[index])
              
-    
-def value_bet_generator(generated_odds, inflated_probability):
+
+def simultaneous_kelly_criterion(odds_dict, probabilities_dict: dict = None):
+    """
+    Calculate the growth-optimal stakes on all options of a market at once (simultaneous Kelly).
+
+    Unlike `kelly_criterion`, which only bets on the first value bet, this spreads the bankroll over
+    every option worth betting on when exactly one option wins. Probabilities are normalised to sum
+    to 1 before solving. See `engine.simultaneous_kelly` for the algorithm.
+
+    :param odds_dict: A `Market` with odds and probabilities, or a dictionary where keys are option 
+                      names and values are the odds assigned to each option by the bookmaker.
+    :param probabilities_dict: A dictionary with matching keys to `odds_dict` where values represent 
+                               the calculated probability of each option. Not used when `odds_dict` 
+                               is a `Market`.
+    :return: For a `Market`, an array with the fraction of the bankroll to bet on every variant. For 
+             a dictionary, a dictionary with the fraction for every option name. All fractions are 
+             0 when the market has no value bet.
+    """
+    if not isinstance(odds_dict, Market):
+        stakes = simultaneous_kelly_criterion(Market.from_dict(odds_dict, probabilities_dict))
+        return dict(zip(odds_dict, stakes.tolist()))
+
+    if odds_dict.probabilities is None:
+        raise ValueError("The market has no probabilities (see value_bet_generator)")
+    probabilities = odds_dict.probabilities / odds_dict.probabilities.sum()
+    return simultaneous_kelly(odds_dict.odds[None, :], probabilities[None, :])[0]
+
+
+def value_bet_generator(generated_odds, inflated_probability, rng=None):
     """
     Generate adjusted probabilities for value betting based on given odds.
     
     This function calculates initial probabilities from provided odds and then randomly increases 
     the probability of one of the bets to simulate a value betting scenario. This "value bet" 
-    option will have an inflated probability (by 0.05), indicating it has better-than-expected odds. 
-    The function returns a dictionary of these adjusted probabilities.
-
-    :param generated_odds: A dictionary where keys are option names (e.g., teams or horses) 
-                            and values are their corresponding odds.
-    :return: A dictionary where each key is an option name and each value is an adjusted probability 
+    option will have an inflated probability (by `inflated_probability` percentage points), 
+    indicating it has better-than-expected odds. 
+
+    :param generated_odds: A `Market`, or a dictionary where keys are option names (e.g., teams or 
+                           horses) and values are their corresponding odds.
+    :param inflated_probability: How much to inflate the probability of the value bet (1 - 100).
+    :param rng: Optional `numpy.random.Generator`.
+    :return: For a `Market`, the same market with its `probabilities` filled in. For a dictionary, 
+             a dictionary where each key is an option name and each value is an adjusted probability 
              based on the odds, with one randomly selected option modified to simulate a value bet.
     
     Notes:
     - This function modifies one probability in the list, making the selected option a better choice 
       for value betting.
     """
+    if not isinstance(generated_odds, Market):
+        return value_bet_generator(Market.from_dict(generated_odds), inflated_probability, rng).probabilities_dict()
 
+    rng = rng or _rng
     fraction = inflated_probability / 100
-    probabilities = {key: round(1 / value, 3) for key, value in generated_odds.items()}
-    
+    probabilities = np.round(1 / generated_odds.odds, 3)
 
-    random_key = random.choice(list(probabilities.keys()))
-    random_probability = probabilities[random_key]
+    random_index = rng.integers(len(probabilities))
+    probabilities[random_index] = round(probabilities[random_index] + fraction, 3)
 
-    random_odd_probability = round(random_probability + fraction, 3)
-    probabilities[random_key] = random_odd_probability
-
-    probabilities = {key: round(value, 3) for key, value in probabilities.items()}
-    
-    return probabilities
+    return generated_odds.with_probabilities(probabilities)
 
-import random
 
-def generate_odds(num_odds):
+def generate_market(num_odds, rng=None):
     """
-    Generate a dictionary of betting odds simulating the reality of bookmakers by adding a 5% margin to each odds,
+    Generate a `Market` of betting odds simulating the reality of bookmakers by adding a 5% margin to each odds,
     which represents the expected value for bookmakers, i.e., their profit.
 
     :param num_odds: The total number of odds to generate.
+    :param rng: Optional `numpy.random.Generator`.
 
-    :return: A dictionary where keys are variant names and values are their corresponding odds.
+    :return: A `Market` whose variant ids are 0 to `num_odds - 1`.
     """
-    num_large_odds = num_odds // 3
-    num_medium_odds = num_odds // 3
-    num_small_odds = num_odds - num_large_odds - num_medium_odds
-
-    # Generate probabilities for each category
-    large_probabilities = [random.uniform(0.5, 0.6) for _ in range(num_large_odds)]
-    medium_probabilities = [random.uniform(0.3, 0.5) for _ in range(num_medium_odds)]
-    small_probabilities = [random.uniform(0.1, 0.3) for _ in range(num_small_odds)]
+    return Market(generate_odds_matrix(rng or _rng, 1, num_odds)[0])
 
-    # Combine all probabilities
-    probabilities = large_probabilities + medium_probabilities + small_probabilities
 
-    # Normalize probabilities to sum up to slightly more than 1 (to simulate the bookmaker margin)
-    total_probabilities = sum(probabilities)
-    adjusted_probabilities = [(p / total_probabilities) * 1.05 for p in probabilities]
+def generate_odds(num_odds):
+    """
+    Generate a dictionary of betting odds simulating the reality of bookmakers by adding a 5% margin to each odds,
+    which represents the expected value for bookmakers, i.e., their profit.
 
-    # Generate odds dictionary
-    odds_dict = {f"Variant {chr(65 + i)}": round(1 / p, 2) for i, p in enumerate(adjusted_probabilities)}
+    :param num_odds: The total number of odds to generate.
 
-    return odds_dict
+    :return: A dictionary where keys are variant names and values are their corresponding odds.
+    """
+    return generate_market(num_odds).odds_dict()
 
 
 def get_number_of_variants():
@@ -144,16 +187,22 @@ def update_bankroll(bankroll, bet_size, bet, win):
         logging.info(f"Lose. Lost: ${round(bet_size, 2)}. New bankroll: ${round(bankroll, 2)}")
     return bankroll
 
-def determine_winner(variants_list, weights):
+def determine_winner(variants_list, weights=None, rng=None):
     """
     Randomly selects a winner from a list of variants based on the given weights.
     Weights represent the probability of each variant winning.
 
     Parameters:
-        variants_list (list): List of possible betting outcomes.
+        variants_list (list | Market): List of possible betting outcomes, or a `Market` whose
+            probabilities are used as the weights.
         weights (list): List of probabilities corresponding to each outcome in variants_list.
+        rng (numpy.random.Generator): Optional random generator.
 
     Returns:
-        str: The chosen winner as a single element from variants_list.
+        str | int: The chosen winner as a single element from variants_list, or its variant id for a `Market`.
     """
-    return random.choices(list(variants_list), weights=weights, k=1)[0]
\ No newline at end of file
+    if not isinstance(variants_list, Market):
+        variants = list(variants_list)
+        return variants[determine_winner(Market(np.ones(len(variants)), list(weights)), rng=rng)]
+
+    return sample(rng or _rng, variants_list.probabilities)
\ No newline at end of file
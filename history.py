@@ -0,0 +1,236 @@
+import tempfile
+
+import numpy as np
+
+RETENTION_MODES = ("full", "stride", "ring")
+DEFAULT_POINTS = 1000000
+# Buffers larger than this are memory-mapped temporary files instead of RAM
+DEFAULT_MEMORY_BUDGET = 1 << 30
+# Number of set bits of every byte
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+class History:
+    """
+    Bankroll and win/loss history of one run in preallocated typed buffers, filled block by block.
+
+    The bankroll is kept in a float64 (or float32) array and the results in a bit-packed vector
+    (`np.packbits` order), so a bet costs 8 (or 4) bytes plus one bit. The buffers are allocated
+    once for the whole run; when together they exceed `memory_budget` they are memory-mapped
+    temporary files, so the operating system pages them out instead of the process running out
+    of memory.
+
+    Retention modes of the bankroll (the results are always kept in full):
+        "full": every bankroll, point i is the bankroll after bet i.
+        "stride": the bankroll after every `stride`-th bet, at most `points` of them, plus the latest one.
+        "ring": the last `points` bankrolls, in a mirrored ring buffer so they are always one
+                contiguous array.
+
+    `bankroll` is a view of the kept points, never a copy; `bet_number` gives the bet of each point.
+
+    :param number_of_bets: Maximum number of bets of the run.
+    :param initial_bankroll: Bankroll before the first bet.
+    :param dtype: Type of the bankroll, np.float64 or np.float32 (7 significant digits, and
+                  infinite above about $3.4e38).
+    :param retention: One of `RETENTION_MODES`.
+    :param points: Number of bankroll points kept by "stride" and "ring".
+    :param memory_budget: Size in bytes above which the buffers are memory-mapped.
+    :param directory: Directory of the memory-mapped files (defaults to the temporary directory).
+    """
+
+    def __init__(self, number_of_bets, initial_bankroll, dtype=np.float64, retention="full", points=DEFAULT_POINTS,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, directory=None):
+        if retention not in RETENTION_MODES:
+            raise ValueError(f"Unknown retention mode: {retention}")
+        if retention != "full" and points < 2:
+            raise ValueError("At least 2 points must be kept.")
+        self.retention = retention
+        self.capacity = number_of_bets
+        self.initial = float(initial_bankroll)
+        self.last = self.initial
+        self.count = 0
+        self.wins = 0
+        self.stride = 1
+        self.points = points
+
+        if retention == "full":
+            size = number_of_bets + 1
+        elif retention == "stride":
+            self.stride = max(1, -(-number_of_bets // (points - 1)))
+            # Points 0, stride, 2 * stride, ... and a spare one for the latest bankroll
+            size = number_of_bets // self.stride + 2
+        else:
+            size = 2 * points
+
+        dtype = np.dtype(dtype)
+        bits = -(-number_of_bets // 8)
+        self.spilled = size * dtype.itemsize + bits > memory_budget
+        self.directory = directory
+        self.files = []
+        self.buffer = self.allocate(size, dtype)
+        self.bits = self.allocate(bits, np.uint8)
+        self.buffer[0] = self.initial
+        if retention == "ring":
+            self.buffer[points] = self.initial
+        self.stored = 1
+
+    def allocate(self, size, dtype):
+        if not self.spilled:
+            return np.zeros(size, dtype=dtype)
+        # An anonymous temporary file disappears with the last reference to its mapping
+        file = tempfile.TemporaryFile(dir=self.directory)
+        self.files.append(file)
+        return np.memmap(file, dtype=dtype, mode="w+", shape=(max(size, 1),))
+
+    @classmethod
+    def from_arrays(cls, bankroll_history, packed_results, number_of_results):
+        """
+        Wrap a complete "full" history, e.g. loaded from the cache, without copying it.
+        """
+        history = cls.__new__(cls)
+        history.retention = "full"
+        history.capacity = history.count = int(number_of_results)
+        history.stored = len(bankroll_history)
+        history.initial = float(bankroll_history[0])
+        history.last = float(bankroll_history[-1])
+        history.stride = 1
+        history.points = len(bankroll_history)
+        history.spilled = isinstance(bankroll_history, np.memmap)
+        history.directory = None
+        history.files = []
+        history.buffer = bankroll_history
+        history.bits = packed_results
+        history.wins = count_bits(packed_results, history.count)
+        return history
+
+    @property
+    def losses(self):
+        return self.count - self.wins
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + self.bits.nbytes
+
+    def append(self, bankroll, wins):
+        """
+        Add the bankroll after every bet of a block and its results (1 for a win, 0 for a loss).
+        """
+        bankroll = np.asarray(bankroll)
+        number = len(bankroll)
+        if number == 0:
+            return
+        if self.count + number > self.capacity:
+            raise ValueError(f"The history is full ({self.capacity} bets)")
+
+        first = self.count + 1
+        with np.errstate(over="ignore"):
+            self.store(bankroll, first, number)
+        self.pack(np.asarray(wins, dtype=np.uint8))
+        self.count += number
+        self.last = float(bankroll[-1])
+
+    def store(self, bankroll, first, number):
+        """
+        Write the bankroll of bets `first` to `first + number - 1` to the kept points.
+        """
+        if self.retention == "full":
+            self.buffer[first:first + number] = bankroll
+            self.stored = first + number
+        elif self.retention == "stride":
+            offset = -first % self.stride
+            kept = bankroll[offset::self.stride]
+            start = (first + offset) // self.stride
+            self.buffer[start:start + len(kept)] = kept
+            self.stored = (first - 1 + number) // self.stride + 1
+            if (first - 1 + number) % self.stride:
+                self.buffer[self.stored] = bankroll[-1]
+                self.stored += 1
+        else:
+            kept = bankroll[-self.points:]
+            position = (first + number - len(kept) + np.arange(len(kept))) % self.points
+            self.buffer[position] = kept
+            self.buffer[position + self.points] = kept
+            self.stored = min(first + number, self.points)
+
+    def pack(self, wins):
+        """
+        Append results to the bit vector, which may end in a partly filled byte.
+        """
+        start = self.count
+        head = min(-start % 8, len(wins))
+        if head:
+            padded = np.zeros(8, dtype=np.uint8)
+            padded[start % 8:start % 8 + head] = wins[:head]
+            self.bits[start // 8] |= np.packbits(padded)[0]
+        rest = wins[head:]
+        if len(rest):
+            byte = (start + head) // 8
+            self.bits[byte:byte + -(-len(rest) // 8)] = np.packbits(rest)
+        self.wins += int(np.count_nonzero(wins))
+
+    @property
+    def bankroll(self):
+        """
+        View of the kept bankroll points, the first one being the oldest kept.
+        """
+        if self.retention == "ring" and self.count + 1 > self.points:
+            start = (self.count + 1) % self.points
+            return self.buffer[start:start + self.points]
+        return self.buffer[:self.stored]
+
+    @property
+    def first_bet(self):
+        return self.count + 1 - self.stored if self.retention == "ring" else 0
+
+    def bet_number(self, index):
+        """
+        Number of bets placed at the kept points `index` (0 is the initial bankroll).
+        """
+        index = np.asarray(index)
+        if self.retention == "stride":
+            return np.minimum(index * self.stride, self.count)
+        return index + self.first_bet
+
+    def point(self, bet):
+        """
+        Position among the kept points of bet number `bet` (the inverse of `bet_number`).
+        """
+        if self.retention == "stride":
+            return bet / self.stride
+        return bet - self.first_bet
+
+    @property
+    def packed_results(self):
+        """
+        View of the bit-packed results of the bets placed so far.
+        """
+        return self.bits[:-(-self.count // 8)]
+
+    def results(self, start=0, stop=None):
+        """
+        Unpack the results of bets `start` to `stop` into an int8 array of 1 (won) and 0 (lost).
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        start = min(start, stop)
+        unpacked = np.unpackbits(self.bits[start // 8:-(-stop // 8)])
+        return unpacked[start % 8:start % 8 + stop - start].view(np.int8)
+
+    def close(self):
+        """
+        Release the memory-mapped files. The history must not be used afterwards.
+        """
+        self.buffer = self.bits = None
+        for file in self.files:
+            file.close()
+        self.files = []
+
+
+def count_bits(packed, count):
+    """
+    Number of set bits among the first `count` bits of a `np.packbits` vector.
+    """
+    full, rest = divmod(count, 8)
+    total = int(POPCOUNT[packed[:full]].sum(dtype=np.int64))
+    if rest:
+        total += int(np.unpackbits(packed[full:full + 1])[:rest].sum())
+    return total
@@ -1,24 +1,63 @@
 from PyQt6.QtWidgets import (
-    QApplication, QWidget, QPushButton, QLabel, QLineEdit, QVBoxLayout, QGridLayout, QMessageBox
+    QApplication, QWidget, QPushButton, QLabel, QLineEdit, QCheckBox, QPlainTextEdit, QVBoxLayout, QGridLayout,
+    QMessageBox
 )
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QIcon
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal
+from PyQt6.QtGui import QFontDatabase, QIcon
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, NavigationToolbar2QT
+from matplotlib.figure import Figure
+import numpy as np
 import sys
-from functions_library import generate_odds, value_bet_generator, kelly_criterion, determine_winner, update_bankroll
+import threading
+import time
+from engine import simulate_blocks, simulate_ensemble, log_block, configure_logging
+from cache import ResultCache, simulation_key, history_arrays, history_from_arrays
+from history import DEFAULT_MEMORY_BUDGET, DEFAULT_POINTS, History
+from ledger import TradeLedger
+from stats import RunningStats
+from decimate import minmax_decimate
+from profiling import NULL_PROFILER, Profiler, format_report
 import logging
 import os
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 icon_path = os.path.join(current_dir, "icon.png")
 
-logging.basicConfig(
-    filename="betting_log.txt",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    filemode="w"  
-)
+RESCALE_INTERVAL = 1.0
+WORKER_NICENESS = 10
+LEDGER_DIRECTORY = "betting_ledger"
+# Every bet goes to the binary ledger; only one bet in TEXT_LOG_SAMPLE_EVERY is written to
+# betting_log.txt (None keeps just the start/end summary lines).
+TEXT_LOG_SAMPLE_EVERY = 10000
+PROFILE_REPORT = "profile_report.json"
+# Storage of the history of a single run (see `history.History`). Only "full" histories are cached
+# and can be zoomed into bet by bet; "stride" and "ring" keep HISTORY_POINTS bankrolls.
+HISTORY_DTYPE = np.float64
+HISTORY_RETENTION = "full"
+HISTORY_POINTS = DEFAULT_POINTS
+HISTORY_MEMORY_BUDGET = DEFAULT_MEMORY_BUDGET
+
+STYLE_SHEET = """
+    QWidget {
+        background-color: black;
+        color: white;
+    }
+    QPushButton {
+        background-color: yellow;
+        color: black;
+    }
+    QPushButton:hover {
+        background-color: rgb(255, 200, 0); /* Fundal la hover */
+    }   
+    QLineEdit { 
+        border: 2px solid yellow; 
+        border-radius: 5px; 
+        padding: 5px;
+        color: white;
+        background-color: rgb(50, 50, 50);
+    }
+"""
+
 
 class Window(QWidget):
     def __init__(self):
@@ -48,6 +87,12 @@ class Window(QWidget):
         probability_layout = QLabel("How much you want the inflated probability to be? (1% - 100%)")
         layout.addWidget(probability_layout, 4, 0)
 
+        paths_layout = QLabel("How many paths do you want to simulate? (optional)")
+        layout.addWidget(paths_layout, 5, 0)
+
+        seed_layout = QLabel("Seed to repeat a run (optional, repeated runs load from the cache)")
+        layout.addWidget(seed_layout, 6, 0)
+
         # Input fields (make them attributes of the class)
         self.input_bankroll = QLineEdit()
         layout.addWidget(self.input_bankroll, 0, 1)
@@ -64,12 +109,37 @@ class Window(QWidget):
         self.probability_input = QLineEdit()
         layout.addWidget(self.probability_input, 4, 1)
 
-        # Start button
-        button1 = QPushButton("Start")
-        layout.addWidget(button1, 5, 0, 1, 2, alignment=Qt.AlignmentFlag.AlignCenter)
+        self.input_paths = QLineEdit()
+        layout.addWidget(self.input_paths, 5, 1)
+
+        self.input_seed = QLineEdit()
+        layout.addWidget(self.input_seed, 6, 1)
+
+        self.simultaneous_checkbox = QCheckBox("Stake every value outcome of a market (simultaneous Kelly)")
+        layout.addWidget(self.simultaneous_checkbox, 7, 0, 1, 2)
 
-        # Connect button to function
-        button1.clicked.connect(self.get_betting_data)
+        self.profile_checkbox = QCheckBox(f"Profile the run (time spent per stage, saved to {PROFILE_REPORT})")
+        layout.addWidget(self.profile_checkbox, 8, 0, 1, 2)
+
+        # Start and Cancel buttons
+        self.start_button = QPushButton("Start")
+        layout.addWidget(self.start_button, 9, 0, alignment=Qt.AlignmentFlag.AlignCenter)
+
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        layout.addWidget(self.cancel_button, 9, 1, alignment=Qt.AlignmentFlag.AlignCenter)
+
+        # Connect buttons to functions
+        self.start_button.clicked.connect(self.get_betting_data)
+        self.cancel_button.clicked.connect(self.cancel_simulation)
+
+        self.worker_thread = None
+        self.worker = None
+        self.new_window = None
+        self.profiler = NULL_PROFILER
+        self.cache = ResultCache()
+        self.cache_key = None
+        self.running = False
 
     def show_error_popup(self, message):
         """
@@ -88,7 +158,20 @@ class Window(QWidget):
         """
         Open a new window when the Start button is clicked.
         """
-        self.new_window = NewWindow(self.bankroll_history, self.results_history)
+        with self.profiler.stage("plotting"):
+            self.new_window = NewWindow(self.history, self.ensemble)
+        self.new_window.show()
+
+    def show_live_results(self, number_of_bets):
+        """
+        Show the results window of a simulation that is about to start. An open results window of a
+        previous single-path run is reused, so its figure does not have to be built again.
+        """
+        window = self.new_window
+        if window is not None and window.isVisible() and window.ensemble is None:
+            window.reset(self.history, number_of_bets=number_of_bets, stats=self.stats)
+        else:
+            self.new_window = NewWindow(self.history, number_of_bets=number_of_bets, stats=self.stats)
         self.new_window.show()
 
     def select_kelly_fraction(self):
@@ -110,6 +193,7 @@ class Window(QWidget):
     def get_betting_data(self):
         """
         Simulates a series of bets using the Kelly Criterion, adjusting bet sizes based on optimal strategy.
+        When the simultaneous Kelly box is checked, every value outcome of a market is staked at once.
         Logs transaction details for each bet (chosen variant, odds, bet size, winner, and bankroll before the bet).
         At the end of the simulation, it prints the initial and final bankroll, total wins and losses.
         Additionally, it generates plots showing bankroll evolution and win/loss statistics.
@@ -121,6 +205,9 @@ class Window(QWidget):
             None: This function prints results to the console, logs transaction details, and shows plots.
         """
 
+        if self.running:
+            return
+
         logging.info("Simulation started.")
 
         try:
@@ -130,19 +217,25 @@ class Window(QWidget):
                 return
         except (ValueError, AttributeError):
             self.show_error_popup("Invalid bankroll input. Please enter a numeric value.")
+            return
         self.initial_bankroll = self.bankroll
         try:
             number_of_variants = int(self.input_variants.text())
         except ValueError:
             self.show_error_popup("Invalid number of variants. Please enter a numeric value")
+            return
         try:
             kelly_fraction = self.select_kelly_fraction()
         except ValueError:
             self.show_error_popup("Invalid kelly fraction. Please enter a numeric value between 1 - 100")
+            return
+        if kelly_fraction is None:
+            return
         try:
             number_of_bets = int(self.input_bets.text())
         except ValueError:
             self.show_error_popup("Invalid number of bets. Please enter a numeric value")
+            return
         try:
             inflated_strip = self.probability_input.text().strip().replace('%', '')
             inflated_probability = int(inflated_strip)
@@ -152,64 +245,318 @@ class Window(QWidget):
         except ValueError:
             self.show_error_popup("Invalid inflated probability. Please enter a numeric value")
             return
-        wins = 0
-        loses = 0
-        self.bankroll_history = [self.bankroll]  # To track bankroll evolution
-        self.results_history = []  # To track wins(1) and losses (0)
+        try:
+            paths_strip = self.input_paths.text().strip()
+            number_of_paths = int(paths_strip) if paths_strip else 1
+        except ValueError:
+            self.show_error_popup("Invalid number of paths. Please enter a numeric value")
+            return
+        try:
+            seed_strip = self.input_seed.text().strip()
+            seed = int(seed_strip) if seed_strip else None
+            if seed is not None and seed < 0:
+                raise ValueError
+        except ValueError:
+            self.show_error_popup("Invalid seed. Please enter a positive integer or leave it empty")
+            return
+        staking = "simultaneous" if self.simultaneous_checkbox.isChecked() else "kelly"
+        self.profiler = Profiler().start() if self.profile_checkbox.isChecked() else NULL_PROFILER
+
+        self.ensemble = None
+        self.ensemble_mode = number_of_paths > 1
+        if self.ensemble_mode:
+            self.worker = EnsembleWorker(
+                self.bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability, number_of_paths,
+                staking, self.profiler, seed, self.cache
+            )
+        else:
+            self.cache_key = None
+            if seed is not None:
+                self.cache_key = simulation_key(self.bankroll, number_of_variants, kelly_fraction, number_of_bets,
+                                                inflated_probability, seed, staking)
+                with self.profiler.stage("cache"):
+                    cached = self.cache.load(self.cache_key)
+                if cached is not None:
+                    self.show_cached_result(cached)
+                    return
+
+            # To track the bankroll evolution and the wins (1) and losses (0)
+            self.history = History(number_of_bets, self.bankroll, dtype=HISTORY_DTYPE, retention=HISTORY_RETENTION,
+                                   points=HISTORY_POINTS, memory_budget=HISTORY_MEMORY_BUDGET)
+            self.stats = RunningStats()
+            self.show_live_results(number_of_bets)
+
+            self.worker = SimulationWorker(
+                self.bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability, staking,
+                profiler=self.profiler, seed=seed
+            )
+            self.worker.progress.connect(self.on_progress)
+
+        self.start_worker()
+
+    def show_cached_result(self, arrays):
+        """
+        Show a single-path run loaded from the cache instead of running it again.
+        """
+        self.history, ruined, self.stats = history_from_arrays(arrays)
+        self.bankroll = self.history.last
 
-        for i in range(number_of_bets):
-            try:
-                odds = generate_odds(number_of_variants)
-                probabilities = value_bet_generator(odds, inflated_probability)
-            except:
-                self.show_error_popup(f"An error occurred during odds generation: {str(e)}")
-                return
-            kelly = kelly_criterion(odds, probabilities)
-            choice = kelly[1]
-            bet_size = round(self.bankroll * (kelly[0] * kelly_fraction), 2)
-            bet = odds[choice]
-            winner = determine_winner(list(probabilities.keys()), list(probabilities.values()))
-            if self.bankroll <= 1:
-                bet_size = self.bankroll
-            self.bankroll = update_bankroll(self.bankroll, bet_size, bet, choice == winner)
-            
-            # Update win/loss history
-            if self.bankroll <= 0:
-                self.show_error_popup("You run out of money")
-                break
-            if winner == choice:
-                wins += 1
-                self.results_history.append(1)
+        with self.profiler.stage("plotting"):
+            window = self.new_window
+            if window is not None and window.isVisible() and window.ensemble is None:
+                window.reset(self.history, stats=self.stats)
             else:
-                loses += 1
-                self.results_history.append(0)
-            self.bankroll_history.append(self.bankroll)
+                self.new_window = NewWindow(self.history, stats=self.stats)
+        self.new_window.show()
+        self.show_profile()
 
-            try:
-                logging.info(
-                f"Bet #{i + 1}: Chose {choice} with odds {bet}. "
-                f"Bet size: ${bet_size}. Probability: {probabilities[choice]}. "
-                f"Kelly: {kelly[0]}. Kelly Fraction: {kelly_fraction * 100}%. Winner: {winner}. "
-                f"Bankroll before: ${round(self.bankroll, 2)}"
-                )
-            except IOError as e:
-                self.show_error_popup(f"An error occurred during odds generation: {str(e)}")
-                logging.error(f"Error during odds generation: {str(e)}")
+        logging.info("Simulation loaded from the cache.")
+        if ruined:
+            self.show_error_popup("You run out of money")
+        logging.info(f"Simulation ended. Final bankroll: ${round(self.bankroll, 2)}")
+
+    def start_worker(self):
+        """
+        Run `self.worker` on a separate thread so the window stays responsive during the simulation.
+        """
+        self.worker_thread = QThread()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self.on_finished)
+        self.worker.failed.connect(self.on_failed)
+        self.worker.finished.connect(self.worker_thread.quit)
+        self.worker.failed.connect(self.worker_thread.quit)
+        self.worker_thread.finished.connect(self.worker.deleteLater)
+        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
+
+        self.running = True
+        self.start_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.worker_thread.start()
+
+    def cancel_simulation(self):
+        """
+        Ask the running simulation to stop after its current block.
+        """
+        if self.running:
+            self.worker.cancel()
+            self.cancel_button.setEnabled(False)
+
+    def on_progress(self, bankroll_chunk, results_chunk):
+        """
+        Append a chunk of bets sent by the worker to the history and refresh the results chart.
+        """
+        with self.profiler.stage("statistics"):
+            self.stats.update(self.history.last, bankroll_chunk, results_chunk)
+        self.history.append(bankroll_chunk, results_chunk)
+
+        with self.profiler.stage("plotting"):
+            self.new_window.update_results(self.history)
+
+    def on_finished(self, result, ruined, cancelled):
+        """
+        Called when the worker stops, whether the simulation completed, ran out of money or was cancelled.
+        """
+        self.running = False
+        self.start_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+        if cancelled:
+            logging.info("Simulation cancelled.")
+
+        if self.ensemble_mode:
+            if result is None:
                 return
-            
+            self.ensemble = result
+            self.history = None
+            logging.info(
+                f"Ensemble of {len(result.final_bankroll)} paths ended. "
+                f"Ruin probability: {self.ensemble.ruin_probability * 100:.2f}%. "
+                f"Median final bankroll: ${round(self.ensemble.median_final_bankroll, 2)}"
+            )
+            self.open_new_window()
+            self.show_profile()
+            return
+
+        self.bankroll = self.history.last
+        self.stats.ruined = ruined
+        with self.profiler.stage("plotting"):
+            self.new_window.update_results(self.history, final=True)
+        if self.cache_key is not None and not cancelled and self.history.retention == "full":
+            with self.profiler.stage("cache"):
+                self.store_result(ruined)
+        self.show_profile()
+        if ruined:
+            self.show_error_popup("You run out of money")
+
         logging.info(f"Simulation ended. Final bankroll: ${round(self.bankroll, 2)}")
 
-        self.open_new_window()
+    def store_result(self, ruined):
+        """
+        Save the history of a completed seeded run in the cache.
+        """
+        arrays = history_arrays(self.history.bankroll, self.history.packed_results, self.history.count, ruined,
+                                self.stats)
+        try:
+            self.cache.store(self.cache_key, arrays)
+        except OSError as e:
+            logging.warning(f"Could not save the run in the cache: {e}")
+
+    def show_profile(self):
+        """
+        Stop the profiler of a profiled run, save its JSON report to `PROFILE_REPORT` and show it
+        in the results window. The results window hides the report of a previous run otherwise.
+        """
+        report = None
+        if self.profiler.enabled:
+            self.profiler.stop()
+            report = self.profiler.report()
+            try:
+                with open(PROFILE_REPORT, "w") as file:
+                    file.write(self.profiler.to_json())
+            except OSError as e:
+                logging.warning(f"Could not save the profile report: {e}")
+            self.profiler = NULL_PROFILER
+        if self.new_window is not None:
+            self.new_window.show_profile(report)
+
+    def on_failed(self, message):
+        """
+        Called when the worker raised an error.
+        """
+        self.running = False
+        if self.profiler.enabled:
+            self.profiler.stop()
+            self.profiler = NULL_PROFILER
+        self.start_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.show_error_popup(f"An error occurred during odds generation: {message}")
+
+
+def lower_thread_priority():
+    """
+    Give the calling worker thread a lower scheduling priority than the GUI thread, so that chart
+    updates are not delayed by the simulation on machines with few cores. Only supported on Linux,
+    where every thread has its own nice value.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+        except OSError:
+            pass
+
+
+class SimulationWorker(QObject):
+    """
+    Runs `engine.simulate_blocks` off the GUI thread and sends the bankroll and result histories
+    to the window in chunks, at most once every `interval` seconds.
+    """
+    progress = pyqtSignal(object, object)
+    finished = pyqtSignal(object, bool, bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                 staking="kelly", interval=0.1, profiler=NULL_PROFILER, seed=None):
+        super().__init__()
+        self.parameters = (bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability)
+        self.staking = staking
+        self.seed = seed
+        self.kelly_fraction = kelly_fraction
+        self.interval = interval
+        self.profiler = profiler
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        lower_thread_priority()
+        bankroll_chunks, results_chunks = [], []
+        last_update = time.monotonic()
+        ruined = False
+
+        try:
+            with TradeLedger(LEDGER_DIRECTORY) as ledger:
+                for block in simulate_blocks(*self.parameters, seed=self.seed, record_bets=True, staking=self.staking,
+                                             profiler=self.profiler):
+                    if self.cancelled:
+                        break
+                    with self.profiler.stage("ledger"):
+                        ledger.append_block(block)
+                    if TEXT_LOG_SAMPLE_EVERY is not None:
+                        with self.profiler.stage("logging"):
+                            log_block(block, self.kelly_fraction, TEXT_LOG_SAMPLE_EVERY)
+                    bankroll_chunks.append(block.bankroll)
+                    results_chunks.append(block.wins)
+                    ruined = block.ruined
+
+                    if time.monotonic() - last_update >= self.interval:
+                        self.progress.emit(np.concatenate(bankroll_chunks), np.concatenate(results_chunks))
+                        bankroll_chunks, results_chunks = [], []
+                        last_update = time.monotonic()
+        except Exception as e:
+            # Any error must reach the window, or it would wait for the simulation forever
+            logging.exception("Simulation failed")
+            self.failed.emit(str(e))
+            return
+
+        if bankroll_chunks:
+            self.progress.emit(np.concatenate(bankroll_chunks), np.concatenate(results_chunks))
+        self.finished.emit(None, ruined, self.cancelled)
+
+
+class EnsembleWorker(QObject):
+    """
+    Runs `engine.simulate_ensemble` off the GUI thread. Seeded ensembles are looked up in `cache` first.
+    """
+    finished = pyqtSignal(object, bool, bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                 number_of_paths, staking="kelly", profiler=NULL_PROFILER, seed=None, cache=None):
+        super().__init__()
+        self.parameters = (bankroll, number_of_variants, kelly_fraction, number_of_bets, inflated_probability,
+                           number_of_paths)
+        self.staking = staking
+        self.profiler = profiler
+        self.seed = seed
+        self.cache = cache
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        lower_thread_priority()
+        try:
+            run = simulate_ensemble if self.cache is None else self.cache.simulate_ensemble
+            result = run(*self.parameters, seed=self.seed, should_stop=lambda: self.cancelled, staking=self.staking,
+                         profiler=self.profiler)
+        except Exception as e:
+            logging.exception("Ensemble failed")
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(result, False, self.cancelled)
 
 
 class NewWindow(QWidget):
-    def __init__(self, bankroll_history, results_history):
+    def __init__(self, history, ensemble=None, number_of_bets=None, stats=None):
         super().__init__()
         self.setWindowIcon(QIcon(icon_path))
         self.setWindowTitle("Simulation Results")
 
-        self.bankroll_history = bankroll_history
-        self.results_history = results_history
+        # `history.History` of a single run, read through views without copying it
+        self.history = history
+        self.ensemble = ensemble
+        # Statistics of the displayed history, kept up to date by whoever extends it
+        self.stats = stats
+        # Set while a simulation of `number_of_bets` bets is still sending results
+        self.number_of_bets = number_of_bets
+        self.history_stats = None
+        # Range, bucket size and highest value of the last decimated bankroll line
+        self.decimated = None
+        self.background = None
+        self.last_rescale = 0
 
         layout = QVBoxLayout()
         self.setLayout(layout)
@@ -220,9 +567,19 @@ class NewWindow(QWidget):
         label.setStyleSheet("font-size: 18px; font-weight: bold;")
         layout.addWidget(label, alignment=Qt.AlignmentFlag.AlignTop)
 
-        # Matplotlib plot
+        # Matplotlib plot, with a toolbar to zoom and pan
         self.canvas = FigureCanvas(self.graph())
         layout.addWidget(self.canvas)
+        self.toolbar = NavigationToolbar2QT(self.canvas, self)
+        layout.addWidget(self.toolbar)
+
+        # Profile report of a profiled run, hidden otherwise
+        self.profile_view = QPlainTextEdit()
+        self.profile_view.setReadOnly(True)
+        self.profile_view.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.profile_view.setMaximumHeight(220)
+        self.profile_view.hide()
+        layout.addWidget(self.profile_view)
 
         # Close button
         close_button = QPushButton("Close")
@@ -239,76 +596,260 @@ class NewWindow(QWidget):
 
     
 
+    def show_profile(self, report):
+        """
+        Show a `profiling.Profiler` report below the chart, or hide the report area if `report` is None.
+        """
+        if report is None:
+            self.profile_view.hide()
+            return
+        self.profile_view.setPlainText(format_report(report))
+        self.profile_view.show()
+
     def graph(self):
         """
         Generate the matplotlib plot based on the passed data, with additional stats like
         bankroll increase and win/loss percentages.
         """
-        fig, ax = plt.subplots(2, 1, figsize=(8, 5))
+        if self.ensemble is not None:
+            return self.graph_ensemble()
+
+        fig = Figure(figsize=(8, 5))
+        ax = fig.subplots(2, 1)
+        self.ax = ax
 
-        ax[0].plot(range(len(self.bankroll_history)), self.bankroll_history, label="Bankroll", color="blue")
+        live = self.number_of_bets is not None
+        self.bankroll_line, = ax[0].plot([], [], label="Bankroll", color="blue", animated=live)
+        ax[0].callbacks.connect("xlim_changed", self.on_xlim_changed)
         ax[0].set_title("Bankroll Evolution Over Time")
         ax[0].set_xlabel("Number of Bets")
         ax[0].set_ylabel("Bankroll ($)")
         ax[0].grid(True)
         ax[0].legend()
 
-        
-        initial_bankroll = self.bankroll_history[0]
-        final_bankroll = self.bankroll_history[-1]
-        increase_percentage = ((final_bankroll - initial_bankroll) / initial_bankroll) * 100
-        ax[0].text(0.14, 1.05, f"Bankroll Results: {increase_percentage:.2f}%", ha="center", va="center", transform=ax[0].transAxes)
-        
-        ax[0].text(0.86, 1.05, f"Final Bankroll: ${final_bankroll:.2f}", ha="center", va="center", transform=ax[0].transAxes)
+        self.increase_text = ax[0].text(0.14, 1.05, "", ha="center", va="center", transform=ax[0].transAxes, animated=live)
+        self.final_text = ax[0].text(0.86, 1.05, "", ha="center", va="center", transform=ax[0].transAxes, animated=live)
 
-        
-        wins = sum(self.results_history)  
-        losses = len(self.results_history) - wins  
-
-        
-        ax[1].bar(["Wins", "Losses"], [wins, losses], color=["green", "red"])
+        self.bars = ax[1].bar(["Wins", "Losses"], [0, 0], color=["green", "red"], animated=live)
         ax[1].set_title("Wins and Losses")
         ax[1].set_xlabel("Result")
         ax[1].set_ylabel("Count")
         ax[1].grid(True)
 
-        
-        total_bets = len(self.results_history)
+        self.win_text = ax[1].text(0.14, 1.05, "", ha="center", va="center", transform=ax[1].transAxes, animated=live)
+        self.risk_text = ax[1].text(0.86, 1.05, "", ha="center", va="center", transform=ax[1].transAxes, animated=live)
+        self.animated_artists = [
+            self.bankroll_line, self.increase_text, self.final_text, *self.bars, self.win_text, self.risk_text
+        ]
+
+        self.reset_view()
+        # Fixed margins (those of a tight layout): computing the layout costs more than drawing the data
+        fig.subplots_adjust(left=0.1, right=0.9, bottom=0.12, top=0.93, hspace=0.5)
+
+        return fig
+
+    def reset(self, history, number_of_bets=None, stats=None):
+        """
+        Show the history of a new run in the existing figure.
+        """
+        self.history = history
+        self.number_of_bets = number_of_bets
+        self.stats = stats
+        self.history_stats = None
+        self.profile_view.hide()
+        self.toolbar.update()  # Forget the zoom history of the previous run
+        self.reset_view()
+        self.canvas.draw()
+        self.background = None
+
+    def reset_view(self):
+        """
+        Set the initial limits of the axes. While results are still arriving the x axis covers the
+        whole simulation and the changing artists are animated, so they can be blitted.
+        """
+        live = self.number_of_bets is not None
+        for artist in self.animated_artists:
+            artist.set_animated(live)
+        if live:
+            self.ax[0].set_xlim(0, self.number_of_bets)
+            self.ax[0].set_ylim(0, 2 * self.history.initial)
+            self.ax[1].set_ylim(0, 1)
+        self.refresh_graph()
+
+    def refresh_graph(self):
+        """
+        Update the plotted data and statistics from the current history.
+        """
+        if self.number_of_bets is not None:
+            top = self.decimate_line(*self.ax[0].get_xlim())
+        else:
+            top = self.decimate_line(0, self.history.count)
+        limits_changed = self.fit_limits(self.ax[0], top)
+
+        initial_bankroll = self.history.initial
+        final_bankroll = self.history.last
+        increase_percentage = ((final_bankroll - initial_bankroll) / initial_bankroll) * 100
+        self.increase_text.set_text(f"Bankroll Results: {increase_percentage:.2f}%")
+        self.final_text.set_text(f"Final Bankroll: ${final_bankroll:.2f}")
+
+        stats = self.stats
+        if stats is None:
+            if self.history_stats is None:
+                # Only a "full" history has every bankroll the statistics need
+                self.history_stats = RunningStats.from_history(self.history.bankroll, self.history.results())
+            stats = self.history_stats
+        wins, losses = stats.wins, stats.losses
+        for bar, count in zip(self.bars, (wins, losses)):
+            bar.set_height(count)
+        limits_changed = self.fit_limits(self.ax[1], max(wins, losses)) or limits_changed
+
+        total_bets = max(stats.count, 1)
         win_percentage = (wins / total_bets) * 100
         loss_percentage = (losses / total_bets) * 100
-        ax[1].text(0.14, 1.05, f"Win: {win_percentage:.2f}% / Loss: {loss_percentage:.2f}%", ha="center", va="center", transform=ax[1].transAxes)
+        self.win_text.set_text(f"Win: {win_percentage:.2f}% / Loss: {loss_percentage:.2f}%")
+        self.risk_text.set_text(
+            f"Max Drawdown: {stats.max_drawdown * 100:.2f}% / Losing Streak: {stats.longest_losing_streak}"
+        )
+
+        return limits_changed
+
+    def decimate_line(self, start, stop):
+        """
+        Plot the bankroll between bets `start` and `stop` reduced with `minmax_decimate` to two
+        points per pixel of the axes, so that drawing takes the same time for any history length
+        while every peak and trough stays visible.
+
+        :return: The highest plotted bankroll.
+        """
+        history = self.history
+        points = history.bankroll
+        # The limits are bet numbers; a "stride" or "ring" history keeps fewer points than bets
+        start, stop = history.point(start), history.point(stop)
+        bucket_size = (stop - start) / max(self.ax[0].bbox.width, 1)
+        start = int(min(max(start, 0), len(points)))
+        stop = int(min(max(np.ceil(stop) + 1, start), len(points)))
+
+        # Autoscaling and resizing move the limits slightly; keep the points while they still fit
+        if self.decimated is not None:
+            decimated, decimated_start, decimated_stop, decimated_bucket_size, top = self.decimated
+            if (decimated == (history, history.count) and (decimated_start, decimated_stop) == (start, stop)
+                    and 0.8 <= bucket_size / decimated_bucket_size <= 1.25):
+                return top
+
+        index, bankroll = minmax_decimate(points, bucket_size, start, stop)
+        finite = np.abs(bankroll) < 1e300  # Also drops overflowed (infinite or NaN) values
+        self.bankroll_line.set_data(history.bet_number(index[finite]), bankroll[finite])
+        top = bankroll[finite].max(initial=0)
+        self.decimated = ((history, history.count), start, stop, max(bucket_size, 1e-9), top)
+        return top
+
+    def on_xlim_changed(self, axis):
+        """
+        Re-decimate the bankroll from the full history for the new visible range after zooming or
+        panning. While results are arriving, the next update redraws the whole figure instead.
+        """
+        if self.number_of_bets is None:
+            self.decimate_line(*axis.get_xlim())
+        else:
+            self.background = None
+
+    def fit_limits(self, axis, top):
+        """
+        Make sure `top` is visible on the y axis. While results are still arriving the limit is
+        doubled whenever it is exceeded, at most once every `RESCALE_INTERVAL` seconds, so that the
+        full figure only has to be redrawn rarely.
+
+        :return: True if the limits of the axis changed.
+        """
+        if self.number_of_bets is None:
+            axis.relim()
+            axis.autoscale_view()
+            return True
+
+        bottom, limit = axis.get_ylim()
+        if top <= limit or time.monotonic() - self.last_rescale < RESCALE_INTERVAL:
+            return False
+        while top > limit:
+            limit *= 2
+        axis.set_ylim(bottom, limit)
+        return True
+
+    def update_results(self, history, final=False):
+        """
+        Show the displayed history again after bets were appended to it, e.g. by a running simulation.
+
+        While the simulation runs only the changing artists are redrawn on top of a cached background
+        (blitting). With `final=True` the figure goes back to normal autoscaled drawing.
+        """
+        self.history = history
+        self.history_stats = None
+
+        if final:
+            self.number_of_bets = None
+            for artist in self.animated_artists:
+                artist.set_animated(False)
+            self.refresh_graph()
+            self.canvas.draw_idle()
+            return
+
+        if self.refresh_graph() or self.background is None:
+            self.last_rescale = time.monotonic()
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        else:
+            self.canvas.restore_region(self.background)
+        for artist in self.animated_artists:
+            self.canvas.figure.draw_artist(artist)
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def graph_ensemble(self):
+        """
+        Generate the matplotlib plot of an ensemble run: percentile bands of the bankroll over time,
+        the probability of ruin and the distribution of the maximum drawdown of every path.
+        """
+        fig = Figure(figsize=(8, 5))
+        ax = fig.subplots(2, 1)
+
+        bands = dict(zip(self.ensemble.percentiles, self.ensemble.bands))
+        steps = range(self.ensemble.bands.shape[1])
+        for low, high, alpha in ((5, 95, 0.2), (25, 75, 0.4)):
+            if low in bands and high in bands:
+                ax[0].fill_between(steps, bands[low], bands[high], color="blue", alpha=alpha, label=f"{low}% - {high}%")
+        if 50 in bands:
+            ax[0].plot(steps, bands[50], label="Median", color="blue")
+        ax[0].set_yscale("symlog")
+        ax[0].set_title("Bankroll Evolution Over Time")
+        ax[0].set_xlabel("Number of Bets")
+        ax[0].set_ylabel("Bankroll ($)")
+        ax[0].grid(True)
+        ax[0].legend()
 
+        ax[0].text(0.14, 1.05, f"Ruin Probability: {self.ensemble.ruin_probability * 100:.2f}%", ha="center", va="center", transform=ax[0].transAxes)
+        ax[0].text(0.86, 1.05, f"Median Final Bankroll: ${self.ensemble.median_final_bankroll:.2f}", ha="center", va="center", transform=ax[0].transAxes)
 
+        ax[1].hist(self.ensemble.max_drawdown * 100, bins=50, color="red")
+        ax[1].set_title("Maximum Drawdown")
+        ax[1].set_xlabel("Drawdown (%)")
+        ax[1].set_ylabel("Paths")
+        ax[1].grid(True)
 
-        plt.tight_layout()
+        fig.tight_layout()
 
         return fig
 
 
-app = QApplication(sys.argv)
+def main():
+    """
+    Start the graphical interface.
+    """
+    configure_logging()
+    app = QApplication(sys.argv)
+    app.setStyleSheet(STYLE_SHEET)
 
-app.setStyleSheet("""
-    QWidget {
-        background-color: black;
-        color: white;
-    }
-    QPushButton {
-        background-color: yellow;
-        color: black;
-    }
-    QPushButton:hover {
-        background-color: rgb(255, 200, 0); /* Fundal la hover */
-    }   
-    QLineEdit { 
-        border: 2px solid yellow; 
-        border-radius: 5px; 
-        padding: 5px;
-        color: white;
-        background-color: rgb(50, 50, 50);
-    }
-""")
+    window = Window()
+    window.show()
+    return app.exec()
 
 
-window = Window()
-window.show()
-sys.exit(app.exec())
+if __name__ == "__main__":
+    sys.exit(main())
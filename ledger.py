@@ -0,0 +1,135 @@
+import json
+import os
+
+import numpy as np
+
+LEDGER_COLUMNS = (
+    ("bet_index", np.int64),
+    ("variant_index", np.int32),
+    ("odds", np.float32),
+    ("probability", np.float32),
+    ("kelly", np.float32),
+    ("stake", np.float64),
+    ("winner", np.int32),
+    ("bankroll", np.float64),
+)
+HEADER_FILE = "header.json"
+DEFAULT_BUFFER_SIZE = 1 << 18
+
+
+class TradeLedger:
+    """
+    Append-only, columnar binary record of every bet of a simulation.
+
+    A ledger is a directory with one raw little-endian file per column of `LEDGER_COLUMNS` and a
+    `header.json` describing them. Records are copied into preallocated column buffers and written
+    in large blocks when a buffer fills up, so appending a block of bets costs a few array copies
+    instead of formatting text. Use `read_ledger` to open a ledger with memory-mapping.
+
+    Usage:
+        with TradeLedger("betting_ledger") as ledger:
+            for block in simulate_blocks(..., record_bets=True):
+                ledger.append_block(block)
+    """
+
+    def __init__(self, directory, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.buffers = {name: np.empty(buffer_size, dtype=dtype) for name, dtype in LEDGER_COLUMNS}
+        self.count = 0
+        self.records = 0
+
+        os.makedirs(directory, exist_ok=True)
+        header = {"columns": [[name, np.dtype(dtype).newbyteorder("<").str] for name, dtype in LEDGER_COLUMNS]}
+        with open(os.path.join(directory, HEADER_FILE), "w") as file:
+            json.dump(header, file)
+        self.files = {name: open(column_path(directory, name), "wb") for name, _ in LEDGER_COLUMNS}
+
+    def append(self, **columns):
+        """
+        Append records given as one array (or scalar) per column of `LEDGER_COLUMNS`.
+        """
+        length = len(np.atleast_1d(columns["bet_index"]))
+        columns = {name: np.broadcast_to(columns[name], length) for name, _ in LEDGER_COLUMNS}
+
+        start = 0
+        while start < length:
+            size = min(length - start, self.buffer_size - self.count)
+            for name, values in columns.items():
+                self.buffers[name][self.count:self.count + size] = values[start:start + size]
+            self.count += size
+            start += size
+            if self.count == self.buffer_size:
+                self.flush()
+
+    def append_block(self, block):
+        """
+        Append the bets of a `SimulationBlock` recorded with `record_bets=True`. The bankroll column
+        holds the bankroll after each bet (0 for a bet that ran out of money).
+        """
+        placed = len(block.bet_index)
+        bankroll = block.bankroll
+        if len(bankroll) < placed:
+            bankroll = np.concatenate((bankroll, [0.0]))
+
+        self.append(
+            bet_index=block.bet_index,
+            variant_index=block.choice,
+            odds=block.odds,
+            probability=block.probability,
+            kelly=block.kelly,
+            stake=block.stake,
+            winner=block.winner,
+            bankroll=bankroll,
+        )
+
+    def flush(self):
+        """
+        Write the buffered records to the column files.
+        """
+        if self.count:
+            for name, file in self.files.items():
+                # The header declares little-endian columns, whatever the byte order of this machine
+                buffer = self.buffers[name][:self.count]
+                buffer.astype(buffer.dtype.newbyteorder("<"), copy=False).tofile(file)
+            self.records += self.count
+            self.count = 0
+        for file in self.files.values():
+            file.flush()
+
+    def close(self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+    def __len__(self):
+        return self.records + self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def column_path(directory, name):
+    return os.path.join(directory, f"{name}.bin")
+
+
+def read_ledger(directory):
+    """
+    Open a ledger written by `TradeLedger` without loading it into memory.
+
+    :param directory: The ledger directory.
+    :return: A dictionary of read-only `numpy.memmap` arrays, one per column. Records that were
+             only partially written (e.g. by an interrupted run) are left out.
+    """
+    with open(os.path.join(directory, HEADER_FILE)) as file:
+        columns = [(name, np.dtype(dtype)) for name, dtype in json.load(file)["columns"]]
+
+    length = min(os.path.getsize(column_path(directory, name)) // dtype.itemsize for name, dtype in columns)
+    return {
+        name: np.memmap(column_path(directory, name), dtype=dtype, mode="r", shape=(length,)) if length
+        else np.empty(0, dtype=dtype)
+        for name, dtype in columns
+    }
@@ -0,0 +1,557 @@
+import argparse
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from checkpoint import save_npz_atomic
+from engine import LOG_FILE
+from history import History
+from stats import RunningStats
+
+INDEX_SUFFIX = ".index.npz"
+INDEX_VERSION = 1
+# The index keeps the byte offset of every INDEX_EVERY-th logged bet of a simulation
+INDEX_EVERY = 10000
+DEFAULT_CHUNK_SIZE = 64 << 20
+# Smaller chunks for `read_bets`, which usually needs a few thousand bets
+READ_CHUNK_SIZE = 1 << 20
+# Length of "2024-11-26 20:53:14,282 - INFO - ", the prefix `engine.LOG_FORMAT` puts before every message
+MESSAGE_OFFSET = 33
+# Longest bankroll parsed by `parse_numbers`; longer ones (and inf or nan) go through float()
+NUMBER_WIDTH = 24
+POWERS_OF_TEN = 10.0 ** np.arange(23)
+AMOUNT = re.compile(rb"(Gained|Lost): \$([^ ]*)\. ")
+BET_NUMBER = re.compile(rb"Bet #(\d+):")
+
+
+@dataclass
+class LogChunk:
+    """
+    The lines of a byte range of a betting log that the analyzer uses. Every logged bet has a
+    "Win!" or "Lose." line with the bankroll after it, followed by a "Bet #N" line with its details.
+    """
+    result_offsets: np.ndarray  # Byte offset of every "Win!" or "Lose." line
+    wins: np.ndarray  # 1 for "Win!", 0 for "Lose."
+    bankroll: np.ndarray  # New bankroll of every result line
+    start_offsets: np.ndarray  # Byte offset of every "Simulation started." line
+
+
+def open_log(path):
+    """
+    Map a log file into memory as a read-only byte array.
+    """
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=np.uint8)
+    # A plain array view of the mapping: indexing a `numpy.memmap` itself is much slower
+    return np.memmap(path, dtype=np.uint8, mode="r").view(np.ndarray)
+
+
+def line_at(data, offset, length=512):
+    """
+    Return the line starting at byte `offset`, without its newline.
+    """
+    return bytes(data[offset:offset + length]).split(b"\n", 1)[0]
+
+
+def next_line(data, position, step=1 << 16):
+    """
+    Return the offset of the first line starting at or after `position`.
+    """
+    if position <= 0:
+        return 0
+    position -= 1
+    while position < len(data):
+        newlines = np.flatnonzero(data[position:position + step] == 10)
+        if len(newlines):
+            return position + int(newlines[0]) + 1
+        position += step
+    return len(data)
+
+
+def chunk_bounds(data, chunk_size=DEFAULT_CHUNK_SIZE, start=0, stop=None):
+    """
+    Split bytes `start` to `stop` of a log into ranges of about `chunk_size` bytes that start and
+    end on line boundaries.
+
+    :return: A list of (start, stop) offsets.
+    """
+    stop = len(data) if stop is None else stop
+    bounds = []
+    while start < stop:
+        end = stop if stop - start <= chunk_size else min(next_line(data, start + chunk_size), stop)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def parse_numbers(fields):
+    """
+    Parse decimal numbers of up to `NUMBER_WIDTH` characters at once, one per column of `fields`
+    (right-aligned and padded with zero bytes on top), e.g. "1049.8", "-3.5" or "4.97e+302".
+
+    The digits are accumulated into an integer mantissa, which is then scaled by one exact power
+    of ten. While the mantissa is below 2**53 and the power at most 1e22 this gives exactly the
+    float Python would parse.
+
+    :return: A tuple (values, parsed); parsed is False for the numbers this cannot convert exactly,
+             which the caller parses with float() instead.
+    """
+    # Only the rows holding a character of at least one number
+    fields = fields[np.argmax(fields.any(axis=1)):]
+    count = fields.shape[1]
+    mantissa = np.zeros(count)
+    exponent = np.zeros(count, dtype=np.int64)
+    decimals = np.zeros(count, dtype=np.int64)
+    seen_dot = np.zeros(count, dtype=bool)
+    seen_exponent = np.zeros(count, dtype=bool)
+    negative = np.zeros(count, dtype=bool)
+    negative_exponent = np.zeros(count, dtype=bool)
+    parsed = np.ones(count, dtype=bool)
+
+    for row in fields:
+        digit = row - 48  # Wraps around for every byte below "0"
+        is_digit = digit < 10
+        in_mantissa = is_digit & ~seen_exponent
+        mantissa = np.where(in_mantissa, mantissa * 10 + digit, mantissa)
+        decimals += in_mantissa & seen_dot
+        exponent = np.where(is_digit & seen_exponent, exponent * 10 + digit, exponent)
+
+        minus = row == ord("-")
+        negative |= minus & ~seen_exponent
+        negative_exponent |= minus & seen_exponent
+        seen_dot |= row == ord(".")
+        seen_exponent |= row == ord("e")
+        parsed &= is_digit | (row == 0) | minus | (row == ord("+")) | (row == ord(".")) | (row == ord("e"))
+
+    scale = np.where(negative_exponent, -exponent, exponent) - decimals
+    parsed &= (mantissa < 2 ** 53) & (np.abs(scale) < len(POWERS_OF_TEN))
+    power = POWERS_OF_TEN[np.minimum(np.abs(scale), len(POWERS_OF_TEN) - 1)]
+    values = np.where(scale < 0, mantissa / power, mantissa * power)
+    return np.where(negative, -values, values), parsed
+
+
+def parse_range(data, start, stop):
+    """
+    Parse the lines between byte offsets `start` and `stop` (on line boundaries) with vectorised
+    byte operations: the lines are found from the newlines, told apart by the first letters of
+    their message and the bankroll is read from the end of every result line. A last line without
+    a newline, e.g. one still being written, is left out.
+
+    :return: A `LogChunk` with absolute offsets.
+    """
+    chunk = data[start:stop]
+    ends = np.flatnonzero(chunk == 10)
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+
+    # Lines too short to hold a message point at their own newline instead
+    first = chunk[np.minimum(starts + MESSAGE_OFFSET, ends)]
+    second = chunk[np.minimum(starts + MESSAGE_OFFSET + 1, ends)]
+    is_win = (first == ord("W")) & (second == ord("i"))
+    is_result = is_win | ((first == ord("L")) & (second == ord("o")))
+    is_start = (first == ord("S")) & (chunk[np.minimum(starts + MESSAGE_OFFSET + 11, ends)] == ord("s"))
+
+    # The bankroll ends every result line, after its last "$"
+    result_ends = ends[is_result]
+    windows = sliding_window_view(chunk, NUMBER_WIDTH) if len(chunk) >= NUMBER_WIDTH else np.empty((0, NUMBER_WIDTH), np.uint8)
+    fields = np.ascontiguousarray(windows[np.maximum(result_ends - NUMBER_WIDTH, 0)].T)
+    dollar = fields[::-1] == ord("$")
+    found = dollar.any(axis=0)
+    last_dollar = NUMBER_WIDTH - 1 - dollar.argmax(axis=0)
+    after_dollar = np.arange(NUMBER_WIDTH)[:, None] > last_dollar
+    bankroll, parsed = parse_numbers(np.where(after_dollar, fields, 0))
+
+    # Numbers the vectorised parser cannot convert exactly, e.g. bankrolls grown past 1e22
+    result_starts = starts[is_result]
+    slow = np.flatnonzero(~parsed & found)
+    if len(slow):
+        # One fixed-width string per number, padded with leading spaces
+        padded = np.where(after_dollar[:, slow], fields[:, slow], ord(" "))
+        bankroll[slow] = np.ascontiguousarray(padded.T).view(f"S{NUMBER_WIDTH}").ravel().astype(np.float64)
+    for i in np.flatnonzero(~found):
+        line = bytes(chunk[result_starts[i]:result_ends[i]])
+        bankroll[i] = float(line[line.rindex(b"$") + 1:])
+
+    return LogChunk(
+        result_offsets=start + result_starts,
+        wins=is_win[is_result].astype(np.int8),
+        bankroll=bankroll,
+        start_offsets=start + starts[is_start],
+    )
+
+
+def scan_chunk(path, start, stop):
+    """
+    `parse_range` of a log file, for worker processes.
+    """
+    return parse_range(open_log(path), start, stop)
+
+
+def scan_log(path, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=1, start=0, stop=None):
+    """
+    Parse a log in chunks split on line boundaries, in order. With several workers the chunks
+    are parsed in parallel processes; at most two chunks per worker are pending at a time, so
+    memory stays bounded whatever the size of the log.
+
+    :return: An iterator of `LogChunk`.
+    """
+    bounds = chunk_bounds(open_log(path), chunk_size, start, stop)
+    if max_workers <= 1:
+        for chunk_start, chunk_stop in bounds:
+            yield scan_chunk(path, chunk_start, chunk_stop)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for chunk_start, chunk_stop in bounds:
+            pending.append(executor.submit(scan_chunk, path, chunk_start, chunk_stop))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class LogIndex:
+    """
+    Sidecar index of a betting log, built in one streaming pass (see `build_index`).
+
+    For every simulation (from one "Simulation started." line to the next) it keeps:
+        - its byte range;
+        - the number of logged bets;
+        - the initial and final bankroll and whether it ran out of money;
+        - the `RunningStats` of its logged bets.
+
+    The index also keeps the byte offset, bet number and preceding bankroll of every
+    `INDEX_EVERY`-th logged bet, so `read_bets` reads any part of a simulation without scanning it
+    from the start. Simulations without any bet (ensembles and runs loaded from the cache) are
+    listed with 0 bets.
+
+    The statistics are those of the logged bets. They are exact for logs of every bet; a log
+    written with `--log-every` or `TEXT_LOG_SAMPLE_EVERY` only holds one bet in so many.
+    """
+
+    def __init__(self, log_size=0, log_mtime=0, every=INDEX_EVERY):
+        self.log_size = log_size
+        self.log_mtime = log_mtime
+        self.every = every
+        self.offsets = []
+        self.bets = []
+        self.initial_bankroll = []
+        self.final_bankroll = []
+        self.stats = []
+        self.checkpoints = []  # (simulation, logged bet, bet number, byte offset, bankroll before it)
+
+    def __len__(self):
+        return len(self.bets)
+
+    @property
+    def ruined(self):
+        return [stats.ruined for stats in self.stats]
+
+    def simulation_range(self, simulation):
+        """
+        Byte range of a simulation.
+        """
+        stop = self.offsets[simulation + 1] if simulation + 1 < len(self.offsets) else self.log_size
+        return self.offsets[simulation], stop
+
+    def arrays(self):
+        checkpoints = np.array(self.checkpoints, dtype=np.float64).reshape(-1, 5)
+        return {
+            "version": np.asarray(INDEX_VERSION),
+            "log_size": np.asarray(self.log_size),
+            "log_mtime": np.asarray(self.log_mtime),
+            "every": np.asarray(self.every),
+            "offsets": np.array(self.offsets, dtype=np.int64),
+            "bets": np.array(self.bets, dtype=np.int64),
+            "initial_bankroll": np.array(self.initial_bankroll),
+            "final_bankroll": np.array(self.final_bankroll),
+            "checkpoint_simulation": checkpoints[:, 0].astype(np.int64),
+            "checkpoint_bet": checkpoints[:, 1].astype(np.int64),
+            "checkpoint_number": checkpoints[:, 2].astype(np.int64),
+            "checkpoint_offset": checkpoints[:, 3].astype(np.int64),
+            "checkpoint_bankroll": checkpoints[:, 4],
+            **{"stats_" + name: np.array([getattr(stats, name) for stats in self.stats], dtype=type(value))
+               for name, value in vars(RunningStats()).items()},
+        }
+
+    def save(self, path):
+        save_npz_atomic(path, self.arrays())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            data = {name: data[name].tolist() for name in data.files}
+        if data["version"] != INDEX_VERSION:
+            raise ValueError(f"Unsupported log index version: {path}")
+        index = cls(data["log_size"], data["log_mtime"], data["every"])
+        index.offsets = data["offsets"]
+        index.bets = data["bets"]
+        index.initial_bankroll = data["initial_bankroll"]
+        index.final_bankroll = data["final_bankroll"]
+        index.checkpoints = list(zip(data["checkpoint_simulation"], data["checkpoint_bet"], data["checkpoint_number"],
+                                     data["checkpoint_offset"], data["checkpoint_bankroll"]))
+        for simulation in range(len(index.bets)):
+            stats = RunningStats()
+            for name in vars(stats):
+                setattr(stats, name, data["stats_" + name][simulation])
+            index.stats.append(stats)
+        return index
+
+    def matches(self, path):
+        """
+        Whether the index describes the current content of the log at `path`.
+        """
+        status = os.stat(path)
+        return (status.st_size, status.st_mtime_ns) == (self.log_size, self.log_mtime)
+
+
+class IndexBuilder:
+    """
+    Fold the `LogChunk` of a log, in order, into a `LogIndex`.
+    """
+
+    def __init__(self, data, index):
+        self.data = data
+        self.index = index
+        self.stats = None
+        self.initial = float("nan")
+        self.bankroll = None
+
+    def start(self, offset):
+        self.finish()
+        self.index.offsets.append(int(offset))
+        self.index.bets.append(0)
+        self.stats = RunningStats()
+        self.initial = float("nan")
+        self.bankroll = None
+
+    def finish(self):
+        if self.stats is None:
+            return
+        self.index.initial_bankroll.append(self.initial)
+        self.index.final_bankroll.append(float("nan") if self.bankroll is None else self.bankroll)
+        self.index.stats.append(self.stats)
+        self.stats = None
+
+    def first_bankroll(self, offset, bankroll):
+        """
+        Bankroll before the first logged bet of a simulation, from the amount won or lost on it.
+        """
+        match = AMOUNT.search(line_at(self.data, offset))
+        if match is None:
+            return bankroll
+        amount = float(match.group(2))
+        return round(bankroll - amount if match.group(1) == b"Gained" else bankroll + amount, 2)
+
+    def add(self, offsets, wins, bankroll):
+        """
+        Add consecutive result lines of the current simulation.
+        """
+        if not len(offsets):
+            return
+        if self.stats is None:
+            # Bets logged before any "Simulation started." line
+            self.start(0)
+        if self.bankroll is None:
+            self.initial = self.bankroll = self.first_bankroll(offsets[0], bankroll[0])
+
+        # A run that runs out of money ends with a lost bet to $0, which is not counted as a bet
+        ruined = bankroll[-1] <= 0
+        if ruined:
+            offsets, wins, bankroll = offsets[:-1], wins[:-1], bankroll[:-1]
+
+        simulation = len(self.index.offsets) - 1
+        placed = self.index.bets[-1]
+        before = np.concatenate(([self.bankroll], bankroll[:-1]))
+        for position in np.flatnonzero((placed + np.arange(len(offsets))) % self.index.every == 0):
+            offset = int(offsets[position])
+            number = BET_NUMBER.search(line_at(self.data, next_line(self.data, offset + 1)))
+            self.index.checkpoints.append((simulation, placed + int(position),
+                                           int(number.group(1)) if number else -1, offset, float(before[position])))
+
+        with np.errstate(over="ignore"):
+            self.stats.update(self.bankroll, bankroll, wins, ruined)
+        self.index.bets[-1] += len(offsets)
+        if len(bankroll):
+            self.bankroll = float(bankroll[-1])
+        if ruined:
+            self.bankroll = 0.0
+
+    def add_chunk(self, chunk):
+        splits = np.searchsorted(chunk.result_offsets, chunk.start_offsets)
+        pieces = np.split(np.arange(len(chunk.result_offsets)), splits)
+        for number, piece in enumerate(pieces):
+            if number:
+                self.start(chunk.start_offsets[number - 1])
+            self.add(chunk.result_offsets[piece], chunk.wins[piece], chunk.bankroll[piece])
+
+
+def build_index(path, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=1, every=INDEX_EVERY):
+    """
+    Index a betting log in a single streaming pass, see `LogIndex`.
+
+    :param path: The log file, e.g. betting_log.txt.
+    :param chunk_size: Bytes parsed at a time; memory use is a small multiple of it per worker.
+    :param max_workers: Number of processes parsing chunks in parallel (in this process for one).
+    :param every: Logged bets between two entries of the bet offset index.
+    :return: The `LogIndex`.
+    """
+    status = os.stat(path)
+    index = LogIndex(status.st_size, status.st_mtime_ns, every)
+    builder = IndexBuilder(open_log(path), index)
+    for chunk in scan_log(path, chunk_size, max_workers, stop=status.st_size):
+        builder.add_chunk(chunk)
+    builder.finish()
+    return index
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def open_index(path, rebuild=False, **kwargs):
+    """
+    Load the sidecar index of a log (`path` + `INDEX_SUFFIX`), building and saving it first if it
+    is missing, damaged or older than the log.
+
+    :param kwargs: Arguments of `build_index`.
+    """
+    sidecar = index_path(path)
+    if not rebuild:
+        try:
+            index = LogIndex.load(sidecar)
+            if index.matches(path):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+    index = build_index(path, **kwargs)
+    try:
+        index.save(sidecar)
+    except OSError:
+        pass  # A read-only archive is still analyzed, just not indexed for next time
+    return index
+
+
+def read_bets(path, index, simulation, first=0, number=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Read logged bets `first` to `first + number` of a simulation, starting from the closest entry
+    of the index instead of the start of the log.
+
+    :return: A tuple (bankroll before the first bet, bankroll after every bet, wins).
+    """
+    total = index.bets[simulation]
+    first = min(first, total)
+    stop = total if number is None else min(first + number, total)
+    start, end = index.simulation_range(simulation)
+    skip, before = first, index.initial_bankroll[simulation]
+    for entry, placed, _, offset, bankroll in index.checkpoints:
+        if entry == simulation and placed <= first:
+            start, skip, before = offset, first - placed, bankroll
+
+    bankroll, wins = [], []
+    needed = skip + stop - first
+    read = 0
+    for chunk in scan_log(path, chunk_size, start=start, stop=end):
+        bankroll.append(chunk.bankroll)
+        wins.append(chunk.wins)
+        read += len(chunk.bankroll)
+        if read >= needed:
+            break
+    bankroll = np.concatenate([np.empty(0)] + bankroll)[:min(needed, total - first + skip)]
+    wins = np.concatenate([np.empty(0, np.int8)] + wins)[:len(bankroll)]
+    if skip:
+        before = bankroll[skip - 1]
+    return before, bankroll[skip:skip + stop - first], wins[skip:skip + stop - first]
+
+
+def read_history(path, index, simulation, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Rebuild the bankroll and win history of a simulation for `interface.NewWindow`, reading only
+    its part of the log.
+
+    :param kwargs: Storage options of `history.History` (dtype, retention, points, memory_budget).
+    :return: A tuple (`history.History`, `RunningStats`).
+    """
+    bets = index.bets[simulation]
+    history = History(bets, index.initial_bankroll[simulation], **kwargs)
+    start, stop = index.simulation_range(simulation)
+    for chunk in scan_log(path, chunk_size, start=start, stop=stop):
+        remaining = bets - history.count
+        history.append(chunk.bankroll[:remaining], chunk.wins[:remaining])
+    return history, index.stats[simulation]
+
+
+def money(value):
+    return f"${value:.2f}" if abs(value) < 1e12 else f"${value:.4g}"
+
+
+def format_index(index):
+    """
+    Format the simulations of an index as a table.
+    """
+    lines = [f"{'#':>4} {'Bets':>10} {'Initial':>14} {'Final':>16} {'Win rate':>9} {'Drawdown':>9} {'Streak':>7}"]
+    for simulation, stats in enumerate(index.stats):
+        if not index.bets[simulation]:
+            lines.append(f"{simulation:>4} {0:>10} {'(no bets logged)':>14}")
+            continue
+        final = "ruined" if stats.ruined else money(index.final_bankroll[simulation])
+        lines.append(
+            f"{simulation:>4} {index.bets[simulation]:>10} {money(index.initial_bankroll[simulation]):>14} "
+            f"{final:>16} {stats.win_rate * 100:>8.2f}% {stats.max_drawdown * 100:>8.2f}% "
+            f"{stats.longest_losing_streak:>7}"
+        )
+    return "\n".join(lines)
+
+
+def show_history(history, stats):
+    """
+    Open a rebuilt history in the results window of the interface.
+    """
+    from PyQt6.QtWidgets import QApplication
+    from interface import NewWindow, STYLE_SHEET
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    app.setStyleSheet(STYLE_SHEET)
+    window = NewWindow(history, stats=stats)
+    window.show()
+    return app.exec()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m logscan", description="Index and analyze betting logs (betting_log.txt)."
+    )
+    parser.add_argument("log", nargs="?", default=LOG_FILE, help="The log file.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes parsing the log.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE >> 20, metavar="MB",
+                        help="Megabytes parsed at a time by every worker.")
+    parser.add_argument("--rebuild", action="store_true", help=f"Rebuild the {INDEX_SUFFIX} index of the log.")
+    parser.add_argument("--show", type=int, default=None, metavar="SIMULATION",
+                        help="Open the history of a simulation in the results window.")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("The number of workers and the chunk size must be positive.")
+    if not os.path.exists(args.log):
+        parser.error(f"No such log file: {args.log}")
+
+    index = open_index(args.log, rebuild=args.rebuild, chunk_size=args.chunk_size << 20, max_workers=args.workers)
+    print(format_index(index))
+    if args.show is not None:
+        if not 0 <= args.show < len(index) or not index.bets[args.show]:
+            parser.error(f"Simulation {args.show} does not exist or has no logged bets.")
+        history, stats = read_history(args.log, index, args.show)
+        return show_history(history, stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
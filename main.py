@@ -1,11 +1,5 @@
 import sys
-from PyQt6.QtWidgets import QApplication
-from interface import Window
+from interface import main
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    
-    window = Window()
-    window.show()
-    
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,108 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+
+def variant_name(index):
+    """
+    Return the display name of a variant index: "Variant A" to "Variant Z", then "Variant AA",
+    "Variant AB", ... like spreadsheet columns, so that markets of any size get readable names.
+    """
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return f"Variant {letters}"
+
+
+def variant_index(name):
+    """
+    Inverse of `variant_name`.
+    """
+    index = 0
+    for letter in name.removeprefix("Variant "):
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+class VariantNames(Sequence):
+    """
+    Lazy name table of a market: names are only built when they are looked up.
+    """
+
+    def __init__(self, length):
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [variant_name(i) for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("variant index out of range")
+        return variant_name(index)
+
+    def index(self, name, *args):
+        index = variant_index(name) if name.startswith("Variant ") else -1
+        if not 0 <= index < self.length or variant_name(index) != name:
+            raise ValueError(f"{name!r} is not a variant of this market")
+        return index
+
+
+class Market:
+    """
+    A betting market stored as contiguous float arrays indexed by integer variant ids.
+
+    `odds[i]` and `probabilities[i]` belong to variant `i`; `names[i]` is its display name, which
+    is only built on demand. Markets created from dictionaries keep the dictionary keys as names.
+
+    :param odds: Odds of every variant.
+    :param probabilities: Optional probability of every variant.
+    :param names: Optional sequence of variant names (defaults to the lazy "Variant A", ... table).
+    """
+
+    __slots__ = ("odds", "probabilities", "_names")
+
+    def __init__(self, odds, probabilities=None, names=None):
+        self.odds = np.ascontiguousarray(odds, dtype=float)
+        self.probabilities = None if probabilities is None else np.ascontiguousarray(probabilities, dtype=float)
+        self._names = names
+
+    @classmethod
+    def from_dict(cls, odds_dict, probabilities_dict=None):
+        """
+        Build a market from the dictionaries used by `functions_library` (keys are variant names).
+        """
+        names = list(odds_dict)
+        probabilities = None
+        if probabilities_dict is not None:
+            probabilities = np.fromiter((probabilities_dict[name] for name in names), dtype=float, count=len(names))
+        return cls(np.fromiter(odds_dict.values(), dtype=float, count=len(names)), probabilities, names)
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = VariantNames(len(self.odds))
+        return self._names
+
+    def with_probabilities(self, probabilities):
+        """
+        Return a market with the same odds and names and the given probabilities.
+        """
+        return Market(self.odds, probabilities, self._names)
+
+    def odds_dict(self):
+        return dict(zip(self.names, self.odds.tolist()))
+
+    def probabilities_dict(self):
+        return dict(zip(self.names, self.probabilities.tolist()))
+
+    def __len__(self):
+        return len(self.odds)
+
+    def __repr__(self):
+        return f"Market({len(self)} variants)"
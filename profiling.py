@@ -0,0 +1,279 @@
+import collections
+import gc
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class _Stage:
+    """
+    Context manager timing one pass through a stage of a `Profiler`.
+    """
+    __slots__ = ("profiler", "name", "start", "memory")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.memory:
+            self.memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        timing = self.profiler.timings[self.name]
+        timing[0] += 1
+        timing[1] += seconds
+        if self.profiler.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            timing[2] += current - self.memory
+            timing[3] = max(timing[3], peak - self.memory)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullProfiler:
+    """
+    A profiler that records nothing. Instrumented functions use it when no profiler is given, so
+    that a disabled profiler costs one method call per block of bets.
+    """
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, amount=1):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """
+    Collects the cumulative time and number of calls of every stage of a run (odds generation,
+    probability inflation, sampling, staking, bankroll update, logging, plotting...) and counters
+    of the work done (blocks, markets, bets).
+
+    The engine times whole blocks of bets, so the cost of an enabled profiler does not depend on the
+    number of bets. Memory tracing with `tracemalloc` (which also sees NumPy buffers) is more
+    expensive and only enabled with `memory=True`. The peak of every stage is measured by resetting
+    the process-wide `tracemalloc` peak, so memory mode is for single-threaded runs: stages timed on
+    two threads at once (as in the GUI, which never enables it) corrupt each other's peaks.
+
+    Usage::
+
+        with Profiler() as profiler:
+            simulate(1000, 3, 0.5, 10 ** 6, 5, profiler=profiler)
+        print(profiler.to_json())
+
+    :param memory: Also record the net allocated and peak traced memory of every stage. Only for
+                   profilers used by a single thread.
+    :param hooks: Objects with `start(profiler)`, `stop()` and `report()` methods, such as
+                  `StackSampler`, started and stopped together with the profiler. Their reports are
+                  included under "hooks".
+    """
+    enabled = True
+
+    def __init__(self, memory=False, hooks=()):
+        self.memory = memory
+        self.hooks = list(hooks)
+        # name: [calls, seconds, allocated bytes, peak bytes]
+        self.timings = collections.defaultdict(lambda: [0, 0.0, 0, 0])
+        self.counters = collections.Counter()
+        self.wall_seconds = 0.0
+        self.started = None
+        self.gc_collections = 0
+        self.stopped_tracing = False
+
+    def stage(self, name):
+        """
+        Return a context manager adding the time spent inside it to stage `name`.
+        """
+        return _Stage(self, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.stopped_tracing = True
+        self.gc_collections = -sum(generation["collections"] for generation in gc.get_stats())
+        for hook in self.hooks:
+            hook.start(self)
+        self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self.started is None:
+            return self
+        self.wall_seconds += time.perf_counter() - self.started
+        self.started = None
+        for hook in self.hooks:
+            hook.stop()
+        self.gc_collections += sum(generation["collections"] for generation in gc.get_stats())
+        if self.stopped_tracing:
+            tracemalloc.stop()
+            self.stopped_tracing = False
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def report(self):
+        """
+        Return the collected data as a JSON-serializable dictionary. `share` is the fraction of the
+        wall time spent in a stage; stages run on different threads may overlap.
+        """
+        wall_seconds = self.wall_seconds
+        if self.started is not None:
+            wall_seconds += time.perf_counter() - self.started
+
+        stages = {}
+        for name, (calls, seconds, allocated, peak) in sorted(self.timings.items(), key=lambda item: -item[1][1]):
+            stages[name] = {"calls": calls, "seconds": seconds, "share": seconds / wall_seconds if wall_seconds else 0.0}
+            if self.memory:
+                stages[name]["allocated_bytes"] = allocated
+                stages[name]["peak_bytes"] = peak
+
+        return {
+            "wall_seconds": wall_seconds,
+            "stages": stages,
+            "counters": dict(self.counters),
+            "gc_collections": self.gc_collections,
+            "max_rss_bytes": max_rss(),
+            "hooks": {type(hook).__name__: hook.report() for hook in self.hooks},
+        }
+
+    def to_json(self, indent=1):
+        return json.dumps(self.report(), indent=indent)
+
+
+def max_rss():
+    """
+    Return the peak resident memory of the process in bytes, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class StackSampler:
+    """
+    A sampling profiler hook. A background thread looks at the stack of the profiled thread every
+    `interval` seconds and counts the innermost function and the innermost function of this
+    package, so that time spent inside NumPy can still be attributed to the engine function that
+    called it.
+
+    :param interval: Seconds between samples.
+    :param top: Number of most frequent functions to report.
+    """
+
+    def __init__(self, interval=0.005, top=20):
+        self.interval = interval
+        self.top = top
+        self.samples = 0
+        self.functions = collections.Counter()
+        self.callers = collections.Counter()
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self, profiler=None):
+        self.target = threading.get_ident()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="StackSampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        package = __file__.rsplit("profiling.py", 1)[0]
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.functions[f"{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})"] += 1
+            while frame is not None and not frame.f_code.co_filename.startswith(package):
+                frame = frame.f_back
+            if frame is not None:
+                self.callers[f"{frame.f_code.co_name}:{frame.f_lineno}"] += 1
+
+    def report(self):
+        return {
+            "interval": self.interval,
+            "samples": self.samples,
+            "functions": dict(self.functions.most_common(self.top)),
+            "package_functions": dict(self.callers.most_common(self.top)),
+        }
+
+
+def format_report(report):
+    """
+    Format a `Profiler.report` as a text table of the stages followed by the counters.
+    """
+    lines = [f"{'Stage':<16}{'Calls':>10}{'Seconds':>12}{'Share':>9}"]
+    for name, stage in report["stages"].items():
+        line = f"{name:<16}{stage['calls']:>10}{stage['seconds']:>12.4f}{stage['share'] * 100:>8.1f}%"
+        if "peak_bytes" in stage:
+            line += f"  peak {stage['peak_bytes'] / 2 ** 20:.1f} MiB, net {stage['allocated_bytes'] / 2 ** 20:+.1f} MiB"
+        lines.append(line)
+    lines.append(f"{'Wall time':<16}{'':>10}{report['wall_seconds']:>12.4f}")
+    lines.append("")
+    lines.extend(f"{name}: {value}" for name, value in report["counters"].items())
+    lines.append(f"Garbage collections: {report['gc_collections']}")
+    if report["max_rss_bytes"] is not None:
+        lines.append(f"Peak resident memory: {report['max_rss_bytes'] / 2 ** 20:.1f} MiB")
+    for name, hook in report["hooks"].items():
+        if "package_functions" in hook:
+            lines.append(f"{name}: {hook['samples']} samples")
+            lines.extend(f"  {count:>6}  {function}" for function, count in hook["package_functions"].items())
+    return "\n".join(lines)
+
+
+def write_profile(profiler, destination):
+    """
+    Stop an enabled `Profiler` and print its `format_report`, or write its JSON report to a file.
+
+    :param destination: "-" for standard output, otherwise the path of the JSON file.
+    """
+    if not profiler.enabled:
+        return
+    profiler.stop()
+    if destination == "-":
+        print()
+        print(format_report(profiler.report()))
+    else:
+        with open(destination, "w") as file:
+            file.write(profiler.to_json())
+        print(f"Profile written to {destination}")
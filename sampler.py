@@ -0,0 +1,103 @@
+import numpy as np
+
+
+def cumsum_variants(matrix):
+    """
+    Cumulative sum over the variants of every market. Markets with few variants are summed one
+    column at a time, which avoids the slow strided `np.cumsum(axis=1)`.
+    """
+    if matrix.shape[1] > 64:
+        return np.cumsum(matrix, axis=1)
+
+    cumulative = matrix.copy(order="F")
+    for column in range(1, matrix.shape[1]):
+        cumulative[:, column] += cumulative[:, column - 1]
+    return cumulative
+
+
+def determine_winners(rng, probabilities):
+    """
+    Vectorized `functions_library.determine_winner`: draw one winning variant per market, using
+    the (not necessarily normalised) probabilities as weights.
+
+    Every market gets one uniform threshold scaled by its total weight, and the winner is the
+    number of cumulative weights that do not exceed it, which is a branch-free search over the
+    whole block.
+
+    :param rng: A `numpy.random.Generator`.
+    :param probabilities: Weight matrix of shape (N, K).
+    :return: An integer array of length N with the index of the winning variant of every market.
+    """
+    cumulative = cumsum_variants(probabilities)
+    thresholds = rng.random(len(cumulative)) * cumulative[:, -1]
+    winners = np.count_nonzero(cumulative <= thresholds[:, None], axis=1)
+
+    return np.minimum(winners, probabilities.shape[1] - 1)
+
+
+class AliasTable:
+    """
+    Walker's alias table of one discrete distribution, for drawing many outcomes from the same
+    weights. Building it takes O(K); each draw then costs one uniform number and one lookup,
+    whatever the number of outcomes.
+
+    :param weights: Non-negative weights of the outcomes (not necessarily normalised).
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim != 1 or not len(weights) or np.any(weights < 0) or not weights.sum() > 0:
+            raise ValueError("Weights must be a non-empty vector of non-negative numbers with a positive sum.")
+
+        size = len(weights)
+        scaled = weights * (size / weights.sum())
+        self.probability = np.ones(size)
+        self.alias = np.arange(size)
+
+        # Vose's method: pair every under-full column with an over-full one
+        small = [i for i in range(size) if scaled[i] < 1]
+        large = [i for i in range(size) if scaled[i] >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+
+    def sample(self, rng, size=None):
+        """
+        Draw outcome indices.
+
+        :param rng: A `numpy.random.Generator`.
+        :param size: Number of draws, or None for a single integer.
+        """
+        if size is None:
+            return int(self.sample(rng, 1)[0])
+
+        # One uniform number gives both the column (integer part) and the coin flip (fraction)
+        uniform = rng.random(size)
+        uniform *= len(self.probability)
+        column = uniform.astype(np.intp)
+        np.minimum(column, len(self.probability) - 1, out=column)
+        uniform -= column
+        return np.where(uniform < self.probability[column], column, self.alias[column])
+
+    def __len__(self):
+        return len(self.probability)
+
+
+def sample(rng, weights, size=None):
+    """
+    Draw outcomes of a single distribution: one draw uses a cumulative search, repeated draws an
+    `AliasTable`.
+
+    :param rng: A `numpy.random.Generator`.
+    :param weights: Non-negative weights of the outcomes (not necessarily normalised).
+    :param size: Number of draws, or None for a single integer.
+    """
+    if size is not None:
+        return AliasTable(weights).sample(rng, size)
+
+    cumulative = np.cumsum(weights)
+    winner = np.searchsorted(cumulative, rng.random() * cumulative[-1], side="right")
+    return int(min(winner, len(cumulative) - 1))
@@ -0,0 +1,160 @@
+import numpy as np
+
+
+class RunningStats:
+    """
+    One-pass summary of a bankroll path: win rate, maximum drawdown, longest losing streak and the
+    mean and variance of the log growth per bet, in constant memory.
+
+    Feed it consecutive chunks of a path with `update`, or summarise chunks separately (e.g. in
+    parallel) and combine them in path order with `merge`. Everything is kept in log space relative
+    to the start of the summarised segment, so merging never needs the bets themselves.
+
+    Usage:
+        stats = RunningStats()
+        for block in simulate_blocks(...):
+            stats.update(block.start, block.bankroll, block.wins, block.ruined)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.wins = 0
+        self.ruined = False
+        # Mean and sum of squared deviations of the log growth of every bet
+        self.log_growth_mean = 0.0
+        self.log_growth_m2 = 0.0
+        # Log of the bankroll relative to the start of the segment: at its end, highest and lowest
+        self.log_change = 0.0
+        self.log_peak = 0.0
+        self.log_trough = 0.0
+        self.log_drawdown = 0.0
+        # Losing runs at the start and end of the segment and the longest one
+        self.leading_losses = 0
+        self.trailing_losses = 0
+        self.longest_losing_streak = 0
+
+    @classmethod
+    def from_history(cls, bankroll_history, results_history, ruined=False):
+        """
+        Summarise a complete path in the format of `SimulationResult` (the bankroll history starts
+        with the initial bankroll).
+        """
+        return cls().update(bankroll_history[0], bankroll_history[1:], results_history, ruined)
+
+    def update(self, start, bankroll, wins, ruined=False):
+        """
+        Add the next chunk of a path.
+
+        :param start: Bankroll before the first bet of the chunk.
+        :param bankroll: Bankroll after every bet of the chunk.
+        :param wins: 1 for every won bet of the chunk and 0 for a lost one.
+        :param ruined: Whether the bankroll ran out right after the chunk.
+        :return: This object, updated.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_growth = np.diff(np.log(bankroll), prepend=np.log(start))
+        return self.update_log(log_growth, wins, ruined)
+
+    def update_log(self, log_growth, wins, ruined=False):
+        """
+        Add the next chunk of a path given as the log growth of every bet, which keeps working for
+        bankrolls that do not fit in a float.
+
+        :return: This object, updated. See `update` for the other parameters.
+        """
+        chunk = RunningStats()
+        chunk.ruined = bool(ruined)
+        count = len(log_growth)
+        if count:
+            levels = np.cumsum(log_growth)
+
+            chunk.count = count
+            chunk.wins = int(np.count_nonzero(wins))
+            chunk.log_growth_mean = float(levels[-1] / count)
+            chunk.log_growth_m2 = float(np.sum((log_growth - chunk.log_growth_mean) ** 2))
+            chunk.log_change = float(levels[-1])
+            chunk.log_peak = max(0.0, float(levels.max()))
+            chunk.log_trough = min(0.0, float(levels.min()))
+            peaks = np.maximum.accumulate(np.maximum(levels, 0.0))
+            chunk.log_drawdown = float(np.max(peaks - levels))
+
+            won = np.flatnonzero(wins)
+            if len(won):
+                chunk.leading_losses = int(won[0])
+                chunk.trailing_losses = int(count - 1 - won[-1])
+                gaps = int(np.max(np.diff(won), initial=1)) - 1
+                chunk.longest_losing_streak = max(chunk.leading_losses, chunk.trailing_losses, gaps)
+            else:
+                chunk.leading_losses = chunk.trailing_losses = chunk.longest_losing_streak = count
+
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """
+        Append the summary of the segment that directly follows this one.
+
+        :param other: A `RunningStats` of the next segment of the path.
+        :return: This object, updated.
+        """
+        if not other.count:
+            self.ruined = self.ruined or other.ruined
+            return self
+        if not self.count:
+            self.__dict__.update(other.__dict__)
+            return self
+
+        count = self.count + other.count
+        delta = other.log_growth_mean - self.log_growth_mean
+        self.log_growth_m2 += other.log_growth_m2 + delta ** 2 * self.count * other.count / count
+        self.log_growth_mean += delta * other.count / count
+
+        self.log_drawdown = max(self.log_drawdown, other.log_drawdown,
+                                self.log_peak - self.log_change - other.log_trough)
+        self.log_peak = max(self.log_peak, self.log_change + other.log_peak)
+        self.log_trough = min(self.log_trough, self.log_change + other.log_trough)
+        self.log_change += other.log_change
+
+        self.longest_losing_streak = max(self.longest_losing_streak, other.longest_losing_streak,
+                                         self.trailing_losses + other.leading_losses)
+        if self.leading_losses == self.count:
+            self.leading_losses += other.leading_losses
+        self.trailing_losses = other.trailing_losses + (self.trailing_losses if other.trailing_losses == other.count else 0)
+
+        self.count = count
+        self.wins += other.wins
+        self.ruined = self.ruined or other.ruined
+        return self
+
+    @property
+    def losses(self):
+        return self.count - self.wins
+
+    @property
+    def win_rate(self):
+        return self.wins / self.count if self.count else 0.0
+
+    @property
+    def max_drawdown(self):
+        """
+        Largest fall of the bankroll from a previous peak, as a fraction of that peak (1 once ruined).
+        """
+        return 1.0 if self.ruined else float(-np.expm1(-self.log_drawdown))
+
+    @property
+    def log_growth_variance(self):
+        return self.log_growth_m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def as_dict(self):
+        return {
+            "bets": self.count,
+            "wins": self.wins,
+            "win_rate": self.win_rate,
+            "max_drawdown": self.max_drawdown,
+            "longest_losing_streak": self.longest_losing_streak,
+            "log_growth_mean": self.log_growth_mean,
+            "log_growth_variance": self.log_growth_variance,
+            "ruined": self.ruined,
+        }
+
+    def __repr__(self):
+        return f"RunningStats({self.as_dict()})"
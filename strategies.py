@@ -0,0 +1,362 @@
+import argparse
+import dataclasses
+import sys
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+
+from backtest import check_chunk, read_markets
+from engine import DEFAULT_BLOCK_SIZE, draw_markets, log_stats_block, place_bets
+from profiling import NULL_PROFILER, Profiler, write_profile
+from stats import RunningStats
+
+
+class MarketBlock:
+    """
+    A block of markets with known winners, shared by all the strategies of `compare_strategies`.
+
+    :param odds: Odds matrix of shape (N, K).
+    :param probabilities: Probability matrix of shape (N, K).
+    :param winner: Index of the winning variant of every market.
+    """
+
+    def __init__(self, odds, probabilities, winner):
+        self.odds = odds
+        self.probabilities = probabilities
+        self.winner = winner
+
+    @cached_property
+    def value_bets(self):
+        """
+        The full Kelly bets of `engine.place_bets` on the first value bet of every market, computed
+        once for all the strategies that only change their stakes.
+        """
+        return place_bets(self.odds, self.probabilities, self.winner, 1.0)
+
+
+class Strategy:
+    """
+    A staking rule evaluated by `compare_strategies`.
+
+    Subclasses implement `place`, which turns a `MarketBlock` into the `engine.Bets` of the
+    strategy. By default the bankroll compounds multiplicatively: every bet multiplies it by
+    `Bets.growth`, or by `Bets.all_in_growth` once it is $1 or less, as in the engine. Strategies
+    whose bankroll does not compound (e.g. `FlatStake`) also override `update`.
+    """
+    name = "strategy"
+
+    def place(self, markets):
+        """
+        :param markets: A `MarketBlock`.
+        :return: An `engine.Bets` object with one entry per market.
+        """
+        raise NotImplementedError
+
+    def update(self, stats, log_bankroll, bets):
+        """
+        Place `bets` starting from the bankroll `exp(log_bankroll)` and add them to `stats`.
+
+        :return: A tuple (log bankroll after the block, ruined).
+        """
+        return log_stats_block(stats, log_bankroll, bets)
+
+
+def rescale(bets, stake_fraction):
+    """
+    Return `bets` with new stakes, as fractions of the bankroll.
+    """
+    stake_fraction = np.where(bets.has_bet, stake_fraction, 0.0)
+    growth = np.where(bets.wins, 1 + stake_fraction * (bets.odds - 1), 1 - stake_fraction)
+    return dataclasses.replace(bets, stake_fraction=stake_fraction, growth=growth)
+
+
+class FractionalKelly(Strategy):
+    """
+    Bet a fraction of the Kelly stake on the first value bet of every market, as `Window.get_betting_data`.
+    """
+
+    def __init__(self, fraction=0.5):
+        self.fraction = fraction
+        self.name = f"{fraction * 100:g}% Kelly"
+
+    def place(self, markets):
+        return rescale(markets.value_bets, markets.value_bets.kelly * self.fraction)
+
+
+class FullKelly(FractionalKelly):
+
+    def __init__(self):
+        super().__init__(1.0)
+        self.name = "Full Kelly"
+
+
+class SimultaneousKelly(Strategy):
+    """
+    Stake every outcome of a market with `engine.simultaneous_kelly`, so that the bankroll is
+    multiplied by `1 - sum(f) + f_w * o_w` where `w` is the winner.
+    """
+
+    def __init__(self, fraction=1.0):
+        self.fraction = fraction
+        self.name = "Simultaneous Kelly" if fraction == 1 else f"{fraction * 100:g}% simultaneous Kelly"
+
+    def place(self, markets):
+        return place_bets(markets.odds, markets.probabilities, markets.winner, self.fraction, "simultaneous")
+
+
+class FixedPercentage(Strategy):
+    """
+    Bet a fixed percentage of the current bankroll on the first value bet of every market.
+    """
+
+    def __init__(self, percentage=2.0):
+        self.fraction = percentage / 100
+        self.name = f"{percentage:g}% of bankroll"
+
+    def place(self, markets):
+        return rescale(markets.value_bets, self.fraction)
+
+
+class FlatStake(Strategy):
+    """
+    Bet the same amount on the first value bet of every market, or the whole bankroll once it is
+    smaller than the stake.
+    """
+
+    def __init__(self, stake=10.0):
+        self.stake = stake
+        self.name = f"Flat ${stake:g}"
+
+    def place(self, markets):
+        return markets.value_bets
+
+    def update(self, stats, log_bankroll, bets):
+        rows = np.flatnonzero(bets.has_bet)
+        bankroll = np.exp(log_bankroll)
+        history, ruined = flat_bankroll(bankroll, self.stake, bets.odds[rows], bets.wins[rows])
+        stats.update(bankroll, history, bets.wins[rows[:len(history)]], ruined)
+        if len(history) and not ruined:
+            log_bankroll = np.log(history[-1])
+        return log_bankroll, ruined
+
+
+def flat_bankroll(bankroll, stake, odds, wins):
+    """
+    Additive counterpart of `engine.compound_bankroll`: every bet adds `stake * (odds - 1)` to the
+    bankroll or takes `stake` from it, except when the bankroll is smaller than the stake, in which
+    case it is all staked. The regular stretches are computed with `cumsum` and the all-in
+    stretches, which multiply the bankroll by the odds until it is back to the stake or lost, with
+    `cumprod`. Both are computed over a window that starts small after every switch and doubles
+    while the stretch goes on, so long runs of all-in bets stay linear in the number of bets.
+
+    :return: A tuple (history, ruined), as returned by `engine.compound_bankroll`.
+    """
+    history = np.empty(len(odds))
+    start = 0
+    window = 256
+
+    with np.errstate(over="ignore"):
+        while start < len(odds):
+            end = min(start + window, len(odds))
+            if bankroll < stake:
+                path = bankroll * np.cumprod(np.where(wins[start:end], odds[start:end], 0.0))
+                events = np.flatnonzero((path >= stake) | (path <= 0))
+            else:
+                path = bankroll + np.cumsum(np.where(wins[start:end], stake * (odds[start:end] - 1), -stake))
+                events = np.flatnonzero(path < stake)
+
+            if len(events) == 0:
+                history[start:end] = path
+                bankroll = path[-1]
+                start = end
+                window *= 2
+                continue
+
+            event = events[0]
+            if path[event] <= 0:
+                history[start:start + event] = path[:event]
+                return history[:start + event], True
+
+            history[start:start + event + 1] = path[:event + 1]
+            bankroll = path[event]
+            start += event + 1
+            window = 256
+
+    return history, False
+
+
+STRATEGIES = {
+    "kelly": FractionalKelly,
+    "full-kelly": FullKelly,
+    "simultaneous": SimultaneousKelly,
+    "percentage": FixedPercentage,
+    "flat": FlatStake,
+}
+
+
+def parse_strategy(text):
+    """
+    Build a strategy from a "name" or "name:value" description, e.g. "kelly:50" (percentage of the
+    Kelly stake), "percentage:2", "flat:10" or "full-kelly". Percentages must be in (0, 100] and
+    stakes positive.
+    """
+    name, _, value = text.strip().partition(":")
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {name} (choose from {', '.join(STRATEGIES)})")
+    if not value:
+        return STRATEGIES[name]()
+    if name == "full-kelly":
+        raise ValueError("full-kelly takes no value")
+    number = float(value)
+    if name == "flat":
+        if not 0 < number < np.inf:
+            raise ValueError(f"The stake of {text.strip()} must be a positive amount")
+        return STRATEGIES[name](number)
+    if not 0 < number <= 100:
+        raise ValueError(f"The percentage of {text.strip()} must be in (0, 100]")
+    if name in ("kelly", "simultaneous"):
+        return STRATEGIES[name](number / 100)
+    return STRATEGIES[name](number)
+
+
+@dataclass
+class StrategyResult:
+    """
+    Outcome of one strategy of `compare_strategies`.
+    """
+    name: str
+    stats: RunningStats
+    log_bankroll: float
+
+    @property
+    def final_bankroll(self):
+        return 0.0 if self.stats.ruined else float(np.exp(self.log_bankroll))
+
+
+def synthetic_markets(number_of_variants, number_of_bets, inflated_probability, seed=None,
+                      block_size=DEFAULT_BLOCK_SIZE, profiler=NULL_PROFILER):
+    """
+    Generate the markets of `engine.simulate_blocks` as (odds, probabilities, winner) blocks.
+    """
+    rng = np.random.default_rng(seed)
+    for offset in range(0, number_of_bets, block_size):
+        yield draw_markets(rng, min(block_size, number_of_bets - offset), number_of_variants, inflated_probability,
+                           profiler)
+
+
+def recorded_markets(path, workers=1):
+    """
+    Read the markets of a recorded market file (see `backtest.MarketWriter`) as (odds, probabilities, winner) blocks.
+    """
+    for chunk in read_markets(path, workers=workers):
+        check_chunk(path, chunk)
+        yield chunk.odds, chunk.probabilities, chunk.winner
+
+
+def compare_strategies(strategies, bankroll, markets, profiler=NULL_PROFILER):
+    """
+    Evaluate several strategies on one shared stream of markets and outcomes (common random
+    numbers), so that their differences are not blurred by different luck and the markets are only
+    generated once. Every strategy keeps its own bankroll, tracked in log space as in
+    `engine.simulate_stats`, and stops when it is ruined.
+
+    :param strategies: `Strategy` objects.
+    :param bankroll: Starting bankroll of every strategy.
+    :param markets: Iterable of (odds, probabilities, winner) blocks, from `synthetic_markets` or
+                    `recorded_markets`.
+    :param profiler: A `profiling.Profiler`; the staking and bankroll update of every strategy is
+                     timed as a stage named after the strategy (the shared `MarketBlock.value_bets`
+                     count towards the first strategy that uses them).
+    :return: A list of `StrategyResult`, in the order of `strategies`.
+    """
+    results = [StrategyResult(strategy.name, RunningStats(), float(np.log(bankroll))) for strategy in strategies]
+
+    for odds, probabilities, winner in markets:
+        block = MarketBlock(odds, probabilities, winner)
+        profiler.count("blocks")
+        profiler.count("markets", len(winner))
+        for strategy, result in zip(strategies, results):
+            if result.stats.ruined:
+                continue
+            with profiler.stage(result.name):
+                bets = strategy.place(block)
+                result.log_bankroll, result.stats.ruined = strategy.update(result.stats, result.log_bankroll, bets)
+        if all(result.stats.ruined for result in results):
+            break
+    return results
+
+
+def format_bankroll(log_bankroll):
+    """
+    Format the bankroll `exp(log_bankroll)`, in scientific notation from $1e12 up so that bankrolls
+    beyond the range of a float are still shown.
+    """
+    exponent = log_bankroll / np.log(10)
+    if exponent < 12:
+        return f"${np.exp(log_bankroll):,.2f}"
+    return f"${10 ** (exponent % 1):.3f}e+{int(exponent)}"
+
+
+def format_comparison(results, bankroll):
+    """
+    Return the results of `compare_strategies` as a text table, one row per strategy.
+    """
+    header = (f"{'Strategy':<24} {'Final bankroll':>16} {'Log growth/bet':>15} {'Max drawdown':>13} "
+              f"{'Losing streak':>14} {'Bets':>10} {'Win rate':>9}")
+    lines = [header, "-" * len(header)]
+    for result in results:
+        stats = result.stats
+        final = "ruined" if stats.ruined else format_bankroll(result.log_bankroll)
+        lines.append(
+            f"{result.name:<24} {final:>16} {stats.log_growth_mean:>15.6g} {stats.max_drawdown * 100:>12.2f}% "
+            f"{stats.longest_losing_streak:>14} {stats.count:>10} {stats.win_rate * 100:>8.2f}%"
+        )
+    lines.append(f"Starting bankroll: ${bankroll:,.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m strategies",
+        description="Compare staking strategies on one shared stream of markets and outcomes."
+    )
+    parser.add_argument("--strategies", default="kelly:50,full-kelly,simultaneous,percentage:2,flat:10",
+                        help=f"Comma separated strategies, from {', '.join(STRATEGIES)} (e.g. kelly:25,flat:20).")
+    parser.add_argument("--bankroll", type=float, default=1000, help="Starting bankroll of every strategy.")
+    parser.add_argument("--variants", type=int, default=3, help="Number of play variants per market.")
+    parser.add_argument("--bets", type=int, default=1000, help="Number of markets.")
+    parser.add_argument("--inflated", type=int, default=5, help="Inflated probability of the value bet (1 - 100).")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the shared markets.")
+    parser.add_argument("--markets", default=None, metavar="FILE",
+                        help="Compare on a recorded market file (see backtest.py) instead of generated markets.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes parsing a CSV market file.")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="Write a JSON report of the time spent per strategy to FILE ('-' prints a summary).")
+    args = parser.parse_args(argv)
+
+    try:
+        strategies = [parse_strategy(text) for text in args.strategies.split(",") if text.strip()]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.bankroll <= 0:
+        parser.error("Bankroll must be a positive value.")
+
+    profiler = NULL_PROFILER if args.profile is None else Profiler().start()
+    if args.markets:
+        markets = recorded_markets(args.markets, args.workers)
+    else:
+        markets = synthetic_markets(args.variants, args.bets, args.inflated, args.seed, profiler=profiler)
+    try:
+        results = compare_strategies(strategies, args.bankroll, markets, profiler)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(format_comparison(results, args.bankroll))
+    write_profile(profiler, args.profile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
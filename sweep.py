@@ -0,0 +1,363 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from adaptive import DEFAULT_CONFIDENCE, DEFAULT_LOG_GROWTH_WIDTH, DEFAULT_MEDIAN_WIDTH, DEFAULT_MIN_PATHS, \
+    DEFAULT_RUIN_WIDTH, simulate_adaptive
+from cache import DEFAULT_CACHE_DIRECTORY, ResultCache, canonical
+from engine import simulate_ensemble
+
+COLUMNS = [
+    "cell", "kelly_fraction", "inflated_probability", "number_of_variants", "ruin_probability",
+    "median_final_bankroll", "p5_final_bankroll", "p95_final_bankroll", "median_max_drawdown", "number_of_paths",
+]
+
+
+def parse_range(text, cast=float):
+    """
+    Parse a parameter range given either as a comma separated list ("3,5,10") or as an inclusive
+    "start:stop:step" range ("0.1:1.0:0.1").
+
+    :param text: The range description.
+    :param cast: Type of the returned values.
+    :return: A list of values.
+    """
+    if ":" not in text:
+        return [cast(value) for value in text.split(",") if value.strip()]
+
+    start, stop, step = (float(value) for value in text.split(":"))
+    if step <= 0:
+        raise ValueError(f"Range step must be positive: {text}")
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return [cast(round(start + i * step, 10)) for i in range(count)]
+
+
+def sweep_grid(kelly_fractions, inflated_probabilities, variants, seed=None):
+    """
+    Build the cells of a parameter sweep. Every cell gets its own `numpy.random.SeedSequence`
+    spawned from `seed`, so cells draw independent random streams regardless of the worker that
+    runs them and of the order in which they finish.
+
+    :return: A list of cell dictionaries, in grid order.
+    """
+    combinations = list(itertools.product(kelly_fractions, inflated_probabilities, variants))
+    seeds = np.random.SeedSequence(seed).spawn(len(combinations))
+
+    return [
+        {
+            "cell": index,
+            "kelly_fraction": kelly_fraction,
+            "inflated_probability": inflated_probability,
+            "number_of_variants": number_of_variants,
+            "seed": cell_seed,
+        }
+        for index, ((kelly_fraction, inflated_probability, number_of_variants), cell_seed)
+        in enumerate(zip(combinations, seeds))
+    ]
+
+
+def run_cell(cell, bankroll, number_of_bets, number_of_paths, cache=None, targets=None, checkpoint=None):
+    """
+    Run the ensemble of one sweep cell and summarise it as a table row. With a `ResultCache` the
+    ensemble is looked up first; cells of a sweep without a root seed are never cached. With
+    `targets` (keyword arguments of `adaptive.simulate_adaptive`) the cell stops adding paths once
+    its confidence intervals are narrow enough, and `number_of_paths` is the maximum. An optional
+    `checkpoint.Checkpoint` lets an interrupted cell resume; adaptive cells run in short batches
+    and start again instead.
+    """
+    parameters = (bankroll, cell["number_of_variants"], cell["kelly_fraction"], number_of_bets,
+                  cell["inflated_probability"])
+    if targets is not None:
+        ensemble = simulate_adaptive(*parameters, seed=cell["seed"], max_paths=number_of_paths, cache=cache,
+                                     **targets)
+    else:
+        run = simulate_ensemble if cache is None else cache.simulate_ensemble
+        ensemble = run(*parameters, number_of_paths, seed=cell["seed"], checkpoint=checkpoint)
+    p5, p95 = np.percentile(ensemble.final_bankroll, [5, 95])
+
+    return {
+        "cell": cell["cell"],
+        "kelly_fraction": cell["kelly_fraction"],
+        "inflated_probability": cell["inflated_probability"],
+        "number_of_variants": cell["number_of_variants"],
+        "ruin_probability": ensemble.ruin_probability,
+        "median_final_bankroll": ensemble.median_final_bankroll,
+        "p5_final_bankroll": float(p5),
+        "p95_final_bankroll": float(p95),
+        "median_max_drawdown": float(np.median(ensemble.max_drawdown)),
+        "number_of_paths": len(ensemble.final_bankroll),
+    }
+
+
+def parse_row(row, number_of_paths=None):
+    """
+    Convert a row read from a sweep CSV file. Tables written before the `number_of_paths` column
+    was added ran `number_of_paths` paths in every cell.
+    """
+    row = dict(row)
+    row.setdefault("number_of_paths", number_of_paths)
+    return {key: int(row[key]) if key in ("cell", "number_of_variants", "number_of_paths") else float(row[key])
+            for key in COLUMNS}
+
+
+def read_table(path, number_of_paths=None):
+    """
+    Read the rows of a sweep CSV file up to a truncated or damaged line left by an interrupted run.
+
+    :return: A tuple (column names, rows, size), where size is the length of the file up to the
+             end of the last complete row (0 without a complete header).
+    """
+    rows = []
+    with open(path, "rb") as file:
+        header = file.readline()
+        if not header.endswith(b"\n"):
+            return [], [], 0
+        columns = next(csv.reader([header.decode()]))
+        size = len(header)
+        for line in file:
+            values = next(csv.reader([line.decode(errors="replace")]), [])
+            if not line.endswith(b"\n") or len(values) != len(columns):
+                break
+            try:
+                rows.append(parse_row(dict(zip(columns, values)), number_of_paths))
+            except (TypeError, ValueError):
+                break
+            size += len(line)
+    return columns, rows, size
+
+
+def read_results(path, number_of_paths=None):
+    """
+    Read the rows of a sweep CSV file, skipping a truncated last line left by an interrupted run.
+
+    :param number_of_paths: Paths per cell of a table written without the `number_of_paths` column.
+    """
+    if not os.path.exists(path):
+        return []
+    return read_table(path, number_of_paths)[1]
+
+
+def write_table(rows, path):
+    """
+    Write sweep rows to a new CSV file that replaces `path` at once.
+    """
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def parameters_path(output):
+    return f"{output}.json"
+
+
+def check_parameters(output, parameters):
+    """
+    Refuse to resume the sweep in `output` if it was run with other parameters, whose rows would
+    silently be mixed with the new ones. Tables written before the parameters were recorded are
+    resumed as they are.
+
+    :raise ValueError: If the recorded parameters differ from `parameters`.
+    """
+    try:
+        with open(parameters_path(output)) as file:
+            recorded = json.load(file)
+    except FileNotFoundError:
+        return
+    changed = [name for name, value in json.loads(json.dumps(parameters)).items() if recorded.get(name) != value]
+    if changed:
+        raise ValueError(f"{output} holds a sweep with a different {', '.join(changed)}; "
+                         f"use another output file or delete it to start again")
+
+
+def save_npz(rows, path):
+    """
+    Save sweep rows as one array per column, sorted by cell.
+    """
+    rows = sorted(rows, key=lambda row: row["cell"])
+    np.savez(path, **{key: np.array([row[key] for row in rows]) for key in COLUMNS})
+
+
+def run_sweep(kelly_fractions, inflated_probabilities, variants, bankroll, number_of_bets, number_of_paths,
+              output, seed=None, max_workers=None, npz_output=None, cache=None, targets=None):
+    """
+    Run an ensemble for every combination of Kelly fraction, inflated probability and number of
+    variants over a process pool.
+
+    Rows are appended to the `output` CSV file and flushed as soon as their cell finishes, so an
+    interrupted sweep keeps every completed cell. Running the same sweep again with the same
+    output file and parameters skips the cells that are already in it; the parameters are recorded
+    next to the table (in `output` + ".json") and resuming with other ones raises a ValueError.
+
+    :param kelly_fractions: Kelly fractions to try (0.1 - 1).
+    :param inflated_probabilities: Inflated probabilities to try, in percentage points.
+    :param variants: Numbers of variants to try.
+    :param bankroll: Starting bankroll of every path.
+    :param number_of_bets: Number of bets per path.
+    :param number_of_paths: Number of paths simulated per cell (the maximum with `targets`).
+    :param output: Path of the CSV results table.
+    :param seed: Root seed of the sweep.
+    :param max_workers: Number of worker processes (defaults to the number of cores).
+    :param npz_output: Optional path of an NPZ copy of the table, written when the sweep stops.
+    :param cache: Optional `ResultCache` of the cell ensembles, used when `seed` is given.
+    :param targets: Optional confidence-interval targets of `adaptive.simulate_adaptive`; every
+                    cell then only simulates the paths it needs.
+    :return: The list of completed rows.
+    """
+    cells = sweep_grid(kelly_fractions, inflated_probabilities, variants, seed)
+    if seed is None:
+        cache = None
+    parameters = {name: canonical(value) for name, value in (
+        ("kelly_fractions", kelly_fractions), ("inflated_probabilities", inflated_probabilities),
+        ("variants", variants), ("bankroll", bankroll), ("number_of_bets", number_of_bets),
+        ("number_of_paths", number_of_paths), ("seed", seed),
+        ("targets", None if targets is None else {name: canonical(value) for name, value in targets.items()}),
+    )}
+
+    columns, rows, size = read_table(output, number_of_paths) if os.path.exists(output) else ([], [], 0)
+    if rows:
+        check_parameters(output, parameters)
+        if columns != COLUMNS:
+            # A table of an older version, rewritten with the current columns
+            write_table(rows, output)
+        else:
+            # Drop a partly written last line, which the next row would be glued onto
+            os.truncate(output, size)
+    if not rows or not os.path.exists(parameters_path(output)):
+        with open(parameters_path(output), "w") as file:
+            json.dump(parameters, file, indent=2)
+    done = {row["cell"] for row in rows}
+    pending = [cell for cell in cells if cell["cell"] not in done]
+
+    write_header = not rows
+    with open(output, "w" if write_header else "a", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        if write_header:
+            writer.writeheader()
+            file.flush()
+
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [
+                executor.submit(run_cell, cell, bankroll, number_of_bets, number_of_paths, cache, targets)
+                for cell in pending
+            ]
+            for future in as_completed(futures):
+                row = future.result()
+                writer.writerow(row)
+                file.flush()
+                rows.append(row)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if npz_output:
+                save_npz(rows, npz_output)
+
+    return sorted(rows, key=lambda row: row["cell"])
+
+
+def add_target_arguments(parser):
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Add paths in batches until the confidence intervals below are narrow enough.")
+    parser.add_argument("--ruin-width", type=float, default=DEFAULT_RUIN_WIDTH,
+                        help="Target width of the interval of the probability of ruin.")
+    parser.add_argument("--median-width", type=float, default=DEFAULT_MEDIAN_WIDTH,
+                        help="Target width of the interval of the median final bankroll, relative to the median.")
+    parser.add_argument("--log-growth-width", type=float, default=DEFAULT_LOG_GROWTH_WIDTH,
+                        help="Target width of the interval of the expected log growth of the bankroll.")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE, help="Confidence level.")
+
+
+def check_target_arguments(parser, args):
+    """
+    Exit with a usage error if the targets given with `add_target_arguments` are not valid.
+    """
+    if min(args.ruin_width, args.median_width, args.log_growth_width) <= 0:
+        parser.error("The target widths of the confidence intervals must be positive.")
+    if not 0 < args.confidence < 1:
+        parser.error("The confidence level must be between 0 and 1 (e.g. 0.95).")
+
+
+def adaptive_targets(args):
+    """
+    Return the `adaptive.simulate_adaptive` targets given on the command line, or None without --adaptive.
+    """
+    if not args.adaptive:
+        return None
+    return {"ruin_width": args.ruin_width, "median_width": args.median_width,
+            "log_growth_width": args.log_growth_width, "confidence": args.confidence}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sweep Kelly fraction, inflated probability and number of variants over all cores."
+    )
+    parser.add_argument("--bankroll", type=float, default=1000, help="Starting bankroll of every path.")
+    parser.add_argument("--bets", type=int, default=1000, help="Number of bets per path.")
+    parser.add_argument("--paths", type=int, default=1000,
+                        help="Number of paths per grid cell (the maximum with --adaptive).")
+    parser.add_argument("--kelly", default="10:100:10", help="Kelly percentages (10 - 100), e.g. 10:100:10 or 25,50.")
+    parser.add_argument("--inflated", default="1:10:1", help="Inflated probabilities (1 - 100), e.g. 1:10:1 or 5,10.")
+    parser.add_argument("--variants", default="3", help="Numbers of variants, e.g. 3,5,10 or 3:9:3.")
+    parser.add_argument("--seed", type=int, default=None, help="Root seed of the sweep.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--output", default="sweep.csv", help="CSV file the rows are streamed to.")
+    parser.add_argument("--npz", default=None, help="Optional NPZ copy of the results table.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIRECTORY, help="Cache of seeded cell ensembles.")
+    parser.add_argument("--no-cache", action="store_true", help="Always recompute the cells.")
+    add_target_arguments(parser)
+    args = parser.parse_args(argv)
+    check_target_arguments(parser, args)
+
+    try:
+        kelly_percentages = parse_range(args.kelly)
+        inflated_probabilities = parse_range(args.inflated, int)
+        variants = parse_range(args.variants, int)
+    except ValueError as e:
+        parser.error(str(e))
+    # A cell that fails in a worker only reports its error once the other cells are done
+    if args.bankroll <= 0:
+        parser.error("Bankroll must be a positive value.")
+    if args.paths < 1 or args.bets < 0:
+        parser.error("The number of paths must be positive and the number of bets not negative.")
+    if args.adaptive and args.paths < DEFAULT_MIN_PATHS:
+        parser.error(f"With --adaptive the number of paths must be at least {DEFAULT_MIN_PATHS}.")
+    if not (kelly_percentages and inflated_probabilities and variants):
+        parser.error("Every range must have at least one value.")
+    if not all(10 <= percentage <= 100 for percentage in kelly_percentages):
+        parser.error("Kelly percentages must be between 10 and 100.")
+    if not all(1 <= probability <= 100 for probability in inflated_probabilities):
+        parser.error("Inflated probabilities must be between 1 and 100.")
+    if min(variants) < 1:
+        parser.error("The numbers of variants must be positive.")
+    kelly_fractions = [percentage / 100 for percentage in kelly_percentages]
+
+    try:
+        rows = run_sweep(
+            kelly_fractions, inflated_probabilities, variants, args.bankroll, args.bets, args.paths,
+            args.output, seed=args.seed, max_workers=args.workers, npz_output=args.npz,
+            cache=None if args.no_cache else ResultCache(args.cache_dir), targets=adaptive_targets(args)
+        )
+    except KeyboardInterrupt:
+        print(f"Sweep interrupted. Completed cells are saved in {args.output}")
+        return 1
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"{len(rows)} cells written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+from adaptive import median_interval, ruin_interval, simulate_adaptive
+from engine import simulate_ensemble
+from sweep import run_cell, sweep_grid
+
+
+class TestAdaptive(unittest.TestCase):
+
+    def test_intervals(self):
+        """
+        Test the intervals of the ruin probability and of the median against known values.
+        """
+        estimate = ruin_interval(np.zeros(100, dtype=bool))
+        self.assertEqual(estimate.value, 0.0)
+        self.assertEqual(estimate.lower, 0.0)
+        self.assertAlmostEqual(estimate.upper, 0.037, places=3)
+
+        estimate = ruin_interval(np.arange(1000) < 100)
+        self.assertAlmostEqual(estimate.lower, 0.0829, places=3)
+        self.assertAlmostEqual(estimate.upper, 0.1203, places=3)
+
+        rng = np.random.default_rng(1)
+        covered = 0
+        for _ in range(200):
+            estimate = median_interval(rng.lognormal(size=101))
+            covered += estimate.lower <= 1 <= estimate.upper
+        self.assertGreaterEqual(covered, 0.93 * 200)
+
+    def test_stops_on_targets(self):
+        """
+        Test that the run stops as soon as every interval is narrower than its target, or at the maximum.
+        """
+        result = simulate_adaptive(1000, 3, 0.5, 200, 5, seed=1, ruin_width=0.05, median_width=0.2,
+                                   log_growth_width=0.2)
+        self.assertTrue(result.converged)
+        self.assertEqual(result.number_of_paths, len(result.final_bankroll))
+        self.assertLess(result.number_of_paths, 100000)
+        self.assertLessEqual(result.estimates["ruin_probability"].width, 0.05)
+        growth = result.estimates["log_growth"]
+        self.assertLessEqual(growth.width, 0.2)
+        self.assertLess(growth.lower, growth.value)
+
+        capped = simulate_adaptive(1000, 3, 0.5, 200, 5, seed=1, ruin_width=0.0001, max_paths=500)
+        self.assertFalse(capped.converged)
+        self.assertEqual(capped.number_of_paths, 500)
+
+        for targets in ({"ruin_width": 0}, {"median_width": -0.1}, {"confidence": 95}):
+            with self.assertRaises(ValueError):
+                simulate_adaptive(1000, 3, 0.5, 200, 5, seed=1, **targets)
+
+    def test_reproducible(self):
+        """
+        Test that a seeded run is reproducible and that its first batch is the ensemble of the first spawned seed.
+        """
+        first = simulate_adaptive(1000, 3, 0.5, 100, 5, seed=2, median_width=0.1)
+        again = simulate_adaptive(1000, 3, 0.5, 100, 5, seed=2, median_width=0.1)
+        np.testing.assert_array_equal(first.final_bankroll, again.final_bankroll)
+
+        batch_seed, = np.random.SeedSequence(2).spawn(1)
+        ensemble = simulate_ensemble(1000, 3, 0.5, 100, 5, 100, seed=batch_seed)
+        np.testing.assert_array_equal(first.final_bankroll[:100], ensemble.final_bankroll)
+
+    def test_sweep_cell(self):
+        """
+        Test that an adaptive sweep cell records the number of paths it used.
+        """
+        cell, = sweep_grid([0.5], [5], [3], seed=3)
+        row = run_cell(cell, 1000, 100, 2000, targets={"ruin_width": 0.05, "median_width": 0.2})
+        again = run_cell(cell, 1000, 100, 2000, targets={"ruin_width": 0.05, "median_width": 0.2})
+        self.assertLessEqual(row["number_of_paths"], 2000)
+        self.assertEqual(row, again)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import contextlib
+import io
+import unittest
+import numpy as np
+from analytic import (
+    Lattice, adjustment_coefficient, bankroll_distribution, bet_distribution, cross_check, main, power,
+    ruin_probability
+)
+from engine import draw_bets, simulate_ensemble
+
+
+class TestAnalytic(unittest.TestCase):
+
+    def test_power(self):
+        """
+        Test the FFT convolution power against repeated direct convolutions.
+        """
+        lattice = Lattice(0.5, -2, np.array([0.1, 0.2, 0.05, 0.0, 0.4, 0.25]))
+        expected = np.ones(1)
+        for _ in range(7):
+            expected = np.convolve(expected, lattice.pmf)
+        result = power(lattice, 7)
+        self.assertEqual(result.start, -14)
+        np.testing.assert_allclose(result.pmf[:len(expected)], expected, atol=1e-12)
+        self.assertAlmostEqual(result.mean(), 7 * lattice.mean())
+
+    def test_bet_distribution(self):
+        """
+        Test the log growth of one market against many simulated markets.
+        """
+        for staking in ("kelly", "simultaneous"):
+            bet = bet_distribution(3, 0.5, 5, staking)
+            bets = draw_bets(np.random.default_rng(1), 1000000, 3, 0.5, 5, staking)
+            growth = np.log(bets.growth)
+            self.assertAlmostEqual(bet.mean(), growth.mean(), delta=4 * growth.std() / 1000)
+            self.assertAlmostEqual(bet.std(), growth.std(), delta=0.01 * growth.std())
+
+    def test_gamblers_ruin(self):
+        """
+        Test the ruin probability and Lundberg's coefficient on a simple random walk with a known solution.
+        """
+        walk = Lattice(1.0, -1, np.array([0.4, 0.0, 0.6]))
+        self.assertAlmostEqual(ruin_probability(walk, 2000, 5.0, steps=2000), (0.4 / 0.6) ** 5, places=6)
+        self.assertAlmostEqual(adjustment_coefficient(walk), np.log(0.6 / 0.4), places=6)
+
+    def test_against_simulation(self):
+        """
+        Test that every statistic is within Monte Carlo error of a simulated ensemble.
+        """
+        result = bankroll_distribution(100, 3, 0.5, 1000, 5)
+        ensemble = simulate_ensemble(100, 3, 0.5, 1000, 5, 5000, seed=1, percentiles=())
+        rows = cross_check(result, ensemble)
+        self.assertGreater(len(rows), 5)
+        for metric, analytic, simulated, error in rows:
+            self.assertLessEqual(abs(analytic - simulated), 4 * error + 1e-9, metric)
+
+    def test_high_ruin(self):
+        """
+        Test ruin and drawdowns against a simulated ensemble in which about half of the paths are
+        ruined, betting their whole bankroll once they fall to $1; some of them win their way back.
+        """
+        result = bankroll_distribution(20, 3, 1.0, 1000, 5)
+        ensemble = simulate_ensemble(20, 3, 1.0, 1000, 5, 5000, seed=1, percentiles=())
+        self.assertGreater(result.ruin_probability, 0.4)
+        for metric, analytic, simulated, error in cross_check(result, ensemble):
+            self.assertLessEqual(abs(analytic - simulated), 4 * error + 1e-9, metric)
+
+    def test_total_loss(self):
+        """
+        Test ruin and drawdowns against a simulated ensemble in which some bets stake more than the
+        whole bankroll, so that losing one of them ruins the path at once.
+        """
+        result = bankroll_distribution(100, 3, 1.0, 30, 50)
+        ensemble = simulate_ensemble(100, 3, 1.0, 30, 50, 5000, seed=1, percentiles=())
+        self.assertEqual(result.adjustment_coefficient, 0.0)
+        self.assertEqual(result.final_bankroll_percentile(5), 0.0)
+        for metric, analytic, simulated, error in cross_check(result, ensemble):
+            self.assertLessEqual(abs(analytic - simulated), 4 * error + 1e-9, metric)
+
+    def test_ruin_below_bound(self):
+        """
+        Test that the ruin probability at every horizon is at most the Lundberg bound of ruin over
+        any number of bets, which it approaches from below.
+        """
+        previous = 0.0
+        for number_of_bets in (1000, 100000, 1000000):
+            result = bankroll_distribution(1000, 3, 0.5, number_of_bets, 5, drawdowns=())
+            self.assertLessEqual(result.ruin_probability, result.lundberg_bound)
+            self.assertGreaterEqual(result.ruin_probability, previous - 1e-4)
+            previous = result.ruin_probability
+
+    def test_main(self):
+        """
+        Test the command line output.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(main(["--bets", "100", "--check", "200", "--seed", "1"]), 0)
+        self.assertIn("Ruin probability", output.getvalue())
+        self.assertIn("P50 final bankroll", output.getvalue())
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(["--steps", "0"])
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(["--inflated", "0"])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(main(["--kelly", "100", "--inflated", "80", "--bets", "1000"]), 0)
+        self.assertIn("Ruin probability: 100.0000%", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+from backtest import (
+    MarketWriter, backtest, backtest_blocks, backtest_progress, backtest_stats, convert, export_synthetic,
+    main, read_markets
+)
+from checkpoint import Checkpoint
+from engine import simulate, simulate_stats
+
+
+class TestBacktest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_same_results_as_synthetic_run(self):
+        """
+        Test that backtesting the exported markets of a seeded run, from a binary or a CSV file, gives
+        exactly the results of the synthetic run.
+        """
+        for name in ("markets.npy", "markets.csv"):
+            export_synthetic(self.path(name), 4, 5000, 5, seed=3, block_size=1000)
+            for staking in ("kelly", "simultaneous"):
+                result = backtest(self.path(name), 1000, 0.5, staking, block_size=1000)
+                expected = simulate(1000, 4, 0.5, 5000, 5, seed=3, block_size=1000, staking=staking)
+                np.testing.assert_array_equal(result.bankroll_history, expected.bankroll_history)
+                np.testing.assert_array_equal(result.results_history, expected.results_history)
+
+            progress = backtest_stats(self.path(name), 1000, 0.5, block_size=1000)
+            stats = simulate_stats(1000, 4, 0.5, 5000, 5, seed=3, block_size=1000)
+            self.assertEqual(progress.stats.count, stats.count)
+            self.assertAlmostEqual(progress.stats.log_change, stats.log_change)
+            self.assertEqual(progress.next_market, 5000)
+            self.assertEqual(progress.position, os.path.getsize(self.path(name)))
+
+    def test_resume(self):
+        """
+        Test that a backtest resumed from the byte offset of a block continues exactly where it stopped.
+        """
+        for name in ("markets.npy", "markets.csv"):
+            export_synthetic(self.path(name), 3, 3000, 5, seed=4, block_size=1000)
+            blocks = list(backtest_blocks(self.path(name), 1000, 0.5, block_size=1000, record_bets=True))
+            stop = blocks[0]
+
+            rest = backtest(self.path(name), stop.bankroll[-1], 0.5, offset=stop.position,
+                            first_market=stop.next_market, block_size=1000, record_bets=True)
+            np.testing.assert_array_equal(rest.bankroll_history[1:], np.concatenate([b.bankroll for b in blocks[1:]]))
+            np.testing.assert_array_equal(rest.blocks[0].bet_index, blocks[1].bet_index)
+
+            with self.assertRaises(ValueError):
+                list(read_markets(self.path(name), offset=stop.position + 1))
+
+    def test_resume_stats(self):
+        """
+        Test that a backtest resumed from its checkpoint gives exactly the statistics of an uninterrupted one.
+        """
+        export_synthetic(self.path("markets.npy"), 3, 5000, 5, seed=5, block_size=1000)
+        expected = backtest_stats(self.path("markets.npy"), 1000, 0.5, block_size=1000)
+
+        checkpoint = Checkpoint(self.path("backtest.npz"), "backtest", interval=0)
+        for progress in backtest_progress(self.path("markets.npy"), 1000, 0.5, block_size=1000, checkpoint=checkpoint):
+            if progress.next_market == 2000:
+                break
+        # The bankroll is ignored once the backtest is restored from the checkpoint
+        resumed = backtest_stats(self.path("markets.npy"), 500, 0.5, block_size=1000,
+                                 checkpoint=Checkpoint(self.path("backtest.npz"), "backtest"))
+        self.assertEqual(vars(resumed.stats), vars(expected.stats))
+        self.assertEqual(resumed.bankroll, expected.bankroll)
+        self.assertEqual(resumed.position, expected.position)
+
+    def test_csv_parsing(self):
+        """
+        Test reading a hand-written CSV file with extra columns, Windows line endings and no final newline,
+        in blocks and with several worker processes.
+        """
+        with open(self.path("markets.csv"), "wb") as file:
+            file.write(b"market,odds_0,odds_1,probability_0,probability_1,winner\r\n"
+                       b"1,1.9,2.1,0.6,0.4,0\r\n"
+                       b"2,3.0,1.4,0.3,0.7,1\r\n"
+                       b"3,2.5,1.6,0.45,0.55,1")
+
+        for workers in (1, 2):
+            chunks = list(read_markets(self.path("markets.csv"), block_size=2, workers=workers))
+            self.assertEqual([chunk.index for chunk in chunks], [0, 2])
+            np.testing.assert_array_equal(np.concatenate([chunk.odds for chunk in chunks]),
+                                          [[1.9, 2.1], [3.0, 1.4], [2.5, 1.6]])
+            np.testing.assert_array_equal(np.concatenate([chunk.winner for chunk in chunks]), [0, 1, 1])
+
+        result = backtest(self.path("markets.csv"), 100, 1.0)
+        self.assertAlmostEqual(result.bankroll_history[1], 100 * (1 + 0.16 * 0.9))
+
+    def test_invalid_files(self):
+        """
+        Test that malformed rows and winners outside the market raise a ValueError.
+        """
+        with open(self.path("malformed.csv"), "w") as file:
+            file.write("odds_0,odds_1,probability_0,probability_1,winner\n1.9,2.1,0.6,0.4,0\n3.0,1.4,0.3\n")
+        with self.assertRaises(ValueError):
+            list(read_markets(self.path("malformed.csv")))
+        with open(self.path("text.csv"), "w") as file:
+            file.write("odds_0,odds_1,probability_0,probability_1,winner\n1.9,2.1,0.6,0.4,0\n3.0,n/a,0.3,0.7,1\n")
+        with self.assertRaises(ValueError):
+            list(read_markets(self.path("text.csv")))
+
+        with MarketWriter(self.path("winner.npy"), 2) as writer:
+            writer.append([[1.9, 2.1]], [[0.6, 0.4]], [2])
+        with self.assertRaises(ValueError):
+            backtest(self.path("winner.npy"), 100, 0.5)
+
+    def test_block_size_argument(self):
+        """
+        Test that a block size that is not positive is a usage error.
+        """
+        export_synthetic(self.path("markets.npy"), 3, 100, 5, seed=1)
+        for block_size in ("0", "-5"):
+            with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                main(["run", self.path("markets.npy"), "--block-size", block_size])
+
+    def test_convert(self):
+        """
+        Test that converting a CSV file to the binary format keeps every market.
+        """
+        export_synthetic(self.path("markets.csv"), 3, 500, 5, seed=5)
+        convert(self.path("markets.csv"), self.path("markets.npy"))
+
+        records = np.load(self.path("markets.npy"))
+        csv_chunk, = read_markets(self.path("markets.csv"))
+        np.testing.assert_array_equal(records["odds"], csv_chunk.odds)
+        np.testing.assert_array_equal(records["winner"], csv_chunk.winner)
+
+
+if __name__ == "__main__":
+    unittest.main()
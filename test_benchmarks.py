@@ -0,0 +1,88 @@
+import contextlib
+import copy
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+from benchmarks import BENCHMARKS, benchmark_cases, compare_runs, main, run_benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_cases(self):
+        """
+        Test that axes a benchmark does not depend on are not repeated and that cases above the work limit are left out.
+        """
+        cases = benchmark_cases(["update_bankroll", "ensemble"], [10, 10 ** 7], [3, 10], [1, 100])
+        update_cases = [case for case in cases if case[0] == "update_bankroll"]
+        ensemble_cases = [case for case in cases if case[0] == "ensemble"]
+
+        self.assertEqual(update_cases, [("update_bankroll", 10, 3, 1)])
+        self.assertEqual(len(ensemble_cases), 4 + 2)
+        self.assertNotIn(("ensemble", 10 ** 7, 10, 100), ensemble_cases)
+
+    def test_run(self):
+        """
+        Test that every benchmark runs at a tiny scale and reports its time, throughput and peak memory.
+        """
+        run = run_benchmarks(benchmark_cases(list(BENCHMARKS), [20], [3], [2]), repeat=1)
+
+        self.assertEqual([result["benchmark"] for result in run["results"]], list(BENCHMARKS))
+        for result in run["results"]:
+            self.assertGreater(result["throughput"], 0)
+            self.assertGreaterEqual(result["peak_memory"], 0)
+        self.assertIn("python", run["machine"])
+
+    def test_compare(self):
+        """
+        Test that a slowdown or a memory growth above the threshold is flagged and a smaller change is not.
+        """
+        baseline = {"results": [
+            {"benchmark": "simulate", "bets": 1000, "variants": 3, "paths": 1, "throughput": 100.0, "peak_memory": 1000},
+            {"benchmark": "ensemble", "bets": 1000, "variants": 3, "paths": 10, "throughput": 100.0, "peak_memory": 1000},
+            {"benchmark": "kelly_matrix", "bets": 1000, "variants": 3, "paths": 1, "throughput": 100.0, "peak_memory": 1000},
+        ]}
+        current = copy.deepcopy(baseline)
+        current["results"][0]["throughput"] = 95.0
+        current["results"][1]["throughput"] = 80.0
+        current["results"][2]["peak_memory"] = 1200
+        current["results"].append({"benchmark": "simulate", "bets": 10, "variants": 3, "paths": 1,
+                                   "throughput": 1.0, "peak_memory": 1})
+
+        comparisons = compare_runs(baseline, current, threshold=0.1)
+        self.assertEqual([comparison["regression"] for comparison in comparisons], [False, True, True])
+
+    def test_history_and_compare_command(self):
+        """
+        Test that runs are appended to the history file and that compare exits with 1 on a regression only.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            history = os.path.join(directory, "history.json")
+            baseline = os.path.join(directory, "baseline.json")
+            arguments = ["--history", history, "--baseline", baseline]
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(["run", "--only", "kelly_matrix", "--bets", "100", "--variants", "3", "--repeat", "1",
+                      "--no-memory", "--save-baseline", *arguments])
+                main(["run", "--only", "kelly_matrix", "--bets", "100", "--variants", "3", "--repeat", "1",
+                      "--no-memory", *arguments])
+                with open(history) as file:
+                    runs = json.load(file)
+                self.assertEqual(len(runs), 2)
+
+                runs[-1]["results"][0]["throughput"] = runs[0]["results"][0]["throughput"] * 0.5
+                with open(history, "w") as file:
+                    json.dump(runs, file)
+                self.assertEqual(main(["compare", "--threshold", "0.1", *arguments]), 1)
+                self.assertEqual(main(["compare", "--threshold", "0.6", *arguments]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
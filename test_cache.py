@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from cache import CACHE_FORMAT, ResultCache, cache_key
+from engine import simulate, simulate_ensemble
+from sweep import run_sweep
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key(self):
+        """
+        Test that equal parameters give the same key and that any change of parameter or seed gives another.
+        """
+        key = cache_key("simulation", bankroll=1000, kelly_fraction=0.5, seed=1)
+        self.assertEqual(key, cache_key("simulation", seed=1, kelly_fraction=0.5, bankroll=1000.0))
+        self.assertEqual(key, cache_key("simulation", bankroll=np.float64(1000), kelly_fraction=0.5, seed=1))
+        self.assertNotEqual(key, cache_key("simulation", bankroll=1000, kelly_fraction=0.5, seed=2))
+        self.assertNotEqual(key, cache_key("ensemble", bankroll=1000, kelly_fraction=0.5, seed=1))
+        with mock.patch("cache.CACHE_FORMAT", CACHE_FORMAT - 1):
+            self.assertNotEqual(key, cache_key("simulation", bankroll=1000, kelly_fraction=0.5, seed=1))
+
+    def test_hit(self):
+        """
+        Test that a repeated seeded run returns the stored results instead of running the engine again.
+        """
+        first = self.cache.simulate(1000, 3, 0.5, 3000, 5, seed=1)
+        self.assertEqual(len(self.cache), 1)
+        path, = [path for _, _, path in self.cache.entries()]
+        os.utime(path, (0, 0))
+
+        again = self.cache.simulate(1000, 3, 0.5, 3000, 5, seed=1)
+        np.testing.assert_array_equal(again.bankroll_history, first.bankroll_history)
+        np.testing.assert_array_equal(again.results_history, first.results_history)
+        self.assertEqual(again.ruined, first.ruined)
+        self.assertGreater(os.path.getmtime(path), 0)
+
+        ensemble = self.cache.simulate_ensemble(1000, 3, 0.5, 100, 5, 20, seed=1)
+        cached = self.cache.simulate_ensemble(1000, 3, 0.5, 100, 5, 20, seed=1)
+        np.testing.assert_array_equal(cached.bands, ensemble.bands)
+        np.testing.assert_array_equal(cached.bands, simulate_ensemble(1000, 3, 0.5, 100, 5, 20, seed=1).bands)
+
+        stats = self.cache.simulate_stats(1000, 3, 0.5, 3000, 5, seed=1)
+        self.assertEqual(self.cache.simulate_stats(1000, 3, 0.5, 3000, 5, seed=1).count, stats.count)
+        self.assertEqual(len(self.cache), 3)
+
+    def test_unseeded_runs_not_cached(self):
+        """
+        Test that runs without a seed, or recording their bets, are never stored.
+        """
+        self.cache.simulate(1000, 3, 0.5, 500, 5)
+        self.cache.simulate_ensemble(1000, 3, 0.5, 50, 5, 10)
+        self.cache.simulate(1000, 3, 0.5, 500, 5, seed=1, record_bets=True)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_eviction(self):
+        """
+        Test that the least recently used entries are deleted when the cache grows too large.
+        """
+        arrays = {"values": np.zeros(1000)}
+        self.cache.max_bytes = 3 * 8000 + 2000
+        for index, key in enumerate("abc"):
+            self.cache.store(key, arrays)
+            os.utime(self.cache.path(key), (index, index))
+        self.cache.load("a")
+        self.cache.store("d", arrays)
+
+        self.assertIsNotNone(self.cache.load("a"))
+        self.assertIsNone(self.cache.load("b"))
+        self.assertEqual(len(self.cache), 3)
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+
+        self.cache.store("e", {"values": np.zeros(10000)})
+        self.assertIsNone(self.cache.load("e"))
+
+    def test_damaged_entry(self):
+        """
+        Test that a damaged entry is treated as a miss and replaced by the next run.
+        """
+        expected = simulate(1000, 3, 0.5, 1000, 5, seed=4)
+        self.cache.simulate(1000, 3, 0.5, 1000, 5, seed=4)
+        path, = [path for _, _, path in self.cache.entries()]
+        with open(path, "wb") as file:
+            file.write(b"not an archive")
+
+        result = self.cache.simulate(1000, 3, 0.5, 1000, 5, seed=4)
+        np.testing.assert_array_equal(result.bankroll_history, expected.bankroll_history)
+        self.assertIsNotNone(self.cache.load(os.path.basename(path)[:-len(".npz")]))
+        self.assertEqual(os.listdir(self.directory.name), [os.path.basename(path)])
+
+    def test_sweep(self):
+        """
+        Test that a sweep written to a new table reuses the cached ensembles of its cells.
+        """
+        output = os.path.join(self.directory.name, "sweep.csv")
+        rows = run_sweep([0.5], [5], [3, 4], 1000, 50, 20, output, seed=2, max_workers=1, cache=self.cache)
+        self.assertEqual(len(self.cache), 2)
+
+        os.remove(output)
+        again = run_sweep([0.5], [5], [3, 4], 1000, 50, 20, output, seed=2, max_workers=1, cache=self.cache)
+        self.assertEqual([row["ruin_probability"] for row in again], [row["ruin_probability"] for row in rows])
+        self.assertEqual(len(self.cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+from checkpoint import Checkpoint, ShardedJob, ensemble_job, merge, merge_ensemble, shard_sizes, sweep_job, work
+from engine import simulate_ensemble, simulate_stats
+from sweep import run_sweep
+
+
+class InterruptingCheckpoint(Checkpoint):
+    """
+    A checkpoint saved after every block that interrupts the run after a number of snapshots.
+    """
+
+    def __init__(self, path, key, saves_before_interrupt):
+        super().__init__(path, key, interval=0)
+        self.saves_before_interrupt = saves_before_interrupt
+
+    def save(self, rng, arrays, stats=None):
+        super().save(rng, arrays, stats)
+        if self.saves == self.saves_before_interrupt:
+            raise KeyboardInterrupt
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_resume_stats(self):
+        """
+        Test that a single run interrupted and resumed from its checkpoint gives exactly the statistics of an
+        uninterrupted run.
+        """
+        expected = simulate_stats(1000, 3, 0.25, 50000, 5, seed=1, block_size=4000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.npz")
+            with self.assertRaises(KeyboardInterrupt):
+                simulate_stats(1000, 3, 0.25, 50000, 5, seed=1, block_size=4000,
+                               checkpoint=InterruptingCheckpoint(path, "run", 5))
+            # The seed is ignored once the generator is restored from the checkpoint
+            resumed = simulate_stats(1000, 3, 0.25, 50000, 5, seed=2, block_size=4000,
+                                     checkpoint=Checkpoint(path, "run"))
+        self.assertEqual(vars(resumed), vars(expected))
+
+    def test_resume_ensemble(self):
+        """
+        Test that a resumed ensemble gives exactly the paths and bands of an uninterrupted one.
+        """
+        expected = simulate_ensemble(1000, 3, 0.5, 300, 5, 200, seed=3, block_size=4000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ensemble.npz")
+            with self.assertRaises(KeyboardInterrupt):
+                simulate_ensemble(1000, 3, 0.5, 300, 5, 200, seed=3, block_size=4000,
+                                  checkpoint=InterruptingCheckpoint(path, "ensemble", 4))
+            resumed = simulate_ensemble(1000, 3, 0.5, 300, 5, 200, seed=3, block_size=4000,
+                                        checkpoint=Checkpoint(path, "ensemble"))
+
+            with self.assertRaises(ValueError):
+                simulate_ensemble(1000, 3, 0.5, 300, 5, 200, checkpoint=Checkpoint(path, "another run"))
+        for name in ("bands", "final_bankroll", "max_drawdown", "ruined"):
+            np.testing.assert_array_equal(getattr(resumed, name), getattr(expected, name))
+
+    def test_sharded_ensemble(self):
+        """
+        Test that the merged shards are the ensembles of the spawned seeds, whichever worker ran them, and
+        that a stopped shard is resumed by the next worker.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            job = ensemble_job(directory, 1000, 3, 0.5, 200, 5, 1000, 3, seed=4, block_size=2000)
+            stops = iter([False, False, False])
+            self.assertEqual(work(directory, interval=0, should_stop=lambda: next(stops, True)), 0)
+            self.assertEqual(job.status(), {"done": 0, "running": 0, "waiting": 3})
+            self.assertTrue(os.path.exists(job.shard_path(0, ".checkpoint.npz")))
+
+            self.assertEqual(work(directory), 3)
+            merged = merge_ensemble(job)
+            self.assertFalse(os.path.exists(job.shard_path(0, ".checkpoint.npz")))
+
+        seeds = np.random.SeedSequence(4).spawn(3)
+        expected = [simulate_ensemble(1000, 3, 0.5, 200, 5, paths, seed=seed, percentiles=(), block_size=2000)
+                    for paths, seed in zip(shard_sizes(1000, 3), seeds)]
+        np.testing.assert_array_equal(merged.final_bankroll,
+                                      np.concatenate([ensemble.final_bankroll for ensemble in expected]))
+        self.assertEqual(len(merged.max_drawdown), 1000)
+
+    def test_locks(self):
+        """
+        Test that a shard is only held by one worker at a time, and that a stale lock is taken over.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            ensemble_job(directory, 1000, 3, 0.5, 10, 5, 100, 2, seed=5)
+            first, second = ShardedJob(directory), ShardedJob(directory, stale_seconds=60)
+            self.assertEqual(first.claim(), 0)
+            self.assertEqual(second.claim(), 1)
+            self.assertIsNone(second.claim())
+
+            old = time.time() - 120
+            os.utime(first.shard_path(0, ".lock"), (old, old))
+            self.assertEqual(second.claim(), 0)
+            self.assertEqual(second.status(), {"done": 0, "running": 2, "waiting": 0})
+
+            # Another worker is already taking the stale lock over
+            os.utime(second.shard_path(1, ".lock"), (old, old))
+            found = os.stat(second.shard_path(1, ".lock"))
+            os.link(second.shard_path(1, ".lock"),
+                    second.shard_path(1, f".lock.{found.st_ino}-{found.st_mtime_ns}.stale"))
+            self.assertIsNone(first.claim())
+
+            with self.assertRaises(ValueError):
+                ensemble_job(directory, 1000, 3, 0.5, 10, 5, 200, 2, seed=5)
+
+    def test_heartbeat(self):
+        """
+        Test that a held lock is refreshed in the background, independently of the checkpoints.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            ensemble_job(directory, 1000, 3, 0.5, 10, 5, 100, 2, seed=5)
+            job = ShardedJob(directory, stale_seconds=0.2)
+            self.assertEqual(job.claim(), 0)
+            old = time.time() - 120
+            os.utime(job.shard_path(0, ".lock"), (old, old))
+            stop = job.keep_alive(0)
+            time.sleep(0.15)
+            stop()
+            self.assertGreater(os.stat(job.shard_path(0, ".lock")).st_mtime, old + 60)
+
+    def test_sharded_sweep(self):
+        """
+        Test that a sweep run as a sharded job gives the rows of `sweep.run_sweep`.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            job_directory = os.path.join(directory, "job")
+            sweep_job(job_directory, [0.5, 1.0], [5], [3], 1000, 50, 20, seed=6)
+            work(job_directory)
+            rows = merge(job_directory, os.path.join(directory, "merged.csv"))
+            expected = run_sweep([0.5, 1.0], [5], [3], 1000, 50, 20, os.path.join(directory, "sweep.csv"), seed=6,
+                                 max_workers=1)
+        self.assertEqual(rows, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from cli import main
+from engine import simulate
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_python(code, cwd=PACKAGE_DIRECTORY, *options):
+    environment = dict(os.environ, PYTHONPATH=PACKAGE_DIRECTORY)
+    return subprocess.run([sys.executable, *options, "-c", code], cwd=cwd, env=environment,
+                          capture_output=True, text=True, check=True)
+
+
+class TestCli(unittest.TestCase):
+
+    def test_import_time(self):
+        """
+        Test with `-X importtime` that importing the command line entry point takes less than 100 ms and
+        loads neither Matplotlib nor Qt.
+        """
+        report = run_python("import cli", PACKAGE_DIRECTORY, "-X", "importtime").stderr
+        cumulative = {}
+        for line in report.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, microseconds, name = line.split("|")
+                if microseconds.strip().isdigit():
+                    cumulative[name.strip()] = int(microseconds)
+
+        self.assertLess(cumulative["cli"], 100000)
+        self.assertFalse([name for name in cumulative if name.startswith(("matplotlib", "PyQt6"))])
+
+    def test_headless_library(self):
+        """
+        Test that the library modules import without Matplotlib or Qt and without touching the log file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = run_python(
+                "import sys, engine, functions_library, sweep, ledger, stats, logscan; "
+                "print(sorted(name for name in sys.modules if name.startswith(('matplotlib', 'PyQt6'))))",
+                directory,
+            ).stdout
+            self.assertEqual(output.strip(), "[]")
+            self.assertFalse(os.path.exists(os.path.join(directory, "betting_log.txt")))
+
+    def test_simulate_command(self):
+        """
+        Test that the simulate command reports the bets of the equivalent `engine.simulate` run.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(main(["simulate", "--bets", "3000", "--kelly", "50", "--seed", "4", "--no-cache"]), 0)
+
+        result = simulate(1000, 3, 0.5, 3000, 5, seed=4)
+        self.assertIn(f"Bets placed: {len(result.results_history)} ", output.getvalue())
+        self.assertIn(f"Final bankroll: ${result.bankroll_history[-1]:.2f}", output.getvalue())
+
+    def test_adaptive_paths(self):
+        """
+        Test that an adaptive ensemble of fewer than 2 paths is a usage error rather than a traceback.
+        """
+        with contextlib.redirect_stderr(io.StringIO()) as error, self.assertRaises(SystemExit):
+            main(["ensemble", "--paths", "1", "--adaptive", "--no-cache"])
+        self.assertIn("at least 2", error.getvalue())
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+from decimate import minmax_decimate
+
+
+class TestDecimate(unittest.TestCase):
+
+    def test_keeps_extremes(self):
+        """
+        Test that every bucket keeps its minimum and maximum in order, together with the first and last value.
+        """
+        values = np.cumsum(np.random.default_rng(2).normal(size=100003))
+        index, decimated = minmax_decimate(values, 1000)
+
+        self.assertLess(len(index), 300)
+        self.assertTrue(np.all(np.diff(index) >= 0))
+        np.testing.assert_array_equal(decimated, values[index])
+        self.assertEqual((index[0], index[-1]), (0, len(values) - 1))
+        for start in range(0, len(values), 1000):
+            bucket = values[start:start + 1000]
+            kept = decimated[(index >= start) & (index < start + 1000)]
+            self.assertEqual((kept.min(), kept.max()), (bucket.min(), bucket.max()))
+
+    def test_visible_range(self):
+        """
+        Test that only the requested range is reduced and that short ranges are returned unchanged.
+        """
+        values = np.arange(1000.0)
+        index, decimated = minmax_decimate(values, 10, 200, 500)
+        self.assertEqual((index[0], index[-1]), (200, 499))
+
+        index, decimated = minmax_decimate(values, 10, 990, 5000)
+        np.testing.assert_array_equal(index, np.arange(990, 1000))
+        self.assertEqual(len(minmax_decimate(values, 10, 2000, 3000)[0]), 0)
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,126 @@
+import unittest
+import logging
+import numpy as np
+from functions_library import generate_odds, value_bet_generator, kelly_criterion
+from engine import (
+    simulate, simulate_ensemble, compound_bankroll, generate_odds_matrix, value_bet_matrix, kelly_matrix,
+    determine_winners, simultaneous_kelly
+)
+
+logging.disable(logging.CRITICAL)
+
+
+class TestEngine(unittest.TestCase):
+
+    def test_matches_functions_library(self):
+        """
+        Test that the vectorized odds, probabilities and Kelly stakes follow the same distribution as the
+        per-bet functions in `functions_library`.
+        """
+        samples = 3000
+        scalar_odds, scalar_kelly = [], []
+        for _ in range(samples):
+            odds = generate_odds(3)
+            kelly = kelly_criterion(odds, value_bet_generator(odds, 5))
+            scalar_odds.append(list(odds.values()))
+            if kelly is not None:
+                scalar_kelly.append(kelly[0])
+
+        rng = np.random.default_rng(0)
+        odds = generate_odds_matrix(rng, samples, 3)
+        kelly, _, has_bet = kelly_matrix(odds, value_bet_matrix(rng, odds, 5))
+
+        np.testing.assert_allclose(odds.mean(axis=0), np.mean(scalar_odds, axis=0), rtol=0.02)
+        self.assertAlmostEqual(kelly[has_bet].mean(), np.mean(scalar_kelly), delta=0.005)
+        self.assertAlmostEqual(has_bet.mean(), len(scalar_kelly) / samples, delta=0.03)
+
+    def test_determine_winners(self):
+        """
+        Test that winners are drawn in proportion to the (unnormalised) weights of every market.
+        """
+        rng = np.random.default_rng(1)
+        weights = np.tile([0.6, 0.3, 0.3], (200000, 1))
+        frequencies = np.bincount(determine_winners(rng, weights), minlength=3) / len(weights)
+        np.testing.assert_allclose(frequencies, [0.5, 0.25, 0.25], atol=0.005)
+
+    def test_simultaneous_kelly(self):
+        """
+        Test that the simultaneous Kelly stakes match known solutions and that no small change of the stakes
+        increases the expected log growth.
+        """
+        # A sure profit is bet in full; an outcome below the reserve rate gets nothing
+        np.testing.assert_allclose(simultaneous_kelly(np.array([[2.2, 2.2]]), np.array([[0.5, 0.5]])), [[0.5, 0.5]])
+        np.testing.assert_allclose(simultaneous_kelly(np.array([[3.0, 1.4]]), np.array([[0.4, 0.6]])), [[0.1, 0.0]])
+
+        rng = np.random.default_rng(4)
+        odds = rng.uniform(1.5, 8.0, (2000, 5))
+        probabilities = rng.dirichlet(np.ones(5), 2000)
+        stakes = simultaneous_kelly(odds, probabilities)
+        self.assertTrue(np.all(stakes >= 0) and np.all(stakes.sum(axis=1) <= 1 + 1e-9))
+
+        def growth(stakes):
+            return (probabilities * np.log(1 - stakes.sum(axis=1)[:, None] + stakes * odds)).sum(axis=1)
+
+        best = growth(stakes)
+        for _ in range(20):
+            perturbed = np.maximum(stakes + rng.normal(0, 1e-3, stakes.shape), 0)
+            perturbed /= np.maximum(perturbed.sum(axis=1), 1)[:, None]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.assertTrue(np.all(~(growth(perturbed) > best + 1e-12)))
+
+    def test_simultaneous_staking(self):
+        """
+        Test that a simultaneous Kelly simulation is reproducible and bets on at least as many markets.
+        """
+        kelly = simulate(1000, 5, 0.5, 5000, 5, seed=9)
+        simultaneous = simulate(1000, 5, 0.5, 5000, 5, seed=9, staking="simultaneous")
+        np.testing.assert_array_equal(
+            simultaneous.bankroll_history, simulate(1000, 5, 0.5, 5000, 5, seed=9, staking="simultaneous").bankroll_history
+        )
+        self.assertGreaterEqual(len(simultaneous.results_history), len(kelly.results_history))
+        with self.assertRaises(ValueError):
+            simulate(1000, 5, 0.5, 10, 5, staking="martingale")
+
+    def test_compound_bankroll(self):
+        """
+        Test that the bankroll compounds multiplicatively, that all of it is staked once it drops to $1 and
+        that the history stops before the bet that empties it.
+        """
+        history, ruined = compound_bankroll(100.0, np.array([1.5, 0.5, 0.01, 0.5]), np.array([2.0, 0.0, 3.0, 0.0]))
+        np.testing.assert_allclose(history, [150.0, 75.0, 0.75])
+        self.assertTrue(ruined)
+
+    def test_simulate(self):
+        """
+        Test that a seeded simulation is reproducible and returns matching bankroll and result histories.
+        """
+        first = simulate(1000, 3, 0.5, 5000, 5, seed=42, block_size=777)
+        second = simulate(1000, 3, 0.5, 5000, 5, seed=42, block_size=777)
+        self.assertEqual(first.bankroll_history[0], 1000)
+        self.assertEqual(len(first.bankroll_history), len(first.results_history) + 1)
+        np.testing.assert_array_equal(first.bankroll_history, second.bankroll_history)
+
+    def test_simulate_ensemble(self):
+        """
+        Test that the ensemble bands are ordered, start at the initial bankroll and agree with the final
+        bankrolls of independent single runs.
+        """
+        ensemble = simulate_ensemble(1000, 3, 0.5, 500, 5, 2000, seed=7)
+        self.assertEqual(ensemble.bands.shape, (5, 501))
+        np.testing.assert_array_equal(ensemble.bands[:, 0], 1000)
+        self.assertTrue(np.all(np.diff(ensemble.bands, axis=0) >= 0))
+        self.assertTrue(np.all((ensemble.max_drawdown >= 0) & (ensemble.max_drawdown <= 1)))
+
+        single = [simulate(1000, 3, 0.5, 500, 5, seed=seed).bankroll_history[-1] for seed in range(400)]
+        self.assertAlmostEqual(np.log(ensemble.median_final_bankroll), np.log(np.median(single)), delta=0.25)
+
+    def test_ensemble_ruin(self):
+        """
+        Test that betting more than the Kelly stake ruins every path and leaves it at $0.
+        """
+        ensemble = simulate_ensemble(100, 3, 1.0, 300, 100, 200, seed=3)
+        self.assertEqual(ensemble.ruin_probability, 1.0)
+        self.assertEqual(ensemble.median_final_bankroll, 0.0)
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+from history import History, count_bits
+
+
+def blocks(number_of_bets, block_size, seed=1):
+    """
+    Random bankroll and result blocks of a run of `number_of_bets` bets.
+    """
+    rng = np.random.default_rng(seed)
+    bankroll = 1000 * np.cumprod(rng.uniform(0.9, 1.1, number_of_bets))
+    wins = rng.integers(0, 2, number_of_bets, dtype=np.int8)
+    return [(bankroll[start:start + block_size], wins[start:start + block_size])
+            for start in range(0, number_of_bets, block_size)]
+
+
+def full_history(number_of_bets, block_size):
+    bankroll = np.concatenate([[1000.0]] + [block for block, _ in blocks(number_of_bets, block_size)])
+    wins = np.concatenate([block for _, block in blocks(number_of_bets, block_size)])
+    return bankroll, wins
+
+
+class TestHistory(unittest.TestCase):
+
+    def test_full(self):
+        """
+        Test that a full history keeps every bankroll and result, whatever the block boundaries.
+        """
+        bankroll, wins = full_history(1003, 7)
+        history = History(1003, 1000)
+        for block, block_wins in blocks(1003, 7):
+            history.append(block, block_wins)
+        np.testing.assert_array_equal(history.bankroll, bankroll)
+        np.testing.assert_array_equal(history.results(), wins)
+        np.testing.assert_array_equal(history.results(13, 101), wins[13:101])
+        np.testing.assert_array_equal(history.packed_results, np.packbits(wins))
+        self.assertEqual((history.wins, history.losses, history.last), (wins.sum(), 1003 - wins.sum(), bankroll[-1]))
+
+        with self.assertRaises(ValueError):
+            history.append([1.0], [1])
+
+    def test_stride(self):
+        """
+        Test that a stride-sampled history keeps every n-th bankroll and the latest one.
+        """
+        bankroll, _ = full_history(1000, 33)
+        history = History(1000, 1000, retention="stride", points=101)
+        for number, (block, block_wins) in enumerate(blocks(1000, 33)):
+            history.append(block, block_wins)
+            bets = history.bet_number(np.arange(len(history.bankroll)))
+            np.testing.assert_array_equal(history.bankroll, bankroll[bets])
+            self.assertEqual(bets[-1], history.count)
+        self.assertEqual(len(history.bankroll), 101)
+        self.assertEqual(history.point(500), 50)
+
+    def test_ring(self):
+        """
+        Test that a ring history is always a contiguous view of the latest bankrolls.
+        """
+        bankroll, wins = full_history(1000, 45)
+        history = History(1000, 1000, retention="ring", points=300)
+        for block, block_wins in blocks(1000, 45):
+            history.append(block, block_wins)
+            kept = bankroll[max(0, history.count + 1 - 300):history.count + 1]
+            np.testing.assert_array_equal(history.bankroll, kept)
+            self.assertEqual(history.bet_number(0), history.count + 1 - len(kept))
+        self.assertTrue(np.shares_memory(history.bankroll, history.buffer))
+        np.testing.assert_array_equal(history.results(), wins)
+
+    def test_spill(self):
+        """
+        Test that buffers over the memory budget are memory-mapped and hold the same history.
+        """
+        bankroll, wins = full_history(5000, 999)
+        history = History(5000, 1000, dtype=np.float32, memory_budget=1000)
+        self.assertIsInstance(history.buffer, np.memmap)
+        for block, block_wins in blocks(5000, 999):
+            history.append(block, block_wins)
+        np.testing.assert_array_equal(history.bankroll, bankroll.astype(np.float32))
+        np.testing.assert_array_equal(history.results(), wins)
+        self.assertEqual(history.nbytes, 5001 * 4 + 625)
+        history.close()
+
+    def test_from_arrays(self):
+        """
+        Test that wrapping stored arrays neither copies them nor miscounts the results.
+        """
+        bankroll, wins = full_history(1001, 100)
+        packed = np.packbits(wins)
+        history = History.from_arrays(bankroll, packed, 1001)
+        self.assertIs(history.bankroll.base, bankroll)
+        self.assertEqual((history.count, history.wins), (1001, wins.sum()))
+        self.assertEqual(count_bits(packed, 1001), wins.sum())
+        np.testing.assert_array_equal(history.results(), wins)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from engine import simulate_blocks
+from ledger import TradeLedger, column_path, read_ledger
+
+
+class TestLedger(unittest.TestCase):
+
+    def test_append_and_read(self):
+        """
+        Test that records appended across several buffer flushes are read back in order through memory-mapping.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            with TradeLedger(directory, buffer_size=7) as ledger:
+                for start in range(0, 20, 6):
+                    bets = np.arange(start, min(start + 6, 20))
+                    ledger.append(bet_index=bets, variant_index=1, odds=2.5, probability=0.45, kelly=0.08,
+                                  stake=bets * 1.5, winner=bets % 3, bankroll=1000.0 + bets)
+                self.assertEqual(len(ledger), 20)
+
+            columns = read_ledger(directory)
+            np.testing.assert_array_equal(columns["bet_index"], np.arange(20))
+            np.testing.assert_array_equal(columns["stake"], np.arange(20) * 1.5)
+            np.testing.assert_array_equal(columns["winner"], np.arange(20) % 3)
+            self.assertEqual(columns["odds"].dtype, np.float32)
+            # The column files are little-endian on any machine
+            np.testing.assert_array_equal(np.fromfile(column_path(directory, "bet_index"), dtype="<i8"), np.arange(20))
+
+    def test_append_block(self):
+        """
+        Test that a simulation written block by block to a ledger matches its bankroll history.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ledger")
+            history = []
+            with TradeLedger(path) as ledger:
+                for block in simulate_blocks(1000, 3, 0.5, 3000, 5, seed=4, block_size=1000, record_bets=True):
+                    ledger.append_block(block)
+                    history.append(block.bankroll)
+
+            columns = read_ledger(path)
+            np.testing.assert_array_equal(columns["bankroll"], np.concatenate(history))
+            self.assertTrue(np.all(np.diff(columns["bet_index"]) > 0))
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
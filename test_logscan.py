@@ -0,0 +1,152 @@
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import unittest
+import numpy as np
+from engine import LOG_FORMAT, log_block, simulate, simulate_blocks
+from logscan import build_index, main, open_index, parse_numbers, read_bets, read_history
+
+# (bankroll, variants, kelly fraction, bets, inflated probability, seed) of the logged runs; the second one is ruined
+RUNS = [(1000, 3, 0.5, 2500, 5, 1), (100, 3, 1.0, 3000, 10, 0), (1000, 5, 0.25, 700, 5, 2)]
+
+
+def write_log(path, runs, sample_every=1, mode="w"):
+    """
+    Write the log of `runs` as the interface does, with a simulation loaded from the cache between them.
+    """
+    handler = logging.FileHandler(path, mode=mode)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    level, disabled = root.level, logging.root.manager.disable
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    logging.disable(logging.NOTSET)
+    try:
+        logging.info("Simulation started.")
+        logging.info("Simulation loaded from the cache.")
+        for bankroll, variants, kelly_fraction, bets, inflated, seed in runs:
+            logging.info("Simulation started.")
+            for block in simulate_blocks(bankroll, variants, kelly_fraction, bets, inflated, seed=seed,
+                                         record_bets=True, block_size=1000):
+                log_block(block, kelly_fraction, sample_every)
+            logging.info("Simulation ended. Final bankroll: $1")
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+        root.setLevel(level)
+        logging.disable(disabled)
+
+
+class TestLogScan(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "betting_log.txt")
+        write_log(self.path, RUNS)
+        self.expected = [simulate(*run[:5], seed=run[5], block_size=1000) for run in RUNS]
+
+    def test_parse_numbers(self):
+        """
+        Test that the vectorised parser gives exactly the floats of Python, or leaves the number to it.
+        """
+        texts = [b"1049.8", b"0.0", b"-3.5", b"12", b"4.976596601324928e+302", b"1e-05", b"123456789.01",
+                 b"9007199254740993", b"inf", b"3.25e+20"]
+        fields = np.zeros((24, len(texts)), dtype=np.uint8)
+        for column, text in enumerate(texts):
+            fields[24 - len(text):, column] = np.frombuffer(text, dtype=np.uint8)
+        values, parsed = parse_numbers(fields)
+        self.assertEqual(parsed.tolist(), [True, True, True, True, False, True, True, False, False, True])
+        for text, value, ok in zip(texts, values, parsed):
+            if ok:
+                self.assertEqual(value, float(text))
+
+    def test_index(self):
+        """
+        Test the simulations of the index, whichever chunks the log is split into.
+        """
+        index = build_index(self.path, chunk_size=4096, every=500)
+        self.assertEqual(index.bets, [0] + [len(result.results_history) for result in self.expected])
+        self.assertEqual(index.ruined, [False, False, True, False])
+        for simulation, result in enumerate(self.expected, 1):
+            stats = index.stats[simulation]
+            self.assertEqual(stats.wins, result.results_history.sum())
+            self.assertAlmostEqual(index.initial_bankroll[simulation], result.bankroll_history[0], places=2)
+            self.assertAlmostEqual(index.final_bankroll[simulation], 0.0 if result.ruined else result.bankroll_history[-1],
+                                   places=2)
+        # The logged bets of a dense log are numbered from 1
+        self.assertEqual([number for _, placed, number, _, _ in index.checkpoints if placed],
+                         [placed + 1 for _, placed, _, _, _ in index.checkpoints if placed])
+        parallel = build_index(self.path, chunk_size=4096, every=500, max_workers=2).arrays()
+        serial = index.arrays()
+        for name, array in serial.items():
+            np.testing.assert_array_equal(parallel[name], array, name)
+
+    def test_history(self):
+        """
+        Test that the rebuilt histories are the logged ones, to the cent.
+        """
+        index = build_index(self.path)
+        for simulation, result in enumerate(self.expected, 1):
+            history, stats = read_history(self.path, index, simulation, chunk_size=4096)
+            np.testing.assert_allclose(history.bankroll, result.bankroll_history, atol=0.0051, rtol=1e-12)
+            np.testing.assert_array_equal(history.results(), result.results_history)
+            self.assertEqual(stats.count, history.count)
+
+    def test_read_bets(self):
+        """
+        Test random access to the bets of a simulation from the offsets of the index.
+        """
+        index = build_index(self.path, every=300)
+        result = self.expected[0]
+        for first, number in ((0, 10), (299, 2), (1234, 500), (2400, 1000)):
+            before, bankroll, wins = read_bets(self.path, index, 1, first, number, chunk_size=4096)
+            stop = min(first + number, len(result.results_history))
+            self.assertAlmostEqual(before, result.bankroll_history[first], places=2)
+            np.testing.assert_allclose(bankroll, result.bankroll_history[first + 1:stop + 1], atol=0.0051)
+            np.testing.assert_array_equal(wins, result.results_history[first:stop])
+
+    def test_sidecar(self):
+        """
+        Test that the sidecar index is reused until the log changes, and that a partly written last line is
+        left out.
+        """
+        index = open_index(self.path)
+        sidecar = self.path + ".index.npz"
+        os.utime(sidecar, (0, 0))
+        reloaded = open_index(self.path)
+        self.assertEqual(os.path.getmtime(sidecar), 0)
+        self.assertEqual((reloaded.bets, reloaded.checkpoints), (index.bets, index.checkpoints))
+        self.assertEqual(vars(reloaded.stats[2]), vars(index.stats[2]))
+
+        write_log(self.path, RUNS[2:], mode="a")
+        with open(self.path, "a") as file:
+            file.write("2024-11-26 20:53:14,283 - INFO - Win! Gained: $49.8. New bank")
+        grown = open_index(self.path)
+        self.assertEqual(grown.bets, index.bets + [0, len(self.expected[2].results_history)])
+
+    def test_sampled(self):
+        """
+        Test a log that only keeps one bet in 100.
+        """
+        write_log(self.path, RUNS[:1], sample_every=100)
+        index = build_index(self.path, every=5)
+        self.assertEqual(index.bets, [0, 25])
+        self.assertEqual([number for _, _, number, _, _ in index.checkpoints], [1, 501, 1001, 1501, 2001])
+
+    def test_main(self):
+        """
+        Test the command line table.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(main([self.path]), 0)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertIn("ruined", lines[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import time
+import unittest
+import numpy as np
+from engine import simulate, simulate_ensemble, simulate_stats
+from profiling import NULL_PROFILER, Profiler, StackSampler, format_report
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_simulation_report(self):
+        """
+        Test that a profiled simulation reports every engine stage and counts its blocks, markets and bets.
+        """
+        with Profiler() as profiler:
+            result = simulate(1000, 3, 0.5, 5000, 5, seed=1, block_size=1000, profiler=profiler)
+        report = json.loads(profiler.to_json())
+
+        for stage in ("odds", "probabilities", "sampling", "staking", "bankroll"):
+            self.assertEqual(report["stages"][stage]["calls"], 5)
+            self.assertGreater(report["stages"][stage]["seconds"], 0)
+        self.assertEqual(report["counters"], {"blocks": 5, "markets": 5000, "bets": len(result.results_history)})
+        self.assertLessEqual(sum(stage["seconds"] for stage in report["stages"].values()), report["wall_seconds"])
+
+    def test_results_unchanged(self):
+        """
+        Test that profiling does not change the results of a seeded run.
+        """
+        profiled = simulate(1000, 3, 0.5, 3000, 5, seed=2, profiler=Profiler())
+        plain = simulate(1000, 3, 0.5, 3000, 5, seed=2)
+        np.testing.assert_array_equal(profiled.bankroll_history, plain.bankroll_history)
+
+        stats = simulate_stats(1000, 3, 0.5, 3000, 5, seed=2, profiler=Profiler())
+        self.assertEqual(stats.count, simulate_stats(1000, 3, 0.5, 3000, 5, seed=2).count)
+
+        profiler = Profiler()
+        ensemble = simulate_ensemble(1000, 3, 0.5, 100, 5, 50, seed=2, profiler=profiler)
+        np.testing.assert_array_equal(ensemble.bands, simulate_ensemble(1000, 3, 0.5, 100, 5, 50, seed=2).bands)
+        self.assertEqual(profiler.counters["markets"], 100 * 50)
+
+    def test_memory(self):
+        """
+        Test that memory tracing reports the peak memory of every stage.
+        """
+        with Profiler(memory=True) as profiler:
+            simulate(1000, 10, 0.5, 10000, 5, seed=1, profiler=profiler)
+        odds = profiler.report()["stages"]["odds"]
+        self.assertGreaterEqual(odds["peak_bytes"], 10000 * 10 * 8)
+
+    def test_disabled(self):
+        """
+        Test that the disabled profiler records nothing.
+        """
+        with NULL_PROFILER.stage("odds"):
+            NULL_PROFILER.count("bets", 10)
+        self.assertFalse(NULL_PROFILER.enabled)
+        self.assertFalse(hasattr(NULL_PROFILER, "report"))
+
+    def test_stack_sampler(self):
+        """
+        Test that the sampling hook attributes samples to the functions running in the profiled thread.
+        """
+        def busy():
+            end = time.perf_counter() + 0.2
+            while time.perf_counter() < end:
+                pass
+
+        with Profiler(hooks=[StackSampler(interval=0.005)]) as profiler:
+            busy()
+        sampled = profiler.report()["hooks"]["StackSampler"]
+
+        self.assertGreater(sampled["samples"], 5)
+        self.assertTrue(any(function.startswith("busy ") for function in sampled["functions"]))
+        self.assertIn("StackSampler", format_report(profiler.report()))
+
+
+if __name__ == "__main__":
+    unittest.main()
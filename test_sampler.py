@@ -0,0 +1,54 @@
+import unittest
+import logging
+import numpy as np
+from functions_library import determine_winner
+from sampler import AliasTable, determine_winners, sample
+
+logging.disable(logging.CRITICAL)
+
+# 99.9% quantile of the chi-square distribution with 4 degrees of freedom
+CHI_SQUARE_CRITICAL = 18.47
+
+
+def chi_square(draws, weights):
+    expected = np.asarray(weights) / np.sum(weights) * len(draws)
+    observed = np.bincount(draws, minlength=len(weights))
+    return np.sum((observed - expected) ** 2 / expected)
+
+
+class TestSampler(unittest.TestCase):
+
+    weights = [0.42, 0.25, 0.15, 0.1, 0.05]
+
+    def test_same_distribution_as_determine_winner(self):
+        """
+        Test with a chi-square goodness-of-fit test that the per-bet `determine_winner`, the batched
+        `determine_winners` and the alias table all draw outcomes with the probabilities of the weights.
+        """
+        rng = np.random.default_rng(11)
+        variants = ["A", "B", "C", "D", "E"]
+        scalar = np.array([variants.index(determine_winner(variants, self.weights, rng=rng)) for _ in range(20000)])
+        batched = determine_winners(rng, np.tile(self.weights, (200000, 1)))
+        alias = AliasTable(self.weights).sample(rng, 200000)
+
+        for draws in (scalar, batched, alias):
+            self.assertLess(chi_square(draws, self.weights), CHI_SQUARE_CRITICAL)
+
+    def test_alias_table(self):
+        """
+        Test that outcomes with zero weight are never drawn, that seeded draws are reproducible and that
+        invalid weights are rejected.
+        """
+        table = AliasTable([0.0, 3.0, 0.0, 1.0])
+        draws = table.sample(np.random.default_rng(5), 100000)
+        self.assertEqual(set(np.unique(draws)), {1, 3})
+        self.assertAlmostEqual(np.mean(draws == 1), 0.75, delta=0.01)
+        np.testing.assert_array_equal(draws, table.sample(np.random.default_rng(5), 100000))
+        self.assertEqual(sample(np.random.default_rng(5), [0.0, 1.0]), 1)
+
+        for weights in ([], [0.0, 0.0], [1.0, -1.0]):
+            with self.assertRaises(ValueError):
+                AliasTable(weights)
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
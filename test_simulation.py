@@ -1,5 +1,6 @@
 import unittest
-from functions_library import generate_odds, value_bet_generator, kelly_criterion, determine_winner, update_bankroll
+from functions_library import generate_odds, generate_market, value_bet_generator, kelly_criterion, determine_winner, update_bankroll, seed
+from market import Market, variant_name
 
 class TestSimulation(unittest.TestCase):
 
@@ -30,6 +31,8 @@ class TestSimulation(unittest.TestCase):
         probabilities = {"A": 0.70,"B": 0.50,"C": 0.33}
         kelly_result = kelly_criterion(odds, probabilities)
         self.assertTrue(0 <= kelly_result[0] <= 1)
+        with self.assertRaises(ValueError):
+            kelly_criterion(Market.from_dict(odds))
 
     def test_determine_winner(self):
         """
@@ -52,5 +55,39 @@ class TestSimulation(unittest.TestCase):
         new_bankroll = update_bankroll(bankroll, bet_size, bet, win)
         self.assertGreater(new_bankroll, bankroll)
 
+    def test_market(self):
+        """
+        Test case for the `Market` based API. It checks that every library function accepts a market with
+        thousands of variants, works with integer variant ids and names the variants past "Variant Z".
+        """
+        market = value_bet_generator(generate_market(10000), 5)
+        self.assertEqual(len(market.probabilities), 10000)
+        kelly, index, odd = kelly_criterion(market)
+        self.assertIsInstance(index, int)
+        self.assertEqual(odd, market.odds[index])
+        self.assertIn(determine_winner(market), range(10000))
+        self.assertEqual(market.names[26], "Variant AA")
+        self.assertEqual(market.names.index("Variant AA"), 26)
+        self.assertEqual(variant_name(0), "Variant A")
+
+    def test_seed(self):
+        """
+        Test case for `seed`. It checks that reseeding the module generator repeats the generated markets.
+        """
+        seed(7)
+        first = generate_odds(5)
+        seed(7)
+        self.assertEqual(generate_odds(5), first)
+
+    def test_market_dict_adapter(self):
+        """
+        Test case for the dictionary adapter. It checks that dictionaries and markets give the same Kelly result.
+        """
+        odds = {"A": 1.5, "B": 2.0, "C": 3.0}
+        probabilities = {"A": 0.70, "B": 0.50, "C": 0.33}
+        kelly, key, odd = kelly_criterion(odds, probabilities)
+        self.assertEqual(kelly_criterion(Market.from_dict(odds, probabilities)), (kelly, list(odds).index(key), odd))
+        self.assertEqual(Market.from_dict(odds, probabilities).probabilities_dict(), probabilities)
+
 if __name__ == "__main__":
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,105 @@
+import unittest
+import logging
+import numpy as np
+from engine import simulate, simulate_stats, iter_bets
+from stats import RunningStats
+
+logging.disable(logging.CRITICAL)
+
+
+def longest_run(losses):
+    longest = current = 0
+    for loss in losses:
+        current = current + 1 if loss else 0
+        longest = max(longest, current)
+    return longest
+
+
+class TestRunningStats(unittest.TestCase):
+
+    def setUp(self):
+        self.result = simulate(1000, 3, 0.5, 20000, 5, seed=21)
+        self.bankroll = self.result.bankroll_history
+        self.wins = self.result.results_history
+
+    def test_matches_history(self):
+        """
+        Test that the one-pass statistics equal the ones computed from the full history.
+        """
+        stats = RunningStats.from_history(self.bankroll, self.wins)
+        growth = np.diff(np.log(self.bankroll))
+        peaks = np.maximum.accumulate(self.bankroll)
+
+        self.assertEqual(stats.count, len(self.wins))
+        self.assertEqual(stats.wins, np.count_nonzero(self.wins))
+        self.assertEqual(stats.longest_losing_streak, longest_run(self.wins == 0))
+        self.assertAlmostEqual(stats.max_drawdown, np.max(1 - self.bankroll / peaks))
+        self.assertAlmostEqual(stats.log_growth_mean, growth.mean())
+        self.assertAlmostEqual(stats.log_growth_variance, growth.var(ddof=1))
+
+    def test_merge(self):
+        """
+        Test that chunks summarised separately and merged in order give the same statistics as one pass,
+        including chunks made only of losses and empty chunks.
+        """
+        whole = RunningStats.from_history(self.bankroll, self.wins)
+        cuts = [0, 1, 2, 5000, 5000, 12345, 12350, len(self.wins)]
+        parts = [
+            RunningStats().update(self.bankroll[start], self.bankroll[start + 1:end + 1], self.wins[start:end])
+            for start, end in zip(cuts, cuts[1:])
+        ]
+        merged = RunningStats()
+        for part in parts:
+            merged.merge(part)
+
+        for key, value in whole.as_dict().items():
+            self.assertAlmostEqual(merged.as_dict()[key], value, msg=key)
+
+        losses = RunningStats().update(100.0, [90.0, 80.0], [0, 0]).merge(RunningStats().update(80.0, [70.0, 75.0], [0, 1]))
+        self.assertEqual((losses.leading_losses, losses.longest_losing_streak, losses.trailing_losses), (3, 3, 0))
+        self.assertAlmostEqual(losses.max_drawdown, 0.3)
+
+    def test_streaming_api(self):
+        """
+        Test that `simulate_stats` and `iter_bets` stream the same simulation as `simulate`.
+        """
+        stats = simulate_stats(1000, 3, 0.5, 20000, 5, seed=21)
+        for key, value in RunningStats.from_history(self.bankroll, self.wins).as_dict().items():
+            self.assertAlmostEqual(stats.as_dict()[key], value, msg=key)
+
+        records = list(iter_bets(1000, 3, 0.5, 20000, 5, seed=21))
+        self.assertEqual(len(records), len(self.wins))
+        np.testing.assert_allclose([record.bankroll for record in records], self.bankroll[1:])
+        np.testing.assert_array_equal([record.won for record in records], self.wins.astype(bool))
+
+    def test_overflow(self):
+        """
+        Test that `simulate_stats` keeps exact statistics after the bankroll outgrows the range of a float.
+        """
+        stats = simulate_stats(1000, 3, 0.5, 200000, 30, seed=2)
+        self.assertTrue(np.isinf(simulate(1000, 3, 0.5, 200000, 30, seed=2).bankroll_history[-1]))
+        self.assertGreater(stats.log_change, np.log(np.finfo(float).max))
+        self.assertAlmostEqual(stats.log_growth_mean * stats.count, stats.log_change)
+        self.assertTrue(np.isfinite(stats.log_growth_variance) and 0 < stats.max_drawdown < 1)
+
+    def test_ruin(self):
+        """
+        Test that a ruined path reports a maximum drawdown of 100%.
+        """
+        result = simulate(100, 3, 1.0, 300, 100, seed=3)
+        self.assertTrue(result.ruined)
+        self.assertEqual(simulate_stats(100, 3, 1.0, 300, 100, seed=3).max_drawdown, 1.0)
+
+    def test_ruin_at_block_end(self):
+        """
+        Test that a full Kelly bet lost as the last bet of a block ruins the run, as in `simulate`.
+        """
+        for seed in range(20):
+            result = simulate(1000, 3, 1.0, 500, 80, seed=seed, block_size=7)
+            stats = simulate_stats(1000, 3, 1.0, 500, 80, seed=seed, block_size=7)
+            self.assertEqual(stats.ruined, result.ruined, seed)
+            self.assertEqual(stats.count, len(result.results_history), seed)
+            self.assertFalse(np.isnan(stats.log_growth_mean), seed)
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
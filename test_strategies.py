@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from backtest import export_synthetic
+from engine import simulate_stats
+from profiling import Profiler
+from strategies import (
+    FixedPercentage, FlatStake, FractionalKelly, FullKelly, SimultaneousKelly, compare_strategies, flat_bankroll,
+    format_comparison, parse_strategy, recorded_markets, synthetic_markets
+)
+
+
+class TestStrategies(unittest.TestCase):
+
+    def test_same_results_as_engine(self):
+        """
+        Test that the Kelly strategies evaluated together give exactly the statistics of separate engine runs.
+        """
+        strategies = [FractionalKelly(0.5), FullKelly(), SimultaneousKelly()]
+        results = compare_strategies(strategies, 1000, synthetic_markets(3, 5000, 5, seed=1, block_size=1000))
+
+        for result, (fraction, staking) in zip(results, [(0.5, "kelly"), (1.0, "kelly"), (1.0, "simultaneous")]):
+            expected = simulate_stats(1000, 3, fraction, 5000, 5, seed=1, block_size=1000, staking=staking)
+            self.assertEqual(result.stats.count, expected.count)
+            self.assertEqual(result.stats.ruined, expected.ruined)
+            self.assertAlmostEqual(result.stats.log_change, expected.log_change)
+
+    def test_markets_drawn_once(self):
+        """
+        Test that the markets are generated once per block whatever the number of strategies.
+        """
+        profiler = Profiler()
+        strategies = [FractionalKelly(0.25), FractionalKelly(0.5), FixedPercentage(2), FlatStake(10)]
+        compare_strategies(strategies, 1000, synthetic_markets(3, 3000, 5, seed=2, block_size=1000, profiler=profiler),
+                           profiler)
+        report = profiler.report()
+        self.assertEqual(report["stages"]["odds"]["calls"], 3)
+        self.assertEqual(report["stages"]["Flat $10"]["calls"], 3)
+        self.assertEqual(report["counters"]["markets"], 3000)
+
+    def test_fixed_percentage(self):
+        """
+        Test that a fixed percentage bets the same fraction of the bankroll on every value bet, and
+        skips the market without one.
+        """
+        odds = np.asfortranarray([[1.9, 2.1], [3.0, 1.4], [2.5, 1.6]])
+        probabilities = np.asfortranarray([[0.6, 0.4], [0.3, 0.7], [0.45, 0.55]])
+        result, = compare_strategies([FixedPercentage(10)], 100, [(odds, probabilities, np.array([0, 0, 1]))])
+        self.assertAlmostEqual(result.final_bankroll, 100 * (1 + 0.1 * 0.9) * 0.9)
+
+    def test_flat_bankroll(self):
+        """
+        Test the flat stake bankroll against a bet by bet loop, including the all-in bets and the ruin.
+        """
+        rng = np.random.default_rng(3)
+        odds = rng.uniform(1.5, 3.0, 500)
+        wins = rng.random(500) < 0.4
+        history, ruined = flat_bankroll(100, 10, odds, wins)
+
+        bankroll, expected = 100.0, []
+        for odd, won in zip(odds, wins):
+            stake = min(10, bankroll)
+            bankroll = bankroll + stake * (odd - 1) if won else bankroll - stake
+            if bankroll <= 0:
+                break
+            expected.append(bankroll)
+        self.assertEqual(ruined, bankroll <= 0)
+        np.testing.assert_allclose(history, expected)
+
+    def test_flat_bankroll_all_in(self):
+        """
+        Test long runs of all-in bets below the stake, with the bankroll going back and forth across it.
+        """
+        rng = np.random.default_rng(2)
+        for odds, wins in ((np.full(20000, 1.00001), np.ones(20000, bool)),
+                           (rng.uniform(1.02, 1.1, 5000), rng.random(5000) < 0.97)):
+            history, ruined = flat_bankroll(5, 10, odds, wins)
+            bankroll, expected = 5.0, []
+            for odd, won in zip(odds, wins):
+                stake = min(10, bankroll)
+                bankroll = bankroll + stake * (odd - 1) if won else bankroll - stake
+                if bankroll <= 0:
+                    break
+                expected.append(bankroll)
+            self.assertEqual(ruined, bankroll <= 0)
+            self.assertGreater(len(history), 1000)
+            np.testing.assert_allclose(history, expected)
+
+    def test_recorded_markets(self):
+        """
+        Test that strategies compared on exported markets give the results of the synthetic markets.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "markets.npy")
+            export_synthetic(path, 3, 2000, 5, seed=4, block_size=1000)
+            recorded = compare_strategies([FlatStake(20)], 1000, recorded_markets(path))
+        synthetic = compare_strategies([FlatStake(20)], 1000, synthetic_markets(3, 2000, 5, seed=4, block_size=1000))
+        self.assertAlmostEqual(recorded[0].log_bankroll, synthetic[0].log_bankroll)
+        self.assertIn("Flat $20", format_comparison(recorded, 1000))
+
+    def test_parse_strategy(self):
+        """
+        Test the command line descriptions of the strategies.
+        """
+        self.assertEqual(parse_strategy("kelly:25").fraction, 0.25)
+        self.assertEqual(parse_strategy("flat:5").stake, 5)
+        self.assertEqual(parse_strategy("full-kelly").name, "Full Kelly")
+        for text in ("martingale", "flat:0", "flat:-5", "kelly:0", "kelly:150", "simultaneous:-10",
+                     "percentage:0", "percentage:101", "percentage:nan"):
+            with self.assertRaises(ValueError, msg=text):
+                parse_strategy(text)
+
+
+if __name__ == "__main__":
+    unittest.main()
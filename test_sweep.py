@@ -0,0 +1,103 @@
+import contextlib
+import csv
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+from sweep import COLUMNS, main, parse_range, sweep_grid, run_sweep, read_results
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_parse_range(self):
+        """
+        Test that ranges can be given as inclusive start:stop:step triples or as comma separated lists.
+        """
+        self.assertEqual(parse_range("0.1:0.5:0.1"), [0.1, 0.2, 0.3, 0.4, 0.5])
+        self.assertEqual(parse_range("3,5,10", int), [3, 5, 10])
+        with self.assertRaises(ValueError):
+            parse_range("1:10:0")
+
+    def test_sweep_grid(self):
+        """
+        Test that every cell of the grid gets its own independent random stream.
+        """
+        cells = sweep_grid([0.25, 0.5], [5, 10], [3], seed=1)
+        self.assertEqual(len(cells), 4)
+        draws = [np.random.default_rng(cell["seed"]).random() for cell in cells]
+        self.assertEqual(len(set(draws)), 4)
+
+    def test_run_sweep(self):
+        """
+        Test that a sweep writes one row per cell, and that running it again reuses the completed rows.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "sweep.csv")
+            npz_output = os.path.join(directory, "sweep.npz")
+            rows = run_sweep([0.5, 1.0], [5], [3, 4], 1000, 50, 20, output, seed=2, max_workers=2, npz_output=npz_output)
+            self.assertEqual([row["cell"] for row in rows], [0, 1, 2, 3])
+            self.assertEqual(len(read_results(output)), 4)
+            self.assertEqual(len(np.load(npz_output)["ruin_probability"]), 4)
+
+            again = run_sweep([0.5, 1.0], [5], [3, 4], 1000, 50, 20, output, seed=2, max_workers=2)
+            self.assertEqual(again, rows)
+
+    def test_resume(self):
+        """
+        Test that a sweep resumes after a partly written row, and refuses the table of other parameters.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "sweep.csv")
+            rows = run_sweep([0.5, 1.0], [5], [3], 1000, 50, 20, output, seed=2, max_workers=1)
+            with open(output) as file:
+                lines = file.readlines()
+            # Interrupted while writing the second row
+            with open(output, "w") as file:
+                file.writelines(lines[:2] + [lines[2][:10]])
+            self.assertEqual(len(read_results(output)), 1)
+
+            again = run_sweep([0.5, 1.0], [5], [3], 1000, 50, 20, output, seed=2, max_workers=1)
+            self.assertEqual(again, rows)
+            self.assertEqual(read_results(output), rows)
+
+            for changed in ({"seed": 3}, {"number_of_paths": 30}, {"kelly_fractions": [0.5]}):
+                parameters = dict(kelly_fractions=[0.5, 1.0], inflated_probabilities=[5], variants=[3],
+                                  bankroll=1000, number_of_bets=50, number_of_paths=20, output=output, seed=2)
+                parameters.update(changed)
+                with self.assertRaises(ValueError):
+                    run_sweep(**parameters, max_workers=1)
+
+    def test_old_table(self):
+        """
+        Test that a table written without the number_of_paths column is resumed with the fixed path count.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "sweep.csv")
+            rows = run_sweep([0.5, 1.0], [5], [3], 1000, 50, 20, output, seed=2, max_workers=1)
+            os.remove(output + ".json")
+            with open(output, "w", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=COLUMNS[:-1], extrasaction="ignore")
+                writer.writeheader()
+                writer.writerow(rows[0])
+            self.assertEqual(read_results(output, 20), rows[:1])
+
+            again = run_sweep([0.5, 1.0], [5], [3], 1000, 50, 20, output, seed=2, max_workers=1)
+            self.assertEqual(again, rows)
+            self.assertEqual(read_results(output), rows)
+
+    def test_main_arguments(self):
+        """
+        Test that invalid arguments are rejected before any cell is submitted.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "sweep.csv")
+            for arguments in (["--paths", "0"], ["--bets", "-1"], ["--bankroll", "0"], ["--kelly", "5,50"],
+                              ["--kelly", "50:150:50"], ["--inflated", "0"], ["--variants", "0"],
+                              ["--adaptive", "--paths", "10"]):
+                with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                    main(arguments + ["--output", output, "--no-cache"])
+                self.assertFalse(os.path.exists(output))
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)